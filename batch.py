@@ -0,0 +1,236 @@
+"""
+    Traitement par lots d'images de neurones, sans interface graphique.
+    Chaque image passe par la chaine de pipeline.py dans un processus du pool, le graphe
+    est exporté en csv et le résultat est consigné dans un manifeste (une ligne json par image)
+    qui permet de reprendre un lot interrompu là où il s'est arrêté.
+
+    Exemple :
+        python batch.py images/ "slides/*.tif" --threshold 20 --processes 8
+        python batch.py slides/ --threshold 20 --tile 1024 --soma-radius 150
+        python batch.py piles/ --threshold 20 --all-pages
+        python batch.py images/ --threshold 20 --swc --dataset outputs/dataset
+        python batch.py champs/ --threshold 20 --neurons
+        python batch.py lames/ --threshold 20 --um-per-pixel 0.325 --soma-radius 6
+"""
+import argparse, glob, json, os, time
+from multiprocessing import Pool
+
+import export
+import instrumentation
+import neurons
+import pipeline
+import tiles
+from scale import Echelle
+from soma import NoyauNonDetecte
+
+EXTENSIONS = (".jpeg", ".jpg", ".png", ".tif", ".tiff", ".bmp")
+
+def lister_images(entrees):
+    """
+        Retourne la liste triée des images désignées par des dossiers, des motifs glob
+        ou des chemins de fichiers
+    """
+    chemins = set()
+    for entree in entrees:
+        if os.path.isdir(entree):
+            for nom in os.listdir(entree):
+                if nom.lower().endswith(EXTENSIONS):
+                    chemins.add(os.path.join(entree, nom))
+        else:
+            chemins.update(c for c in glob.glob(entree) if os.path.isfile(c))
+    return sorted(chemins)
+
+def lire_manifeste(chemin):
+    """
+        Retourne le dictionnaire {(image, page): derniere entrée} du manifeste, vide s'il n'existe pas.
+        Une ligne tronquée par un arrêt brutal est ignorée.
+    """
+    entrees = {}
+    if not os.path.exists(chemin):
+        return entrees
+    with open(chemin) as f:
+        for ligne in f:
+            try:
+                entree = json.loads(ligne)
+            except json.JSONDecodeError:
+                continue
+            entrees[entree["image"], entree.get("page", 0)] = entree
+    return entrees
+
+def a_refaire(entree, threshold):
+    """
+        Une image est à (re)traiter si elle n'a jamais été traitée avec ce seuil ou si son
+        traitement s'est terminé sur une erreur inattendue
+    """
+    return entree is None or entree["threshold"] != threshold or entree["statut"] == "erreur"
+
+def traiter(tache):
+    """
+        Traite une image dans un processus du pool et retourne l'entrée du manifeste
+    """
+    chemin, page, threshold, dossier, options = tache
+    debut = time.time()
+    entree = {"image": chemin, "page": page, "threshold": threshold}
+    nom = os.path.basename(chemin)
+    if page:
+        nom = os.path.splitext(nom)[0] + "-p" + str(page)
+    options = dict(options, page=page)
+    profil = options.pop("profil", False)
+    swc = options.pop("swc", False)
+    dataset = options.pop("dataset", False)
+    plusieurs = options.pop("neurones", False)
+    if profil:
+        instrumentation.activer()
+    try:
+        if plusieurs:
+            # Un fichier csv (et swc) par neurone, les neurones de l'image sont traités à la
+            # suite dans ce processus. Les branches de chaque neurone sont ajoutées au jeu de
+            # données comme une image "<chemin>#n<k>"
+            skeletons = neurons.traiter_image_neurones(chemin, threshold, processes=1, **options)
+            fichiers = neurons.enregistrer(skeletons, nom, dossier, swc)
+            entree["csv"] = [f for f in fichiers if f.endswith(".csv")]
+            if swc:
+                entree["swc"] = [f for f in fichiers if f.endswith(".swc")]
+            if dataset:
+                entree["colonnes"] = [export.colonnes(s, "%s#n%d" % (chemin, k), page) for k, s in enumerate(skeletons)]
+            entree["neurones"] = len(skeletons)
+            entree["branches"] = sum(len(s.branches) for s in skeletons)
+        else:
+            if "tuile" in options:
+                # Chaque image est déjà traitée dans un processus du pool : ses tuiles le sont
+                # à la suite dans ce processus
+                skeleton = tiles.traiter_image_tuiles(chemin, threshold, processes=1, **options)
+            else:
+                skeleton = pipeline.traiter_image(chemin, threshold, **options)
+            entree["csv"] = skeleton.save_as_csv(nom, dossier)
+            if swc:
+                entree["swc"] = skeleton.save_as_swc(nom, dossier)
+            if dataset:
+                # Colonnes des branches, ajoutées au jeu de données par le processus principal
+                entree["colonnes"] = export.colonnes(skeleton, chemin, page)
+            entree["branches"] = len(skeleton.branches)
+        entree["statut"] = "ok"
+    except NoyauNonDetecte:
+        entree["statut"] = "echec"
+        entree["message"] = "Seuil trop élevé: le noyau n'a pas été détecté"
+    except Exception as e:
+        entree["statut"] = "erreur"
+        entree["message"] = repr(e)
+    entree["duree"] = round(time.time() - debut, 3)
+    if profil:
+        instrumentation.desactiver()
+        entree["profil"] = instrumentation.rapport()
+    return entree
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement par lots d'images de neurones")
+    parser.add_argument("inputs", nargs="+", help="dossiers, motifs glob ou fichiers images")
+    parser.add_argument("--threshold", type=float, required=True, help="seuil de binarisation")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="nombre de processus")
+    parser.add_argument("--output", default="outputs", help="dossier des fichiers csv")
+    parser.add_argument("--manifest", default=None,
+                        help="manifeste de reprise (par défaut <output>/manifest.jsonl)")
+    parser.add_argument("--size", type=int, nargs=2, default=(500, 500), metavar=("W", "H"),
+                        help="taille de redimensionnement des images")
+    parser.add_argument("--kernel-size", type=int, default=11, help="taille impaire du flou gaussien")
+    parser.add_argument("--segmentation", choices=["walk", "index"], default="walk",
+                        help="méthode de segmentation des branches")
+    parser.add_argument("--thickness", choices=["rays", "distance"], default="rays",
+                        help="mode de mesure de l'épaisseur des branches")
+    parser.add_argument("--tile", type=int, default=None,
+                        help="traite les images à leur résolution d'origine, par tuiles de ce côté (voir tiles.py)")
+    parser.add_argument("--overlap", type=int, default=64, help="recouvrement des tuiles en pixels")
+    parser.add_argument("--soma-radius", type=float, default=18,
+                        help="rayon du noyau en pixels de l'image d'origine, en mode --tile (en µm avec --um-per-pixel)")
+    parser.add_argument("--um-per-pixel", type=float, default=None,
+                        help="taille des pixels en µm : les images sont traitées à leur résolution d'origine et "
+                             "les tailles de la chaine sont calculées pour cette résolution (voir scale.py)")
+    parser.add_argument("--all-pages", action="store_true",
+                        help="traite toutes les pages des fichiers TIFF multi-pages (la première sinon)")
+    parser.add_argument("--profile", action="store_true",
+                        help="ajoute au manifeste la durée, la mémoire et les compteurs de chaque étape")
+    parser.add_argument("--swc", action="store_true", help="enregistre aussi chaque arbre au format SWC")
+    parser.add_argument("--neurons", action="store_true",
+                        help="analyse séparément chaque neurone de l'image, un csv par neurone (voir neurons.py)")
+    parser.add_argument("--dataset", default=None,
+                        help="dossier du jeu de données en colonnes auquel ajouter les branches (voir export.py)")
+    parser.add_argument("--dataset-images", type=int, default=100,
+                        help="écrit le jeu de données au moins toutes les N images")
+    parser.add_argument("--dataset-delay", type=float, default=300,
+                        help="écrit le jeu de données quand sa première image attend depuis ce nombre de secondes")
+    args = parser.parse_args(argv)
+    if args.neurons and args.tile:
+        parser.error("--neurons ne s'utilise pas avec --tile")
+
+    manifeste = args.manifest or os.path.join(args.output, "manifest.jsonl")
+    os.makedirs(os.path.dirname(manifeste) or ".", exist_ok=True)
+    deja_faites = lire_manifeste(manifeste)
+
+    # Paramètres de pipeline.traiter_image() (ou de tiles.traiter_image_tuiles()) communs à toutes les images
+    options = {"kernel_size": args.kernel_size, "segmentation": args.segmentation, "thickness": args.thickness}
+    if args.profile:
+        options["profil"] = True
+    if args.swc:
+        options["swc"] = True
+    if args.dataset:
+        options["dataset"] = True
+    if args.neurons:
+        options["neurones"] = True
+    if args.um_per_pixel:
+        echelle = Echelle(args.um_per_pixel, rayon_soma=args.soma_radius)
+        options.update(echelle.options())
+        if args.tile:
+            del options["taille"]
+            options.update(tuile=args.tile, recouvrement=args.overlap)
+    elif args.tile:
+        options.update(tuile=args.tile, recouvrement=args.overlap, rayon=args.soma_radius)
+    else:
+        options["taille"] = tuple(args.size)
+    images = [
+        (chemin, page) for chemin in lister_images(args.inputs)
+        for page in range(pipeline.nombre_pages(chemin) if args.all_pages else 1)
+    ]
+    taches = [
+        (chemin, page, args.threshold, args.output, options)
+        for chemin, page in images if a_refaire(deja_faites.get((chemin, page)), args.threshold)
+    ]
+    print(len(images), "images,", len(images) - len(taches), "déjà traitées,", len(taches), "à traiter")
+
+    # Chaque résultat est ajouté au manifeste dès qu'il arrive, pour qu'un arrêt brutal
+    # ne fasse perdre que les images en cours de traitement. Avec un jeu de données, les
+    # entrées des images qui ont des branches attendent qu'elles aient été écrites dans le jeu
+    # de données, au plus --dataset-images images ou --dataset-delay secondes
+    donnees = None
+    if args.dataset:
+        donnees = export.Dataset(args.dataset, images=args.dataset_images, delai=args.dataset_delay)
+    en_attente = []
+
+    def consigner(f, entrees):
+        for e in entrees:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    with Pool(args.processes) as pool, open(manifeste, "a") as f:
+        for k, entree in enumerate(pool.imap_unordered(traiter, taches), 1):
+            print("[%d/%d]" % (k, len(taches)), entree["image"], "page", entree["page"], entree["statut"])
+            colonnes = entree.pop("colonnes", None)
+            # Une liste de colonnes par neurone avec --neurons
+            if isinstance(colonnes, dict):
+                colonnes = [colonnes]
+            if donnees is None or not colonnes:
+                consigner(f, [entree])
+                continue
+            en_attente.append(entree)
+            for c in colonnes:
+                donnees.ajouter(c)
+            # Avec --neurons, une écriture peut laisser en attente les neurones suivants de l'image
+            if not donnees.en_attente:
+                consigner(f, en_attente)
+                en_attente = []
+        if en_attente:
+            donnees.ecrire()
+            consigner(f, en_attente)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+    Mesure des performances de la chaine de traitement sur des neurones synthétiques
+    (voir synthetic.py) de taille et de nombre de branches croissants.
+    Pour chaque configuration, l'image est traitée "repeat" fois et chaque étape garde sa
+    durée la plus courte (voir instrumentation.py). Les branches mesurées sont comparées à la
+    vérité terrain (écarts des longueurs et des épaisseurs), et, si un fichier de référence
+    produit par une version précédente est donné, aux mesures de cette version : une
+    optimisation doit donner exactement les mêmes branches, le code de sortie vaut 1 sinon.
+
+    Exemple :
+        python benchmark.py --sizes 500 1000 2000 --branches 4 8 16 --output reference.json
+        python benchmark.py --sizes 500 1000 2000 --branches 4 8 16 --reference reference.json
+        python benchmark.py --imports
+"""
+import argparse, json, os, subprocess, sys, time
+
+import numpy as np
+
+import instrumentation
+import pipeline
+from synthetic import generer_neurone, comparer
+
+# Etapes affichées dans la table (toutes les étapes sont enregistrées dans le fichier json)
+ETAPES = ["thinning", "find_noyau", "Skeleton.__init__", "get_branching_points", "segmentation",
+          "fitting", "thickness", "length", "to_graph", "get_main_branch"]
+
+# Modules du coeur de l'analyse, leur import ne doit charger ni l'interface ni les
+# bibliothèques d'affichage et de graphes (chargées à la demande) et tenir dans le budget
+MODULES_COEUR = ["pipeline", "skeleton", "branch", "lsq", "soma"]
+INTERDITS = ["gui", "tkinter", "PIL", "matplotlib", "networkx", "scipy"]
+BUDGET_IMPORT = 0.5
+
+def mesurer_imports(modules=MODULES_COEUR, budget=BUDGET_IMPORT, repeat=3):
+    """
+        Durée (en secondes, la plus courte de "repeat" interpréteurs neufs) de l'import des
+        modules, et modules interdits qu'il a chargés
+    """
+    code = ("import json, sys, time\n"
+            "debut = time.perf_counter()\n"
+            "import " + ", ".join(modules) + "\n"
+            "duree = time.perf_counter() - debut\n"
+            "print(json.dumps([duree, [m for m in %r if m in sys.modules]]))" % (INTERDITS,))
+    dossier = os.path.dirname(os.path.abspath(__file__))
+    durees = []
+    for _ in range(repeat):
+        sortie = subprocess.run([sys.executable, "-c", code], cwd=dossier, capture_output=True, text=True, check=True)
+        duree, charges = json.loads(sortie.stdout)
+        durees.append(duree)
+    duree = min(durees)
+    return {"modules": modules, "duree": round(duree, 4), "budget": budget, "charges": charges,
+            "ok": duree <= budget and not charges}
+
+def mesures(skeleton):
+    """
+        Les branches du squelette [x0, y0, x1, y1, longueur, épaisseur] (extrémités dans
+        l'ordre, le sens de parcours d'une branche peut changer), triées, et la longueur de la
+        branche principale : ce qu'une optimisation ne doit pas changer
+    """
+    branches = sorted([int(v) for v in min(b.start, b.end) + max(b.start, b.end)]
+                      + [float(b.length), float(b.thickness)] for b in skeleton.branches)
+    principale = float(skeleton.main_paths[0][0]) if skeleton.main_paths else 0.0
+    return {"branches": branches, "principale": principale}
+
+def executer(image, verite, segmentation="walk", thickness="rays"):
+    """
+        Chaine complète sur une image synthétique, à sa taille d'origine
+    """
+    h, w = image.shape
+    binaire = pipeline.binariser(pipeline.pretraitement(image, (w, h)), verite.seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, segmentation, rayon=verite.rayon_ouverture)
+    pipeline.mesurer(skeleton, binaire, point_adja, thickness=thickness)
+    return skeleton
+
+def mesurer_configuration(taille, branches, graine=0, repeat=3, segmentation="walk", thickness="rays"):
+    """
+        Génère le neurone de la configuration, le traite "repeat" fois et retourne son
+        résultat : durées minimales des étapes, compteurs, écarts à la vérité terrain et
+        mesures des branches
+    """
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    durees, total = {}, float("inf")
+    for _ in range(repeat):
+        instrumentation.activer(memoire=False)
+        debut = time.perf_counter()
+        skeleton = executer(image, verite, segmentation, thickness)
+        total = min(total, time.perf_counter() - debut)
+        instrumentation.desactiver()
+        rapport = instrumentation.rapport()
+        for nom, mesure in rapport["etapes"].items():
+            durees[nom] = min(durees.get(nom, float("inf")), mesure["duree"])
+
+    return {"taille": taille, "branches": branches, "graine": graine,
+            "verite": verite.resume(), "durees": durees, "total": round(total, 6),
+            "compteurs": rapport["compteurs"], "erreurs": comparer(skeleton, verite),
+            "mesures": mesures(skeleton)}
+
+def identiques(a, b, tolerance=1e-6):
+    """
+        True si les mesures a et b (voir mesures()) sont les mêmes à "tolerance" près
+    """
+    if len(a["branches"]) != len(b["branches"]):
+        return False
+    if a["branches"] and not np.allclose(a["branches"], b["branches"], rtol=0, atol=tolerance):
+        return False
+    return abs(a["principale"] - b["principale"]) <= tolerance
+
+def afficher(resultats, reference=None):
+    """
+        Affiche une ligne par configuration : durées des étapes en millisecondes, écarts à la
+        vérité terrain et, avec une référence, accélération et statut des mesures
+    """
+    colonnes = ["taille", "branches", "pixels"] + ETAPES + ["total", "err_long", "err_ep"]
+    if reference is not None:
+        colonnes += ["x_ref", "mesures"]
+    lignes = [colonnes]
+    for r in resultats:
+        ligne = [r["taille"], r["branches"], r["compteurs"].get("skeleton_pixels", 0)]
+        ligne += ["%.1f" % (1000 * r["durees"].get(e, 0.0)) for e in ETAPES]
+        ligne += ["%.1f" % (1000 * r["total"]), r["erreurs"].get("erreur_longueur", ""),
+                  r["erreurs"].get("erreur_epaisseur", "")]
+        if reference is not None:
+            ref = reference.get((r["taille"], r["branches"], r["graine"]))
+            if ref is None:
+                ligne += ["", "absente"]
+            else:
+                ligne += ["%.2f" % (ref["total"] / r["total"]),
+                          "identiques" if identiques(r["mesures"], ref["mesures"]) else "DIFFERENTES"]
+        lignes.append([str(v) for v in ligne])
+    largeurs = [max(len(l[k]) for l in lignes) for k in range(len(colonnes))]
+    for l in lignes:
+        print("  ".join(v.rjust(n) for v, n in zip(l, largeurs)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure des performances sur des neurones synthétiques")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000], help="côtés des images")
+    parser.add_argument("--branches", type=int, nargs="+", default=[4, 8, 16],
+                        help="nombres de prolongements partant du noyau")
+    parser.add_argument("--seed", type=int, default=0, help="graine des images")
+    parser.add_argument("--repeat", type=int, default=3, help="nombre d'exécutions par configuration")
+    parser.add_argument("--segmentation", choices=["walk", "index"], default="walk",
+                        help="méthode de segmentation des branches")
+    parser.add_argument("--thickness", choices=["rays", "distance"], default="rays",
+                        help="mode de mesure de l'épaisseur des branches")
+    parser.add_argument("--output", default=None, help="fichier json des résultats")
+    parser.add_argument("--reference", default=None,
+                        help="fichier json d'une exécution précédente, dont les mesures doivent être identiques")
+    parser.add_argument("--imports", action="store_true",
+                        help="mesure seulement la durée d'import du coeur de l'analyse (budget %g s)" % BUDGET_IMPORT)
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        imports = mesurer_imports()
+        print("import", ", ".join(imports["modules"]), ": %.3f s (budget %g s)" % (imports["duree"], imports["budget"]))
+        if imports["charges"]:
+            print("modules chargés à tort :", ", ".join(imports["charges"]))
+        return 0 if imports["ok"] else 1
+
+    # Une exécution non mesurée charge les modules importés à la demande (scipy...)
+    image, verite = generer_neurone((500, 500), 4, graine=args.seed)
+    executer(image, verite, args.segmentation, args.thickness)
+
+    resultats = []
+    for taille in args.sizes:
+        for branches in args.branches:
+            resultats.append(mesurer_configuration(taille, branches, args.seed, args.repeat,
+                                                   args.segmentation, args.thickness))
+
+    reference = None
+    if args.reference:
+        with open(args.reference) as f:
+            reference = {(r["taille"], r["branches"], r["graine"]): r for r in json.load(f)["resultats"]}
+    afficher(resultats, reference)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"options": vars(args), "resultats": resultats}, f, indent=1)
+
+    if reference is not None:
+        communes = [r for r in resultats if (r["taille"], r["branches"], r["graine"]) in reference]
+        if any(not identiques(r["mesures"], reference[r["taille"], r["branches"], r["graine"]]["mesures"])
+               for r in communes):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,104 @@
+import logging
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
 
-import lsq, gui
+import lsq
 
-#interpole des points par un segment parametrique represente par (line_x,line_y)
-def parametric_linear_interpolation(points):
-    x=points[0:-2:2]
-    y=points[1:-1:2]
+logger = logging.getLogger(__name__)
 
-    m, b = np.polyfit(x, y, 1)
+#interpole des points (N,2) par un segment parametrique represente par (line_x,line_y)
+def parametric_linear_interpolation(points):
+    t = np.linspace(0, 1, len(points))
 
-    # Generate x values to plot the line
-    line_x = np.linspace(x[0], x[-1], 100)
+    # Generate t values to plot the line
+    line_t = np.linspace(0, 1, 100)
 
-    # Calculate the corresponding y values on the line
-    line_y = m * line_x + b
+    # Calculate the corresponding x and y values on the line
+    line_x = np.polyval(np.polyfit(t, points[:, 0], 1), line_t)
+    line_y = np.polyval(np.polyfit(t, points[:, 1], 1), line_t)
 
     return line_x,line_y
 
+def segments_pixels(starts, ends):
+    """
+        Pixels des segments [starts[k], ends[k]] tracés en 8-connexité, les mêmes que ceux de
+        cv2.line(..., thickness=1), calculés directement pour tous les segments à la fois sans
+        dessiner dans une image.
+        starts, ends: np.array (K, 2) de points (x,y) entiers
+        Returns :
+            liste de K np.array (N_k, 2) d'entiers, ordonnés du départ à l'arrivée
+    """
+    starts = np.asarray(starts, dtype=np.int64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+    if len(starts) == 0:
+        return []
+
+    # Comme cv2.line on parcourt chaque segment dans le sens des x croissants
+    swap = starts[:, 0] > ends[:, 0]
+    a = np.where(swap[:, None], ends, starts)
+    d = np.where(swap[:, None], starts, ends) - a
+
+    # Un pixel par pas sur l'axe principal : N_k = max(|dx|, |dy|) + 1
+    n = np.abs(d).max(axis=1) + 1
+    offsets = np.concatenate(([0], np.cumsum(n)[:-1]))
+    seg = np.repeat(np.arange(len(n)), n)
+    k = np.arange(n.sum()) - offsets[seg]
+    k = np.where(swap[seg], n[seg] - 1 - k, k)
+
+    # Position k*d/(N-1) arrondie à l'entier le plus proche, les demis vers 0 (calcul entier exact)
+    den = np.maximum(n - 1, 1)[seg][:, None]
+    pts = a[seg] + np.sign(d[seg]) * ((np.abs(2 * k[:, None] * d[seg]) + den - 1) // (2 * den))
+    return np.split(pts.astype(np.int32), offsets[1:])
+
+def in_image(image, p):
+    """
+        Retourne True ssi le point p = (x,y), arrondi au pixel, est dans l'image
+    """
+    return 0 <= round(p[1]) < image.shape[0] and 0 <= round(p[0]) < image.shape[1]
+
+def trimmed_mean(measurements):
+    """
+        Moyenne des mesures d'épaisseur après avoir retiré celles qui s'écartent de la moyenne
+        d'au moins un écart type. Retourne None s'il ne reste aucune mesure.
+    """
+    moyenne = np.around(np.mean(np.array(measurements)), decimals=2)
+    ecart_type = np.std(np.array(measurements))
+    seuil =  ecart_type
+    nouvelle_liste = []
+    if seuil != 0:
+        for point in measurements:
+            if abs(point - moyenne) < seuil:
+                nouvelle_liste.append(point)
+    if len(nouvelle_liste) != 0:
+        # Calcul de la moyenne de la nouvelle liste
+        return np.around(np.mean(nouvelle_liste), decimals=2)
+    return None
+
+def distance_map(image):
+    """
+        Carte des distances (euclidiennes) de chaque pixel blanc de l'image binaire au pixel
+        noir le plus proche, à calculer une seule fois par image pour mesurer les épaisseurs
+    """
+    return cv2.distanceTransform((image == 255).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+def sample_distance_map(dist, pts, bilinear=False):
+    """
+        Lit la carte des distances aux points pts (np.array (..., 2) de coordonnées (x,y)),
+        au pixel le plus proche ou par interpolation bilinéaire. Les points hors de l'image
+        sont ramenés sur son bord.
+    """
+    h, w = dist.shape
+    x = np.clip(pts[..., 0], 0, w - 1)
+    y = np.clip(pts[..., 1], 0, h - 1)
+    if not bilinear:
+        return dist[np.rint(y).astype(np.intp), np.rint(x).astype(np.intp)]
+    x0 = np.minimum(np.floor(x).astype(np.intp), w - 2) if w > 1 else np.zeros_like(x, dtype=np.intp)
+    y0 = np.minimum(np.floor(y).astype(np.intp), h - 2) if h > 1 else np.zeros_like(y, dtype=np.intp)
+    x1, y1 = np.minimum(x0 + 1, w - 1), np.minimum(y0 + 1, h - 1)
+    fx, fy = x - x0, y - y0
+    return ((dist[y0, x0] * (1 - fx) + dist[y0, x1] * fx) * (1 - fy)
+            + (dist[y1, x0] * (1 - fx) + dist[y1, x1] * fx) * fy)
+
 class Branch:
     """
         Classe pour représenter une branche de maniere abstraite et travailler dessus avec
@@ -30,7 +110,7 @@ class Branch:
             Constructeur de la classe Branch
             points: liste des points (i,j) de la branche
             nb_points: nombre de points de la branche
-            branching_points: liste des points (i,j) de ramification du squelette
+            branching_points: ensemble des points (i,j) de ramification du squelette (Skeleton.branching_set)
             start: premier point de la branche
             end: dernier point de la branche
             lsqcfx et lsqcfy: coefficients des polynomes d'approximation aux moindres
@@ -49,7 +129,7 @@ class Branch:
         self.length = 0
 
         self.centre = -1
-        self.line = np.array([])
+        self.line = np.zeros((0, 2), dtype=np.int32)
 
     def is_branching_out(self):
         """
@@ -58,67 +138,34 @@ class Branch:
         """
         return self.end in self.branching_points
 
-    def relier_centre(self,adjacent,centre,image):
+    def relier_centre(self, adjacent, centre):
         """
-            Retourne True ssi le premier point de la branche est le centre
+            Si le premier point de la branche est un point adjacent au noyau, enregistre dans
+            self.line les pixels (N,2) du segment qui le relie au centre
+            (voir Skeleton.relier_centre() pour toutes les branches à la fois)
         """
         #si le premier point appartient au point adjacent
         if self.start in adjacent : 
-
-            start_point = self.start
-            end_point = centre
-            # Trace un segment entre le centre et le point de depart
-            path_img = np.zeros_like(image)
-            line=cv2.line(path_img, start_point, end_point, 255, 1)
-
-            #On recupere les coordonnées des points de la ligne
-            for i in range(0,len(line)):
-                for j in range(0,len(line[i])):
-                    if line[i][j]==255 :
-                        self.line=np.append(self.line,np.array([j,i])) 
+            self.line = segments_pixels([self.start], [centre])[0]
             self.centre=1 #cette branche est reliée au centre
 
-    def least_square_approximation(self):
+    def least_square_approximation(self, degree=8):
         """
             Calcule une fonction d'approximation des points de la branche 
             avec une méthode des moindres carrés
         """
-        # Recuperer la liste des coordonnées x et y des points de la branche
-        N = self.nb_points
-        xi = np.array(self.points)[:, 0]
-        yi = np.array(self.points)[:, 1]
-
-        # Definir les contraintes: la spline doit passer par le premier
-        # et le dernier point de la branche
-        #middle = int(np.floor(N/2))
-        xic = [self.start[0],  self.end[0]]
-        yic = [self.start[1],  self.end[1]]
-        kc = [0, N-1]
-
-        # A FAIRE: Rajouter des points de contraintes (ex: tous les 20 points)
-        # pour avoir une courbe la plus lisse possible
-
-        # Paramétrisation chordale
-        tc = np.zeros(N)
-        for i in range(1,N):
-            di = np.sqrt((xi[i] - xi[i-1])**2 + (yi[i] - yi[i-1])**2)
-            tc[i] = tc[i-1] + di
-        tc = tc / tc[N-1]
-
-        # Discrétisation de [0,1] pour afficher la courbe
-        t = np.linspace(0, 1, 500)
-
-        # On détermine les parametres associés aux points (xic, yic) à interpoler
-        tcc = []
-        for i in kc:
-            tcc.append(tc[i])
-
-        # Degré de la spline
-        degree = 8
-
-        # Calculer les coefficients de l'approximation en x et en y
-        self.lsqcfx = lsq.LeastSquaresConstraintsMonomes(tc, xi, tcc, xic, degree, t)
-        self.lsqcfy = lsq.LeastSquaresConstraintsMonomes(tc, yi, tcc, yic, degree, t)
+        # Approximations en x et en y de degré "degree" qui passent par le premier
+        # et le dernier point de la branche, paramétrisation chordale
+        # (voir Skeleton.least_square_approximation() pour toutes les branches à la fois)
+        cf = lsq.LeastSquaresConstraintsBatch([self.points], degree)[0]
+        self.lsqcfx, self.lsqcfy = cf[:, 0:1], cf[:, 1:2]
+
+    def coefficients(self):
+        """
+            Retourne les coefficients de x(t) et y(t) sans les multiplicateurs de Lagrange,
+            sous la forme d'un np.array (degree+1, 2). Doit être appelée après least_square_approximation().
+        """
+        return np.hstack((self.lsqcfx[:-2], self.lsqcfy[:-2]))
 
     def plot_approximation(self):
         """
@@ -126,33 +173,31 @@ class Branch:
             avec une discretisation de [0,1] et les coefficients de la fonction.
             Affiche la courbe. Doit être appelée après least_square_approximation().
         """
-        t = np.linspace(0, 1, 1000)
-        fonction=[[],[]]
+        import matplotlib.pyplot as plt
+        pt = lsq.evaluate_curves(self.coefficients()[None], 1000)[0]
 
         #si la branche est reliée au centre
         if self.centre==1 : 
             #on interpole la line par une fonction lineaire
             fonction=parametric_linear_interpolation(self.line)
+            pt = np.vstack((np.column_stack(fonction), pt))
 
-        ptx = lsq.compute_parametric_curve(self.lsqcfx, t)
-        ptx=np.concatenate((fonction[0],ptx))
-        pty = lsq.compute_parametric_curve(self.lsqcfy, t)
-        pty=np.concatenate((fonction[1],pty))
-        plt.plot(ptx, pty, color="blue")
+        plt.plot(pt[:, 0], pt[:, 1], color="blue")
         
-    def measure_average_thickness(self, image):
+    def measure_average_thickness(self, image, plot_trace=False):
         """
             Calcule l'épaisseur moyenne de la branche, en prenant en chaque point de
             l'approximation, pris à intervalle régulier, le nombre de pixels blancs que l'on
             compte sur la direction perpendiculaire de la tengente en ce point.
             Doit être appelée apres l'approximation aux moindres carrés.
-            Prend l'image binaire en entrée
+            Prend l'image binaire en entrée, plot_trace=True affiche la trace des mesures
         """
+        if plot_trace:
+            import matplotlib.pyplot as plt
+
         # On decoupe la courbe en n points
         n = 10
-        t = np.linspace(0, 1, n)
-        ptx = lsq.compute_parametric_curve(self.lsqcfx, t)
-        pty = lsq.compute_parametric_curve(self.lsqcfy, t)
+        ptx, pty = lsq.evaluate_curves(self.coefficients()[None], n)[0].T
 
         # On récupère la liste des points sous forme d'une liste de couples, 
         # et on retire le premier point qui est le point de ramification car les 
@@ -175,37 +220,37 @@ class Branch:
 
         # Pour chaque point sur la courbe
         for p in points:
-            if gui.plot_trace_thickness == True:
+            if plot_trace:
                 plt.scatter(p[0], p[1], color="red")
 
             # Calculer les tangeantes de l'approximation à intervalle régulier
             tangent = np.array([dxdt[point_indice], dydt[point_indice]])
             tangent = tangent / np.linalg.norm(tangent)
-            if gui.plot_trace_thickness == True:
+            if plot_trace:
                 plt.quiver(p[0], p[1], tangent[0], tangent[1], angles='xy', scale_units='xy', scale=1)
 
             # Pour chaque tangeante, calculer la direction perpendiculaire associée
             u = np.array([-tangent[1], tangent[0]])
             u = u / np.linalg.norm(u)
-            if gui.plot_trace_thickness == True:
+            if plot_trace:
                 plt.quiver(p[0], p[1], u[0], u[1], angles='xy', scale_units='xy', scale=1)
 
             # Compter les pixels blancs de l'image dans la direction de cette perpendiculaire
             # On compte dans le sens de u
             pk, k, measure = p, 0, 0
-            while image[round(pk[1])][round(pk[0])] == 255:
+            while in_image(image, pk) and image[round(pk[1])][round(pk[0])] == 255:
                 measure += 1
                 k += 1
-                if gui.plot_trace_thickness == True:
+                if plot_trace:
                     plt.scatter(pk[0], pk[1], s=1.5, color="red")
                 pk = p + k*u
 
             # Et on compte dans le sens de -u pour faire toute l'epaisseur
             pk, k = p, 0
-            while image[round(pk[1])][round(pk[0])] == 255:
+            while in_image(image, pk) and image[round(pk[1])][round(pk[0])] == 255:
                 measure += 1
                 k += 1
-                if gui.plot_trace_thickness == True:
+                if plot_trace:
                     plt.scatter(pk[0], pk[1], s=1.5, color="red")
                 pk = p - k*u
 
@@ -216,18 +261,10 @@ class Branch:
             point_indice += 1
         
         # Calculer la moyenne de tous les comptages => epaisseur moyenne de la branche
-        moyenne = np.around(np.mean(np.array(measurements)), decimals=2)
-        ecart_type = np.std(np.array(measurements))
-        seuil =  ecart_type
-        nouvelle_liste = []
-        if seuil != 0:
-            for point in measurements:
-                if abs(point - moyenne) < seuil:
-                    nouvelle_liste.append(point)
-        if len(nouvelle_liste) != 0:
-            # Calcul de la moyenne de la nouvelle liste
-            self.thickness = np.around(np.mean(nouvelle_liste), decimals=2)
-            print("Epaisseur:", self.thickness)
+        thickness = trimmed_mean(measurements)
+        if thickness is not None:
+            self.thickness = thickness
+            logger.debug("Epaisseur: %s", self.thickness)
 
     def measure_length(self):
         """
@@ -235,22 +272,15 @@ class Branch:
             l'approximation polynomiale de la branche.
         """
         # Calcul des points de la courbe sur [0,1]
-        t = np.linspace(0, 1, 300)
-
-        fonction=[[],[]]
+        pt = lsq.evaluate_curves(self.coefficients()[None], 300)[0]
 
         #si calcul de la longueur des branches depuis le centre, decommentez ci-dessous :
         #if self.centre==1 : 
-        #    fonction=parametric_linear_interpolation(self.line)
-
-        ptx = lsq.compute_parametric_curve(self.lsqcfx, t)
-        ptx=np.concatenate((fonction[0],ptx))
-        pty = lsq.compute_parametric_curve(self.lsqcfy, t)
-        pty=np.concatenate((fonction[1],pty))
+        #    pt = np.vstack((np.column_stack(parametric_linear_interpolation(self.line)), pt))
 
         # Dérivées de x(t) et y(t)
-        dxdt, dydt = np.gradient(ptx), np.gradient(pty)
+        dxdt, dydt = np.gradient(pt, axis=0).T
 
         # Longueur de la courbe
         self.length = np.around(np.sum(np.sqrt(dxdt**2 + dydt**2)), decimals=2)
-        print("Longueur:", self.length)
+        logger.debug("Longueur: %s", self.length)
@@ -0,0 +1,173 @@
+"""
+    Cache des résultats des étapes de la chaine de traitement.
+    La clé d'un résultat est l'empreinte (sha1) du nom de l'étape, de la clé du résultat dont
+    elle part et de ses paramètres : la première clé est l'empreinte du contenu de l'image,
+    chaque étape est donc identifiée par l'image et par tous les paramètres en amont.
+    Changer un paramètre ne change que les clés des étapes qui en dépendent, les étapes en
+    amont sont relues dans le cache.
+    Les résultats sont gardés sérialisés (pickle) en mémoire et, si un dossier est donné, sur
+    le disque où ils survivent d'une session à l'autre ; chaque niveau a sa taille maximale et
+    évince les résultats les moins récemment utilisés.
+    Une valeur relue est toujours une copie, qu'une étape suivante peut modifier.
+"""
+import os, hashlib, pickle, tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+# Version des résultats des étapes, à incrémenter quand le code d'une étape change ce qu'elle
+# retourne : les résultats des versions précédentes ne sont plus relus
+VERSION = 2
+
+def cle_image(image):
+    """
+        Empreinte du contenu d'une image (dimensions, type et pixels)
+    """
+    image = np.ascontiguousarray(image)
+    h = hashlib.sha1(repr((image.shape, image.dtype.str)).encode())
+    h.update(image.data)
+    return h.hexdigest()
+
+def cle_etape(nom, parent, *params):
+    """
+        Clé du résultat de l'étape "nom" appliquée au résultat de clé "parent" avec les
+        paramètres params (comparés par leur repr)
+    """
+    return hashlib.sha1(repr((VERSION, nom, parent, params)).encode()).hexdigest()
+
+class CacheEtapes:
+    """
+        Cache à deux niveaux des résultats des étapes
+        memoire: taille maximale en octets des résultats gardés en mémoire
+        dossier: dossier du cache sur disque (None : pas de cache sur disque)
+        disque: taille maximale en octets des fichiers du dossier
+    """
+
+    def __init__(self, memoire=256 * 2**20, dossier=None, disque=2 * 2**30):
+        """
+            Constructeur de la classe CacheEtapes, relit l'index des fichiers déjà présents
+            dans le dossier
+        """
+        self.memoire = memoire
+        self.dossier = dossier
+        self.disque = disque
+        self.entrees = OrderedDict()
+        self.taille_memoire = 0
+
+        # Index des fichiers du disque {clé: taille}, du moins récemment utilisé au plus récent
+        self.fichiers = OrderedDict()
+        self.taille_disque = 0
+        if dossier is not None:
+            os.makedirs(dossier, exist_ok=True)
+            presents = []
+            for f in os.scandir(dossier):
+                if f.name.endswith(".pkl"):
+                    stat = f.stat()
+                    presents.append((stat.st_mtime, f.name[:-4], stat.st_size))
+            for _, cle, taille in sorted(presents):
+                self.fichiers[cle] = taille
+                self.taille_disque += taille
+
+    def _chemin(self, cle):
+        return os.path.join(self.dossier, cle + ".pkl")
+
+    def _lire(self, cle):
+        """
+            Retourne la valeur sérialisée de la clé, None si elle n'est pas dans le cache
+        """
+        if cle in self.entrees:
+            self.entrees.move_to_end(cle)
+            return self.entrees[cle]
+        if self.dossier is None:
+            return None
+
+        # Le fichier peut aussi avoir été écrit ou supprimé par un autre processus
+        try:
+            with open(self._chemin(cle), "rb") as f:
+                donnees = f.read()
+            os.utime(self._chemin(cle))
+        except OSError:
+            if cle in self.fichiers:
+                self.taille_disque -= self.fichiers.pop(cle)
+            return None
+        if cle not in self.fichiers:
+            self.fichiers[cle] = len(donnees)
+            self.taille_disque += len(donnees)
+        self.fichiers.move_to_end(cle)
+        self._garder_en_memoire(cle, donnees)
+        return donnees
+
+    def _garder_en_memoire(self, cle, donnees):
+        """
+            Ajoute une valeur sérialisée en mémoire, les moins récemment utilisées
+            sont évincées (elles restent sur le disque)
+        """
+        if len(donnees) > self.memoire:
+            return
+        self.entrees[cle] = donnees
+        self.taille_memoire += len(donnees)
+        while self.taille_memoire > self.memoire:
+            _, vieilles_donnees = self.entrees.popitem(last=False)
+            self.taille_memoire -= len(vieilles_donnees)
+
+    def _ecrire(self, cle, donnees):
+        """
+            Ecrit une valeur sérialisée sur le disque (de façon atomique, le cache peut être
+            partagé entre processus), les fichiers les moins récemment utilisés sont supprimés
+        """
+        if self.dossier is None or len(donnees) > self.disque:
+            return
+        if cle in self.fichiers:
+            self.taille_disque -= self.fichiers.pop(cle)
+        fd, temporaire = tempfile.mkstemp(dir=self.dossier, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(donnees)
+        os.replace(temporaire, self._chemin(cle))
+        self.fichiers[cle] = len(donnees)
+        self.taille_disque += len(donnees)
+        while self.taille_disque > self.disque:
+            ancienne, taille = self.fichiers.popitem(last=False)
+            self.taille_disque -= taille
+            try:
+                os.remove(self._chemin(ancienne))
+            except OSError:
+                pass
+
+    def __contains__(self, cle):
+        return cle in self.entrees or (self.dossier is not None and os.path.exists(self._chemin(cle)))
+
+    def stocker(self, cle, valeur):
+        """
+            Ajoute (ou remplace) la valeur de la clé
+        """
+        donnees = pickle.dumps(valeur, protocol=pickle.HIGHEST_PROTOCOL)
+        if cle in self.entrees:
+            self.taille_memoire -= len(self.entrees.pop(cle))
+        self._garder_en_memoire(cle, donnees)
+        self._ecrire(cle, donnees)
+
+    def obtenir(self, cle, calcul):
+        """
+            Retourne une copie de la valeur de la clé, calculée par calcul() et ajoutée au
+            cache si elle n'y est pas
+        """
+        donnees = self._lire(cle)
+        if donnees is not None:
+            return pickle.loads(donnees)
+        valeur = calcul()
+        self.stocker(cle, valeur)
+        return valeur
+
+    def vider(self):
+        """
+            Vide le cache en mémoire et sur le disque
+        """
+        self.entrees.clear()
+        self.taille_memoire = 0
+        while self.fichiers:
+            cle, _ = self.fichiers.popitem()
+            try:
+                os.remove(self._chemin(cle))
+            except OSError:
+                pass
+        self.taille_disque = 0
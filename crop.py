@@ -0,0 +1,29 @@
+"""
+    Boites englobantes des pixels blancs d'une image binaire, pour ne faire les étapes de la
+    chaine que sur la partie utile de l'image (voir pipeline.recadrer_image()).
+"""
+import cv2
+
+def elargir(rectangle, shape, marge=1, alignement=1):
+    """
+        Boite (x0, y0, x1, y1) du rectangle (x, y, largeur, hauteur) dans une image de
+        dimensions shape = (h, w), élargie de "marge" pixels de chaque côté (dans la limite de
+        l'image), dont l'origine et la fin sont des multiples de "alignement" (sauf au bord de
+        l'image)
+    """
+    h, w = shape
+    x, y, bw, bh = rectangle
+    x0, y0 = max(0, x - marge) // alignement * alignement, max(0, y - marge) // alignement * alignement
+    x1 = min(w, -(-(x + bw + marge) // alignement) * alignement)
+    y1 = min(h, -(-(y + bh + marge) // alignement) * alignement)
+    return x0, y0, x1, y1
+
+def boite_englobante(image, marge=1, alignement=1):
+    """
+        Boite englobante (x0, y0, x1, y1) des pixels blancs de l'image, élargie de "marge"
+        pixels noirs de chaque côté (voir elargir()). None si l'image est noire
+    """
+    points = cv2.findNonZero(image)
+    if points is None:
+        return None
+    return elargir(cv2.boundingRect(points), image.shape, marge, alignement)
@@ -0,0 +1,238 @@
+"""
+    Export des squelettes mesurés :
+    - au format SWC, le format standard des reconstructions de neurones (un point par ligne :
+      indice, type, x, y, z, rayon, indice du parent), lu par les outils d'analyse de neurones ;
+    - dans un jeu de données en colonnes (Dataset) auquel on ajoute les images au fil des
+      traitements : une ligne par branche avec ses points, les coefficients de ses
+      approximations, son épaisseur, sa longueur et sa profondeur. Le jeu de données est un
+      dossier de fichiers npz (un par ajout) que lire() relit et concatène d'un coup.
+
+    Exemple :
+        export.save_as_swc(skeleton, "outputs/neurone.swc")
+        with Dataset("outputs/dataset") as donnees:
+            donnees.ajouter(colonnes(skeleton, "images/test5.png"))
+        tout = Dataset("outputs/dataset").lire()
+"""
+import os, tempfile, time
+
+import numpy as np
+
+# Types des points SWC
+SWC_SOMA, SWC_DENDRITE = 1, 3
+
+def lignes_swc(skeleton):
+    """
+        Retourne les lignes (n, type, x, y, z, rayon, parent) de l'arbre du neurone : le soma
+        (racine, de rayon la distance moyenne du centre aux départs des branches qui y sont
+        reliées) puis les points de chaque branche, de rayon la moitié de son épaisseur, dans
+        l'ordre du parcours en largeur depuis le soma (voir NeuronTree).
+        SWC ne décrit que des arbres : les branches qui ferment un cycle et celles qui ne sont
+        pas reliées au soma ne sont pas écrites.
+        Doit être appelée après Skeleton.to_graph()
+    """
+    tree = skeleton.tree
+    if tree is None or tree.root < 0:
+        return []
+    nodes = tree.nodes.tolist()
+    soma = tuple(nodes[tree.root])
+    departs = [b.start for b in skeleton.branches if b.centre == 1]
+    rayon = float(np.mean(np.hypot(*(np.array(departs) - soma).T))) if departs else 0.0
+
+    lignes = [(1, SWC_SOMA, soma[0], soma[1], 0.0, round(rayon, 2), -1)]
+    numero = {tree.root: 1}
+    for v in tree.order[1:].tolist():
+        e = int(tree.parent_edge[v])
+        branch = skeleton.branches[e]
+        points = branch.points
+        # La branche est parcourue du sommet parent vers le sommet v
+        if int(tree.src[e]) == v:
+            points = points[::-1]
+        parent = numero[int(tree.parent[v])]
+        if tuple(points[0]) == tuple(nodes[tree.parent[v]]):
+            points = points[1:]
+        r = round(float(branch.thickness) / 2, 2)
+        for x, y in points:
+            lignes.append((len(lignes) + 1, SWC_DENDRITE, x, y, 0.0, r, parent))
+            parent = len(lignes)
+        numero[v] = parent
+    return lignes
+
+def save_as_swc(skeleton, chemin):
+    """
+        Enregistre l'arbre du neurone au format SWC dans le fichier "chemin" (voir lignes_swc())
+    """
+    lignes = lignes_swc(skeleton)
+    os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+    with open(chemin, "w") as f:
+        f.write("# Neural Branch Detection Method\n# n type x y z radius parent\n")
+        f.writelines("%d %d %d %d %g %g %d\n" % ligne for ligne in lignes)
+    return chemin
+
+def colonnes(skeleton, image, page=0):
+    """
+        Colonnes des branches d'un squelette mesuré, pour Dataset.ajouter() :
+        source, cible: np.array (B, 2) int32 des sommets (x, y) de chaque branche (le soma pour
+            une branche reliée au centre)
+        length, thickness, depth: np.array (B,) float32 (profondeur -1 sans graphe)
+        lsqcfx, lsqcfy: np.array (B, degree+1) float64 des coefficients des approximations,
+            dans la base de Chebyshev décalée sur [0,1] (voir lsq.evaluate_curves() ;
+            np.polynomial.Chebyshev(c, domain=[0, 1]) pour une branche)
+        points: np.array (P, 2) int32 des points de toutes les branches à la suite, ceux de la
+            branche k étant points[debuts[k]:debuts[k+1]]
+        image, page: fichier et page de l'image
+    """
+    branches = skeleton.branches
+    B = len(branches)
+    tree = skeleton.tree
+    if tree is not None:
+        source, cible, depth = tree.nodes[tree.src], tree.nodes[tree.dst], tree.depth
+    else:
+        source = np.reshape([b.start for b in branches], (B, 2))
+        cible = np.reshape([b.end for b in branches], (B, 2))
+        depth = np.full(B, -1)
+    if skeleton.lsqcf is not None and len(skeleton.lsqcf) == B:
+        lsqcfx, lsqcfy = skeleton.lsqcf[:, :, 0], skeleton.lsqcf[:, :, 1]
+    elif B:
+        lsqcf = np.array([b.coefficients() for b in branches])
+        lsqcfx, lsqcfy = lsqcf[:, :, 0], lsqcf[:, :, 1]
+    else:
+        lsqcfx = lsqcfy = np.zeros((0, 1))
+    nb_points = [len(b.points) for b in branches]
+    points = np.concatenate([np.reshape(b.points, (-1, 2)) for b in branches]) if B else np.zeros((0, 2))
+
+    return {
+        "image": str(image), "page": int(page),
+        "source": np.asarray(source, dtype=np.int32), "cible": np.asarray(cible, dtype=np.int32),
+        "length": np.array([b.length for b in branches], dtype=np.float32),
+        "thickness": np.array([b.thickness for b in branches], dtype=np.float32),
+        "depth": np.asarray(depth, dtype=np.float32),
+        "lsqcfx": np.asarray(lsqcfx, dtype=np.float64), "lsqcfy": np.asarray(lsqcfy, dtype=np.float64),
+        "points": points.astype(np.int32),
+        "debuts": np.concatenate(([0], np.cumsum(nb_points))).astype(np.int64),
+    }
+
+def points_branche(donnees, k):
+    """
+        Points de la branche k des colonnes "donnees" (voir colonnes() et Dataset.lire())
+    """
+    return donnees["points"][donnees["debuts"][k]:donnees["debuts"][k + 1]]
+
+# Colonnes qui ont une valeur par branche
+_PAR_BRANCHE = ["source", "cible", "length", "thickness", "depth", "lsqcfx", "lsqcfy"]
+
+def _concatener(morceaux, noms):
+    """
+        Concatène les colonnes "noms" de plusieurs images (ou de plusieurs fichiers) : les
+        indices "image" et les débuts des points sont décalés, les coefficients sont complétés
+        par des zéros jusqu'au plus grand degré
+    """
+    decalages = np.cumsum([0] + [len(m["images"]) for m in morceaux[:-1]])
+    resultat = {
+        "images": np.concatenate([m["images"] for m in morceaux]).astype(str),
+        "pages": np.concatenate([m["pages"] for m in morceaux]).astype(np.int32),
+        "image": np.concatenate([m["image"] + d for m, d in zip(morceaux, decalages)]).astype(np.int32),
+    }
+    for nom in noms:
+        if nom == "points":
+            resultat["points"] = np.concatenate([m["points"] for m in morceaux])
+            fins = np.cumsum([0] + [m["debuts"][-1] for m in morceaux[:-1]])
+            resultat["debuts"] = np.concatenate([[0]] + [m["debuts"][1:] + f for m, f in zip(morceaux, fins)]).astype(np.int64)
+            continue
+        valeurs = [m[nom] for m in morceaux]
+        if nom.startswith("lsqcf"):
+            p = max(v.shape[1] for v in valeurs)
+            valeurs = [np.pad(v, ((0, 0), (0, p - v.shape[1]))) for v in valeurs]
+        resultat[nom] = np.concatenate(valeurs)
+    return resultat
+
+class Dataset:
+    """
+        Jeu de données en colonnes des branches de nombreuses images, dans le dossier "dossier".
+        Les images ajoutées sont gardées en mémoire puis écrites ensemble dans un nouveau
+        fichier npz quand elles dépassent "taille" branches, quand elles sont au moins "images"
+        ou quand la première attend depuis au moins "delai" secondes (vérifié à chaque ajout),
+        par ecrire() ou à la sortie du bloc with. Chaque fichier est écrit de façon atomique, plusieurs processus peuvent
+        ajouter au même jeu de données.
+        Colonnes relues par lire() : celles de colonnes() pour toutes les branches, avec
+        images, pages: np.array du fichier et de la page de chaque image
+        image: np.array (B,) int32 de l'indice dans images de l'image de chaque branche
+    """
+
+    def __init__(self, dossier, taille=100000, images=None, delai=None):
+        """
+            Constructeur de la classe Dataset
+        """
+        self.dossier = dossier
+        self.taille = taille
+        self.images = images
+        self.delai = delai
+        self.en_attente = []
+        self.debut = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.ecrire()
+
+    def fichiers(self):
+        """
+            Liste triée des fichiers du jeu de données, du plus ancien au plus récent
+        """
+        if not os.path.isdir(self.dossier):
+            return []
+        return sorted(os.path.join(self.dossier, f) for f in os.listdir(self.dossier)
+                      if f.startswith("part-") and f.endswith(".npz"))
+
+    def ajouter(self, donnees):
+        """
+            Ajoute les colonnes d'une image (voir colonnes()). Retourne True si les images en
+            attente ont été écrites sur le disque
+        """
+        if not self.en_attente:
+            self.debut = time.monotonic()
+        self.en_attente.append(donnees)
+        if (sum(len(d["length"]) for d in self.en_attente) >= self.taille
+                or self.images is not None and len(self.en_attente) >= self.images
+                or self.delai is not None and time.monotonic() - self.debut >= self.delai):
+            self.ecrire()
+            return True
+        return False
+
+    def ecrire(self):
+        """
+            Ecrit les images en attente dans un nouveau fichier du jeu de données
+        """
+        if not self.en_attente:
+            return None
+        morceaux = [dict(d, images=[d["image"]], pages=[d["page"]], image=np.zeros(len(d["length"]), dtype=np.int32))
+                    for d in self.en_attente]
+        donnees = _concatener(morceaux, _PAR_BRANCHE + ["points"])
+
+        os.makedirs(self.dossier, exist_ok=True)
+        # Le nom commence par la date, pour que les fichiers soient relus dans l'ordre des ajouts
+        nom = "part-%020d-%d.npz" % (time.time_ns(), os.getpid())
+        fd, temporaire = tempfile.mkstemp(dir=self.dossier, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **donnees)
+        chemin = os.path.join(self.dossier, nom)
+        os.replace(temporaire, chemin)
+        self.en_attente = []
+        return chemin
+
+    def lire(self, colonnes=None):
+        """
+            Relit tout le jeu de données (sans les images encore en attente) et retourne le
+            dictionnaire de ses colonnes concaténées. colonnes: noms des colonnes par branche
+            à relire ("points" relit aussi "debuts"), toutes par défaut ; images, pages et
+            image sont toujours relues
+        """
+        noms = _PAR_BRANCHE + ["points"] if colonnes is None else list(colonnes)
+        morceaux = []
+        for chemin in self.fichiers():
+            with np.load(chemin) as npz:
+                a_lire = {"images", "pages", "image"} | set(noms) | ({"debuts"} if "points" in noms else set())
+                morceaux.append({nom: npz[nom] for nom in a_lire})
+        if not morceaux:
+            return {}
+        return _concatener(morceaux, noms)
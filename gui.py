@@ -1,4 +1,7 @@
+import queue, threading
 import tkinter as tk
+from tkinter import ttk
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
 from PIL import ImageTk, Image
@@ -9,12 +12,16 @@ def on_closing():
     fen.destroy()
 fen.protocol("WM_DELETE_WINDOW", on_closing)
 
-def afficher_plots(fig1, fig2):
+def creer_plots():
+    """
+        Crée une seule fois les deux figures, leurs canvas et leurs barres d'outils :
+        chaque traitement efface et redessine les mêmes figures
+    """
+    global fig1, fig2, canvas, canvas1
+    fig1, fig2 = Figure(), Figure()
     canvas = FigureCanvasTkAgg(fig1, master=fen)
     canvas1 = FigureCanvasTkAgg(fig2, master=fen)
-    canvas.draw()
-    canvas1.draw()
-    
+
     toolbar_frame = tk.Frame(fen)
     toolbar_frame.pack(side=tk.TOP, fill=tk.BOTH)
     toolbar = NavigationToolbar2Tk(canvas, toolbar_frame)
@@ -31,6 +38,89 @@ def afficher_plots(fig1, fig2):
     canvas.get_tk_widget().pack(side=tk.LEFT)
     canvas1.get_tk_widget().pack(side=tk.RIGHT)
 
+def afficher_plots():
+    """
+        Redessine les deux figures après un traitement
+    """
+    canvas.draw_idle()
+    canvas1.draw_idle()
+
+class Annulation(Exception):
+    """
+        Levée dans le thread de calcul quand le traitement a été annulé
+    """
+
+class Travail:
+    """
+        Exécute fonction(progression) dans un thread, sans bloquer la fenêtre.
+        La fonction appelle progression(nom, k, n) au début de chacune de ses n étapes et de
+        leurs sous-étapes, qui lève Annulation si annuler() a été appelée : l'annulation prend
+        effet au début de la sous-étape suivante. Le thread ne touche pas à l'interface, il dépose ses messages dans
+        une file que la boucle Tk relève toutes les "periode" millisecondes, et les fonctions
+        quand_progression(nom, k, n), quand_fini(resultat), quand_erreur(exception) et
+        quand_annule() sont appelées dans la boucle Tk
+    """
+
+    def __init__(self, fonction, quand_fini, quand_progression=None, quand_erreur=None, quand_annule=None,
+                 periode=50):
+        """
+            Constructeur de la classe Travail, lance le thread
+        """
+        self.quand_fini = quand_fini
+        self.quand_progression = quand_progression
+        self.quand_erreur = quand_erreur
+        self.quand_annule = quand_annule
+        self.periode = periode
+        self.annule = threading.Event()
+        self.messages = queue.Queue()
+        self.thread = threading.Thread(target=self._executer, args=(fonction,), daemon=True)
+        self.thread.start()
+        fen.after(self.periode, self._relever)
+
+    def progression(self, nom, k, n):
+        if self.annule.is_set():
+            raise Annulation()
+        self.messages.put(("progression", (nom, k, n)))
+
+    def annuler(self):
+        self.annule.set()
+
+    def en_cours(self):
+        return self.thread.is_alive() or not self.messages.empty()
+
+    def _executer(self, fonction):
+        try:
+            self.messages.put(("fini", fonction(self.progression)))
+        except Annulation:
+            self.messages.put(("annule", None))
+        except Exception as e:
+            self.messages.put(("erreur", e))
+
+    def _relever(self):
+        """
+            Traite les messages du thread dans la boucle Tk
+        """
+        while True:
+            try:
+                genre, valeur = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if genre == "progression":
+                if self.quand_progression:
+                    self.quand_progression(*valeur)
+            elif genre == "fini":
+                self.quand_fini(valeur)
+                return
+            elif genre == "annule":
+                if self.quand_annule:
+                    self.quand_annule()
+                return
+            else:
+                if self.quand_erreur:
+                    self.quand_erreur(valeur)
+                return
+        fen.after(self.periode, self._relever)
+
 # Fonction appelée lorsque la checkbox est activée/désactivée
 def on_checkbox_clicked():
     if var.get():
@@ -101,4 +191,12 @@ plot_graph_checkbox = tk.Checkbutton(fen, text="Convertir le squelette en graphe
 plot_graph_checkbox.place(x=1200, y=500)
 plot_graph_checkbox.pack()
 
+# Avancement du traitement en cours
+progression_texte = tk.StringVar(value="")
+progression_label = tk.Label(fen, textvariable=progression_texte)
+progression_label.place(x=550, y=200)
+progression_barre = ttk.Progressbar(fen, length=200, mode="determinate")
+progression_barre.place(x=550, y=225)
 
+# Figures de l'image et du graphe, réutilisées d'un traitement à l'autre
+creer_plots()
@@ -0,0 +1,120 @@
+"""
+    Mesure du temps et de la mémoire des étapes de la chaine de traitement.
+    Les étapes sont nommées (with etape("thinning"): ...), chaque étape cumule sa durée,
+    son nombre d'appels et le pic de mémoire (tracemalloc) atteint pendant son exécution au
+    delà de la mémoire utilisée à son début. Des compteurs nommés (pixels du squelette,
+    voisins consultés, branches...) sont incrémentés par compter().
+    Tant que la mesure n'est pas activée, etape() retourne un contexte vide partagé et
+    compter() ne fait rien : le code instrumenté garde le même coût, à un test près.
+
+    Exemple :
+        instrumentation.activer()
+        skeleton = pipeline.traiter_image("images/test5.png", 10)
+        print(instrumentation.rapport_json())
+"""
+import json, time, tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# True pendant une mesure, les appels coûteux du code instrumenté sont gardés par ce test
+ACTIF = False
+
+_RIEN = nullcontext()
+_memoire = False
+_etapes = {}
+_compteurs = {}
+_pile = []
+
+def activer(memoire=True):
+    """
+        Démarre une nouvelle mesure (les résultats précédents sont effacés).
+        memoire=True suit aussi le pic de mémoire des étapes avec tracemalloc, ce qui ralentit
+        sensiblement l'exécution (les durées mesurées sont alors plus longues)
+    """
+    global ACTIF, _memoire
+    reinitialiser()
+    _memoire = memoire
+    if memoire and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    ACTIF = True
+
+def desactiver():
+    """
+        Arrête la mesure, les résultats restent disponibles dans rapport()
+    """
+    global ACTIF
+    ACTIF = False
+    if _memoire and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reinitialiser():
+    """
+        Efface les durées, la mémoire et les compteurs mesurés
+    """
+    _etapes.clear()
+    _compteurs.clear()
+    _pile.clear()
+
+def etape(nom):
+    """
+        Contexte qui mesure l'étape "nom" si la mesure est activée
+    """
+    if not ACTIF:
+        return _RIEN
+    return _mesurer(nom)
+
+@contextmanager
+def _mesurer(nom):
+    # Chaque niveau de la pile garde le pic de mémoire atteint par ses sous-étapes, car
+    # tracemalloc n'a qu'un seul pic que chaque étape remet à zéro en commençant
+    debut_memoire = 0
+    if _memoire:
+        courante, pic = tracemalloc.get_traced_memory()
+        if _pile:
+            _pile[-1] = max(_pile[-1], pic)
+        tracemalloc.reset_peak()
+        debut_memoire = courante
+    _pile.append(0)
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        pic = _pile.pop()
+        if _memoire:
+            pic = max(pic, tracemalloc.get_traced_memory()[1])
+            if _pile:
+                _pile[-1] = max(_pile[-1], pic)
+        mesure = _etapes.setdefault(nom, {"duree": 0.0, "appels": 0, "memoire_max": 0})
+        mesure["duree"] += duree
+        mesure["appels"] += 1
+        if _memoire:
+            mesure["memoire_max"] = max(mesure["memoire_max"], pic - debut_memoire)
+
+def compter(nom, n=1):
+    """
+        Ajoute n au compteur "nom" si la mesure est activée
+    """
+    if ACTIF:
+        _compteurs[nom] = _compteurs.get(nom, 0) + n
+
+def rapport():
+    """
+        Retourne les mesures : {"etapes": {nom: {"duree" (s), "appels", "memoire_max" (octets)}},
+        "compteurs": {nom: valeur}}, les étapes dans l'ordre de leur premier appel
+    """
+    etapes = {}
+    for nom, mesure in _etapes.items():
+        etapes[nom] = dict(mesure, duree=round(mesure["duree"], 6))
+        if not _memoire:
+            del etapes[nom]["memoire_max"]
+    return {"etapes": etapes, "compteurs": dict(_compteurs)}
+
+def rapport_json(chemin=None, indent=2):
+    """
+        Retourne le rapport au format json, et l'enregistre dans le fichier "chemin" s'il est donné
+    """
+    texte = json.dumps(rapport(), indent=indent)
+    if chemin is not None:
+        with open(chemin, "w") as f:
+            f.write(texte + "\n")
+    return texte
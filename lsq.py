@@ -1,80 +1,119 @@
 import numpy as np
-import matplotlib.pyplot as plt
+from functools import lru_cache
 
-def ConstructionMXB(A, F, b, c):
+def compute_parametric_curve(cf, t):
     """
-        Construction selon le schéma suivant : 
-            ( A^T A | F^T)  ( x )   (A^T b) 
-            ( -----------)  (---) = (-----) 
-            (   F   | 0  )  ( L )   (  c  ) 
-        noté:       M         X   =    B
-        A est une matrice (n, p) avec n > p
-        F est une matrice (m, p) avec m < p
-        b est un vecteur de R^n
-        c est un vecteur de R^m
-        Output : 
-            M matrice (p+m, p+m)
-            B vecteur de R^(p+m)
+        Evalue en t (points de [0,1]) la coordonnée x(t) ou y(t) d'une branche à partir de son
+        vecteur de coefficients cf (Branch.lsqcfx ou Branch.lsqcfy : coefficients dans la base
+        de Chebyshev décalée T_k(2t-1) suivis des 2 multiplicateurs de Lagrange, voir
+        LeastSquaresConstraintsBatch). Sur np.linspace(0, 1, n), evaluate_curves() évalue
+        toutes les branches à la fois
     """
-    # matrice M 
-    # à gauche en haut :
-    M1 = np.dot(A.T, A)
-
-    # à gauche :
-    Mleft = np.vstack((M1,F))
+    cf = np.ravel(cf)
+    return np.polynomial.chebyshev.chebval(2 * np.asarray(t, dtype=float) - 1, cf[:len(cf) - 2])
 
-    # à droite :
-    f1,f2 = np.shape(F)
-    Mright = np.vstack((F.T, np.zeros((f1, f1))))
-
-    # M total :
-    M = np.hstack((Mleft, Mright))
+def chordal_parameterization(points_list):
+    """
+        Paramétrisation chordale de plusieurs branches à la fois : pour chaque liste de points
+        (N, 2), le vecteur tc de R^N des longueurs cumulées normalisées sur [0,1].
+        Les distances de toutes les branches sont calculées et cumulées en une seule fois.
+    """
+    lengths = np.array([len(p) for p in points_list])
+    if len(lengths) == 0:
+        return []
+    pts = np.concatenate([np.asarray(p, dtype=float).reshape(-1, 2) for p in points_list])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
 
-    # second membre
-    B1 = np.dot(A.T, b)
-    B = np.vstack((B1, c))
-    return M, B
+    d = np.zeros(len(pts))
+    d[1:] = np.sqrt(np.sum(np.diff(pts, axis=0)**2, axis=1))
+    d[starts] = 0
+    tc = np.cumsum(d)
+    tc -= np.repeat(tc[starts], lengths)
+    tc /= np.repeat(tc[starts + lengths - 1], lengths)
+    return np.split(tc, starts[1:])
 
-def LeastSquaresConstraintsMonomes(xi, yi, xic, yic, degree, t):
-    """ Determination du polynome d'approximation aux Moindres carrés p(t) 
-        de degré "degree" (dans la base des monomes) 
-        approchant les données (xi, yi) 
-        sous la contrainte de passer par les points (xic, yic)
+def LeastSquaresConstraintsBatch(points_list, degree=8, chunk=64, reduire_degre=True):
+    """ Determination, pour chaque branche de points_list, des polynomes d'approximation aux
+        Moindres carrés x(t) et y(t) de degré "degree" sous la contrainte de passer par le premier
+        et le dernier point, avec la paramétrisation chordale t de la branche.
+        x et y sont résolus ensemble (deux seconds membres) et les branches par paquets de
+        "chunk" branches de longueurs voisines, complétées par des lignes nulles.
+        Pour rester stable quand le degré augmente, on n'écrit pas les équations normales :
+        on travaille dans la base de Chebyshev décalée sur [0,1], les contraintes sont éliminées
+        par une factorisation QR (méthode de l'espace nul) et le problème réduit est résolu
+        par pseudo-inverse (SVD). Les coefficients restent dans la base de Chebyshev : les exprimer
+        dans la base des monomes fait perdre la précision gagnée dès le degré 15 ou 20.
+        reduire_degre: une branche de N points est approchée au degré min(degree, N-2), pour
+            garder plus d'équations que d'inconnues. Avec reduire_degre=False toutes les
+            branches sont approchées au degré "degree" comme par les équations normales
+            d'origine ; une branche d'au plus degree+1 points n'a alors pas assez d'équations
+            pour fixer tous les coefficients et la pseudo-inverse donne, parmi les polynomes
+            qui passent par ses points, celui dont les coefficients sont de plus petite norme :
+            il oscille entre les points (5768 pixels de long pour une branche droite de 6 points,
+            10.1 avec les équations normales singulières d'origine, 5.02 au degré réduit).
         Returns :
-            pt = p(t) : image of vector t
+            cf : np.array (B, degree+3, 2), pour chaque branche les coefficients de x (cf[:, :, 0])
+                 et de y (cf[:, :, 1]) dans la base T_k(2t-1), k=0..degree (voir evaluate_curves()),
+                 suivis des 2 multiplicateurs de Lagrange des contraintes écrites dans cette base
     """
+    p = degree + 1
+    B = len(points_list)
+    cf = np.zeros((B, p + 2, 2))
+    if B == 0:
+        return cf
+    tcs = chordal_parameterization(points_list)
+    lengths = np.array([len(t) for t in tcs])
+    degrees = np.clip(lengths - 2, 1, degree) if reduire_degre else np.full(B, degree)
 
-    nblin1 = np.size(xi)
-    nbcol = degree + 1
-
-    # matrix A d'approximation (monomial basis)
-    A = np.ones((nblin1, nbcol))
-    for k in range(1, nbcol):
-        A[:, k] = A[:, k-1] * xi
+    for d in np.unique(degrees).tolist():
+        # Contraintes en t=0 et t=1, et leur espace nul : F^T = Q R
+        F = np.polynomial.chebyshev.chebvander(np.array([-1.0, 1.0]), d)
+        Q, R = np.linalg.qr(F.T, mode='complete')
+        Q1, Z, R1 = Q[:, :2], Q[:, 2:], R[:2, :2]
+        FT_pinv = np.linalg.pinv(F.T)
 
-    # matrix F des contraintes (monomial basis)
-    nblin2 = np.size(xic)
-    F = np.ones((nblin2, nbcol))
-    for k in range(1, nbcol):
-        F[:, k] = F[:, k-1] * xic
+        group = np.flatnonzero(degrees == d)
+        group = group[np.argsort(lengths[group], kind="stable")]
+        for s in range(0, len(group), chunk):
+            idx = group[s:s+chunk]
+            nmax = lengths[idx].max()
 
-    # Systeme des equations normales sous contraintes
-    yi  = np.array([yi]).T
-    yic = np.array([yic]).T
-    M, B = ConstructionMXB(A, F, yi, yic)
+            # Matrices d'approximation complétées par des lignes nulles
+            A = np.zeros((len(idx), nmax, d + 1))
+            Y = np.zeros((len(idx), nmax, 2))
+            for r, b in enumerate(idx):
+                n = lengths[b]
+                A[r, :n] = np.polynomial.chebyshev.chebvander(2*tcs[b] - 1, d)
+                Y[r, :n] = np.asarray(points_list[b], dtype=float).reshape(-1, 2)
+            c = Y[np.arange(len(idx))[:, None], np.stack([np.zeros_like(idx), lengths[idx] - 1], axis=1)]
 
-    # Resolution
-    cf = np.linalg.solve(M, B)
+            # Solution particulière des contraintes + correction dans l'espace nul
+            xp = Q1 @ np.linalg.solve(R1.T, c)
+            y = np.linalg.pinv(A @ Z) @ (Y - A @ xp)
+            x = xp + Z @ y
 
-    # Retourner les coefficients du polynome
+            # Multiplicateurs de Lagrange : F^T L = A^T (b - A x)
+            cf[idx, :d+1] = x
+            cf[idx, p:] = FT_pinv @ (np.swapaxes(A, 1, 2) @ (Y - A @ x))
     return cf
 
-def compute_parametric_curve(cf, t):
-    degree = len(cf) - 3
 
-    # Horner evaluation of vector p(t) for display
-    pt = cf[degree] * np.ones(np.size(t))
-    for k in range(degree-1, -1, -1):
-        pt *= t
-        pt += cf[k]
-    return pt
\ No newline at end of file
+@lru_cache(maxsize=32)
+def evaluation_basis(degree, n):
+    """
+        Matrice (n, degree+1) des polynomes de Chebyshev décalés T_k(2t-1) évalués sur la
+        discrétisation t = np.linspace(0, 1, n), gardée en cache (les 32 dernières paires (degree, n) utilisées) et en lecture seule
+    """
+    V = np.polynomial.chebyshev.chebvander(np.linspace(-1, 1, n), degree)
+    V.setflags(write=False)
+    return V
+
+def evaluate_curves(cf, n):
+    """
+        Evalue les courbes paramétriques de plusieurs branches en un seul produit matriciel
+        cf : np.array (B, degree+1, 2) des coefficients de x et y dans la base de Chebyshev
+             décalée sur [0,1] (voir LeastSquaresConstraintsBatch)
+        Returns :
+            pt : np.array (B, n, 2) des points (x, y) des courbes sur np.linspace(0, 1, n)
+    """
+    return evaluation_basis(cf.shape[-2] - 1, n) @ cf
@@ -1,176 +1,173 @@
-import cv2, time, csv
-import numpy as np
-import matplotlib.pyplot as plt
-import networkx as nx # pip install networkx
+import argparse, os
 import tkinter as tk
 
-from skeleton import Skeleton
+import pipeline
+import render
 import gui
+from cache import CacheEtapes
 
-def find_noyau(img, skel):
-    """
-    A partir d'une image binarisée et de son squelette : trouve son noyau, retourne son centre, les points adjacents au noyau
-     du squelette et le squelette sans les points à l'intérieur du noyau
-    """
-
-    # Erosion avec une ellipse
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    thresh = cv2.erode(img, kernel, iterations=9)
-
-    # Appliquer un filtre gaussien et une dilatation
-    thresh = cv2.GaussianBlur(thresh, (3, 3), 0)
-    opening = cv2.dilate(thresh, kernel, iterations=9)
-
-    # Trouver les contours
-    contours, hierarchy = cv2.findContours(opening, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    contour=contours[0]
-    # Calculer le centroïde
-    M = cv2.moments(contour)
-    centroid_x = int(M['m10'] / M['m00'])
-    centroid_y = int(M['m01'] / M['m00'])
-    centre=np.array((centroid_x,centroid_y))
-
-    #Retire les points du squelette qui sont dans le noyau
-
-    #Applique le masque du noyau sur le squelette
-    mask=np.zeros_like(skel)
-    cv2.drawContours(mask, [contour], 0, 255, -1)
-    inverse_mask=cv2.bitwise_not(mask)  
-    output = cv2.bitwise_and(skel, inverse_mask)
-
-    #Cherche les points du squelette collés au contour du noyau
-    adjacent_pixels = []
-    for cnt in contour : #pour chaque morceau du contour
-        x, y = cnt[0]
-        #On cherche les points voisins de dx et dy (les points à l'intérieur du noyau ont deja été enlevé)
-        for dx in [-1, 0, 1]:
-            for dy in [-1, 0, 1]:
-                if dx == 0 and dy == 0:
-                    continue
-                if output[y + dy, x + dx] == 255:
-                    adjacent_pixels.append((x + dx, y + dy))
-
-    #On retire les doublons de la liste                 
-    unique_adjacent_pixel=list(set(adjacent_pixels))
-
-    #On supprime les points adjacents qui sont voisins
-    for p in unique_adjacent_pixel : 
-        for op in unique_adjacent_pixel :
-            if p==op :
-                continue 
-            if np.abs(p[1]-op[1])<=2 and np.abs(p[0]-op[0])<=2 :
-                unique_adjacent_pixel.remove(op)
-
-    return centre, output, unique_adjacent_pixel 
-
-def traitement():
-
-    fig1 = plt.figure()
-
-    # Ouvrir l'image sur laquelle travailler
-    image = cv2.imread("images/" + gui.imgsrc_input.get(), 0)
-    image = cv2.resize(image, (500, 500))
+# Résultats des étapes déjà calculées, pour ne refaire que celles dont un paramètre a changé,
+# créé au lancement de l'interface (options --cache-dir et --cache-size)
+cache = None
 
-    # Filtrage bilatéral ou gaussien pour réduire le bruit
-    # image = cv2.bilateralFilter(image, 5, 20, 100, borderType=cv2.BORDER_CONSTANT)
-    kernel_size = 11 # taille impaire
-    image = cv2.GaussianBlur(image, (kernel_size,kernel_size), 0)
+# Traitement en cours (voir gui.Travail), None avant le premier
+travail = None
 
-    # Segmentation de l'image
-    threshold = float(gui.thresh_input.get())
-    _, image = cv2.threshold(image, threshold, 255, cv2.THRESH_BINARY)
-
-    # Squelettisation: Recuperer le squelette du neuronne et l'afficher
-    thinned_image = cv2.ximgproc.thinning(image)
+def analyser(parametres, progression):
+    """
+        Calculs du traitement, exécutés dans le thread de gui.Travail sans toucher à l'interface.
+        progression(nom, k, n) est appelée au début de chaque étape et de chacune de ses
+        sous-étapes (elle lève gui.Annulation si le traitement a été annulé).
+        Retourne les résultats à afficher, None si le noyau n'a pas été détecté
+    """
+    graphe = parametres["graphe"]
+    n = 5 if graphe else 4
+
+    def etape(nom, k):
+        """
+            Fonction appelée au début de chaque sous-étape de l'étape k (voir pipeline.squelettiser())
+        """
+        return lambda sous_etape: progression(nom + " : " + sous_etape, k, n)
+
+    # Ouvrir l'image sur laquelle travailler, les étapes seront relues dans le cache
+    # tant que l'image et leurs paramètres ne changent pas
+    progression("Lecture de l'image", 1, n)
+    chaine = pipeline.ChaineCache(cache, pipeline.charger_image("images/" + parametres["image"]),
+                                  parametres["seuil"], graphe=graphe)
+
+    # Redimensionnement, filtrage et segmentation de l'image
+    progression("Seuillage", 2, n)
+    image = chaine.binariser()
+
+    # Squelettisation, detection du noyau, des ramifications et segmentation des branches
+    progression("Squelettisation", 3, n)
     try:
-        centre, thinned_image, point_adja = find_noyau(image, thinned_image)
-    except IndexError:
-        print("Seuil trop élevé: le noyau n'a pas été détecté")
+        skeleton, point_adja = chaine.squelettiser(etape("Squelettisation", 3))
+    except pipeline.NoyauNonDetecte:
+        return None
+
+    # Approximation, épaisseur et longueur de chaque branche
+    progression("Mesures", 4, n)
+    mesure, point_adja = chaine.mesurer(verifier=etape("Mesures", 4))
+    resultat = {"image": image, "skeleton": skeleton, "mesure": mesure}
+
+    # Exporter le graphe sous forme d'un fichier csv, puis placer les sommets du graphe
+    if graphe:
+        import networkx as nx # pip install networkx
+
+        progression("Graphe", 5, n)
+        mesure.save_as_csv(parametres["image"])
+        progression("Graphe : placement des sommets", 5, n)
+        resultat["pos"] = nx.spring_layout(mesure.G)
+        progression("Affichage", 5, n)
+    return resultat
+
+def afficher(resultat, options):
+    """
+        Dessine les résultats d'un traitement dans les deux figures de l'interface
+        (dans la boucle Tk)
+    """
+    gui.fig1.clear()
+    gui.fig2.clear()
+    gui.progression_barre["value"] = gui.progression_barre["maximum"]
+    if resultat is None:
+        gui.progression_texte.set("Seuil trop élevé: le noyau n'a pas été détecté")
+        gui.afficher_plots()
         return
-    skeleton = Skeleton(thinned_image, centre)
-
-    # Enlever quelques points inutiles
-    skeleton.simplify()
+    gui.progression_texte.set("Terminé")
+    ax = gui.fig1.add_subplot()
+    skeleton, mesure, image = resultat["skeleton"], resultat["mesure"], resultat["image"]
 
     # Afficher le squelette
-    if gui.plot_skeleton.get() == True:
-        skeleton.plot()
+    if options["squelette"]:
+        render.tracer_squelette(skeleton, ax)
 
     #Afficher le centre
-    plt.scatter(skeleton.soma[0], skeleton.soma[1], color="orange")
-
-    # Detecter les ramifications du squelette en parcourant tous les points
-    skeleton.get_branching_points(point_adja)
-    if gui.plot_brpts.get() == True:
-        for p in skeleton.branching_points:
-            plt.scatter(p[0], p[1], color="red")
-    
-    # Segmenter les branches en partant des points de ramification
-    skeleton.segmentation()
+    ax.scatter(skeleton.soma[0], skeleton.soma[1], color="orange")
 
-    # Pour chaque branche
-    for branch in skeleton.branches:
+    if options["ramifications"]:
+        render.tracer_points(skeleton.branching_points, "red", ax)
 
-        # Calculer une approximation polynomiale de la branche
-        branch.least_square_approximation()
+    # Tracer la mesure des épaisseurs (recalculée à partir des branches mesurées)
+    if options["epaisseurs"]:
+        render.tracer_epaisseurs(mesure, image, ax)
 
-        # Calculer l'épaisseur moyenne de la branche
-        branch.measure_average_thickness(image)
+    # Tracer l'approximations des branches
+    if options["approximations"]:
+        render.tracer_courbes(mesure, ax)
 
-        # Relier la branche au centre du neurone si son point de depart est 
-        # un point adjacent du soma
-        branch.relier_centre(point_adja, centre, image)
+    # Afficher l'image
+    ax.imshow(image, cmap='gray', vmin=0, vmax=255)
 
-        branch.least_square_approximation()
-
-        # Tracer l'approximations de la branche
-        if gui.plot_trace_lsq.get() == True:
-            branch.plot_approximation()
+    # Afficher le graphe correspondant au neurone
+    if "pos" in resultat:
+        import networkx as nx
+
+        ax2 = gui.fig2.add_subplot()
+        G, pos, centre = mesure.G, resultat["pos"], tuple(mesure.soma)
+        colors = ["purple" if (node == centre) else "blue" for node in G.nodes()]
+        nx.draw_networkx_nodes(G, pos, node_color=colors, ax=ax2)
+        nx.draw_networkx_edges(G, pos, ax=ax2)
+        nx.draw_networkx_edges(G, pos, edgelist=mesure.main_branch, edge_color='r', ax=ax2)
+        nx.draw_networkx_edge_labels(G, pos, font_size=6, ax=ax2, edge_labels={
+            (u, v): f"thickness:{d['thickness']}\nlength:{d['length']}\ndepth:{d['depth']}" 
+            for u, v, d in G.edges(data=True)
+        })
+        nx.draw_networkx_labels(G, pos, ax=ax2)
 
-        # Calculer la longueur de la branche
-        branch.measure_length()
-        print("---")
+    # Redessiner les 2 figures de l'interface graphique
+    gui.afficher_plots()
 
-    #Les branches qui partent d'un point adjacent partent du centre désormais
-    skeleton.remplacement_des_points(point_adja)
+def traitement():
+    """
+        Lance le traitement dans un thread (voir gui.Travail), la fenêtre reste utilisable
+        pendant le calcul. Un seul traitement à la fois
+    """
+    global travail
+    if travail is not None and travail.en_cours():
+        return
 
-    # Ranger toutes les branches dans une structure de graphe avec 
-    # les points de ramifications comme sommet et les branches comme arêtes
-    if gui.plot_graph.get() == True:
-        skeleton.to_graph()
+    # Les paramètres sont lus dans la boucle Tk, le thread ne touche pas à l'interface
+    parametres = {"image": gui.imgsrc_input.get(), "seuil": gui.thresh_input.get(), "graphe": gui.plot_graph.get()}
+    options = {"squelette": gui.plot_skeleton.get(), "ramifications": gui.plot_brpts.get(),
+               "epaisseurs": gui.plot_trace_thickness.get(), "approximations": gui.plot_trace_lsq.get()}
 
-        # # Trouver la branche principale (chemin le plus long du graphe)
-        skeleton.get_main_branch()
+    def quand_progression(nom, k, n):
+        gui.progression_texte.set("%s (%d/%d)" % (nom, k, n))
+        gui.progression_barre.configure(maximum=n, value=k - 1)
 
-        # Exporter le graphe sous forme d'un fichier csv
-        skeleton.save_as_csv(gui.imgsrc_input.get())
+    def quand_erreur(e):
+        gui.progression_texte.set("Erreur: " + str(e))
 
-    # Afficher la fenetre Matplotlib
-    # plt.grid()
-    plt.imshow(image, cmap='gray', vmin=0, vmax=255)
+    def quand_annule():
+        gui.progression_texte.set("Traitement annulé")
+        gui.progression_barre["value"] = 0
 
-    # Afficher le graphe correspondant au neurone
-    fig2 = plt.figure()
-    if gui.plot_graph.get() == True:
-        pos = nx.spring_layout(skeleton.G)
-        colors = ["purple" if (node == tuple(centre)) else "blue" for node in skeleton.G.nodes()]
-        nx.draw_networkx_nodes(skeleton.G, pos, node_color=colors)
-        nx.draw_networkx_edges(skeleton.G, pos)
-        nx.draw_networkx_edges(skeleton.G, pos, edgelist=skeleton.main_branch, edge_color='r')
-        nx.draw_networkx_edge_labels(skeleton.G, pos, font_size=6, edge_labels={
-            (u, v): f"thickness:{d['thickness']}\nlength:{d['length']}\ndepth:{d['depth']}" 
-            for u, v, d in skeleton.G.edges(data=True)
-        })
-        nx.draw_networkx_labels(skeleton.G, pos)
+    travail = gui.Travail(lambda progression: analyser(parametres, progression),
+                          lambda resultat: afficher(resultat, options),
+                          quand_progression, quand_erreur, quand_annule)
 
-    # Afficher les 2 figures sur l'interface graphique
-    gui.afficher_plots(fig1, fig2)
+def annuler():
+    """
+        Annule le traitement en cours, au début de sa prochaine étape
+    """
+    if travail is not None and travail.en_cours():
+        travail.annuler()
+        gui.progression_texte.set("Annulation...")
 
 # Point d'entree
 if __name__ == '__main__':
-    
+    parser = argparse.ArgumentParser(description="Interface de détection des branches d'un neurone")
+    parser.add_argument("--cache-dir", default=os.path.join("outputs", "cache"),
+                        help="dossier du cache des étapes (\"\" : cache en mémoire seulement)")
+    parser.add_argument("--cache-size", type=int, default=512, help="taille maximale du cache sur disque en Mio")
+    args = parser.parse_args()
+    cache = CacheEtapes(dossier=args.cache_dir or None, disque=args.cache_size * 2**20)
+
     # Ajouter un bouton pour lancer le traitement
     button = tk.Button(gui.fen, text='Traitement',width=20, height=3, command=traitement)
     button.place(x=550, y=90)
+    bouton_annuler = tk.Button(gui.fen, text='Annuler', width=20, command=annuler)
+    bouton_annuler.place(x=550, y=160)
 
     gui.fen.mainloop()
\ No newline at end of file
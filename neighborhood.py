@@ -0,0 +1,80 @@
+"""
+    Classification des pixels d'un squelette d'après leur voisinage 3x3.
+    Le voisinage d'un pixel est codé sur 8 bits (bit k = voisin NEIGHBOR_OFFSETS[k] présent),
+    une table de 256 entrées donne le rôle du pixel pour chaque code : toute l'image est
+    classée en une passe vectorisée.
+"""
+import numpy as np
+from functools import lru_cache
+
+# Décalages (di, dj) des 8 voisins d'un point, dans l'ordre de parcours de Skeleton.get_neighbors()
+NEIGHBOR_OFFSETS = [(di, dj) for di in [-1,0,1] for dj in [-1,0,1] if (di, dj) != (0, 0)]
+
+# Rôles des pixels du squelette (bits de poids faible du label)
+ISOLATED = 1            # aucun voisin
+ENDPOINT = 2            # 1 voisin : extrémité de branche
+REGULAR = 3             # 2 voisins : pixel courant d'une branche
+JUNCTION = 4            # 3 voisins formant 3 angles différents
+JUNCTION_SYMMETRIC = 5  # 3 voisins dont 2 angles de même mesure
+CROSSING = 6            # 4 voisins ou plus
+ROLE_MASK = 0x0F
+
+# Drapeau : pixel d'escalier redondant, son voisin de gauche et celui du dessus sont présents
+REDUNDANT = 0x10
+
+def _angle(u, v):
+    """
+        Angle entre u et v, calculé exactement comme le test de ramification historique
+        de Skeleton.get_branching_points()
+    """
+    from scipy.spatial.distance import cosine
+    return np.arccos(1 - cosine(u, v))
+
+@lru_cache(maxsize=None)
+def lookup_table():
+    """
+        Construit (une seule fois) la table des 256 labels indexée par le code du voisinage
+    """
+    table = np.zeros(256, dtype=np.uint8)
+    left, up = NEIGHBOR_OFFSETS.index((-1, 0)), NEIGHBOR_OFFSETS.index((0, -1))
+    for code in range(256):
+        neighbors = [np.array(o) for k, o in enumerate(NEIGHBOR_OFFSETS) if code >> k & 1]
+        n = len(neighbors)
+        if n == 0:
+            role = ISOLATED
+        elif n == 1:
+            role = ENDPOINT
+        elif n == 2:
+            role = REGULAR
+        elif n == 3:
+            u0, u1, u2 = neighbors
+            angles = [_angle(u0, u1), _angle(u1, u2), _angle(u2, u0)]
+            role = JUNCTION_SYMMETRIC if len(set(angles)) < 3 else JUNCTION
+        else:
+            role = CROSSING
+        if code >> left & 1 and code >> up & 1:
+            role |= REDUNDANT
+        table[code] = role
+    table.setflags(write=False)
+    return table
+
+def neighborhood_codes(bitmap):
+    """
+        Retourne le code 8 bits du voisinage de chaque pixel de la carte booléenne bitmap
+        (indexée [j, i]), les pixels hors de la carte comptent comme absents
+    """
+    h, w = bitmap.shape
+    padded = np.pad(bitmap, 1).astype(np.uint8)
+    codes = np.zeros((h, w), dtype=np.uint8)
+    for k, (di, dj) in enumerate(NEIGHBOR_OFFSETS):
+        codes |= padded[1+dj:1+dj+h, 1+di:1+di+w] << k
+    return codes
+
+def classify(bitmap):
+    """
+        Retourne l'image des labels (rôle | REDUNDANT) des pixels du squelette,
+        0 pour les pixels du fond
+    """
+    labels = lookup_table()[neighborhood_codes(bitmap)]
+    labels[~bitmap] = 0
+    return labels
@@ -0,0 +1,230 @@
+"""
+    Représentation compacte du graphe d'un neurone : les sommets (ramifications, extrémités
+    et centre du soma) sont numérotés, les arêtes (branches) sont des paires d'indices et leurs
+    attributs sont rangés en colonnes float32. L'arbre des plus courts chemins en nombre de
+    branches depuis le soma est gardé sous forme de tableaux de parents.
+    Le tout est construit en une passe et tient en quelques dizaines d'octets par branche,
+    to_networkx() reconstruit un networkx.Graph quand on en a besoin.
+"""
+import heapq
+import numpy as np
+
+def _en_float(v):
+    """
+        Valeur float32 en float Python de même écriture décimale (22.14 et non 22.139999389648438)
+    """
+    return float(str(v))
+
+class NeuronTree:
+    """
+        Graphe d'un neurone sous forme de tableaux
+        nodes: np.array (V, 2) int32 des coordonnées (x, y) des sommets
+        src, dst: np.array (E,) int32 des indices des extrémités de chaque arête
+        length, thickness, depth: np.array (E,) float32 des attributs des arêtes
+        root: indice du sommet du soma (-1 s'il n'est pas dans le graphe)
+        parent: np.array (V,) int32 du parent de chaque sommet dans l'arbre de parcours en
+            largeur depuis le soma (-1 pour la racine et les sommets non reliés au soma)
+        parent_edge: np.array (V,) int32 de l'arête qui relie chaque sommet à son parent (-1 sinon)
+        order: np.array int32 des sommets reliés au soma, dans l'ordre du parcours en largeur
+    """
+
+    def __init__(self, nodes, src, dst, length, thickness, root):
+        """
+            Constructeur de la classe NeuronTree, calcule l'arbre de parcours depuis root
+            et la profondeur de chaque arête
+        """
+        self.nodes = np.asarray(nodes, dtype=np.int32).reshape(-1, 2)
+        self.src = np.asarray(src, dtype=np.int32)
+        self.dst = np.asarray(dst, dtype=np.int32)
+        self.length = np.asarray(length, dtype=np.float32)
+        self.thickness = np.asarray(thickness, dtype=np.float32)
+        self.root = int(root)
+        self.build_tree()
+
+    @classmethod
+    def from_branches(cls, branches, soma, branching_points, branching_set):
+        """
+            Construit le graphe à partir des branches du squelette en une seule passe :
+            les sommets sont les points de ramification, les extrémités des branches qui ne
+            finissent pas sur une ramification et les extrémités des arêtes, numérotés dans cet
+            ordre de première apparition (celui dans lequel Skeleton.to_graph() les ajoutait
+            au networkx.Graph). Une branche qui part du centre a pour origine le soma.
+        """
+        soma = tuple(int(c) for c in soma)
+        starts = [soma if b.centre == 1 else b.start for b in branches]
+        ends = [b.end for b in branches]
+        ending_points = [e for e in ends if e not in branching_set]
+
+        # Points dans l'ordre d'insertion : sommets, puis origine et arrivée de chaque arête
+        endpoints = np.empty((2 * len(branches), 2), dtype=np.int64)
+        endpoints[0::2] = np.reshape(starts, (-1, 2))
+        endpoints[1::2] = np.reshape(ends, (-1, 2))
+        points = np.concatenate([
+            np.reshape(list(branching_points) + ending_points, (-1, 2)).astype(np.int64),
+            endpoints,
+            [soma],
+        ])
+
+        # Numérotation des points distincts par ordre de première apparition
+        uniques, first, inverse = np.unique(points, axis=0, return_index=True, return_inverse=True)
+        by_appearance = np.argsort(first, kind="stable")
+        rank = np.empty_like(by_appearance)
+        rank[by_appearance] = np.arange(len(by_appearance))
+        ids = rank[inverse.ravel()]
+        nodes = uniques[by_appearance]
+
+        # Le soma n'a été ajouté à la fin que pour retrouver son indice : s'il n'apparait
+        # pas avant, il n'est pas un sommet du graphe
+        root = ids[-1]
+        if first[inverse.ravel()[-1]] == len(points) - 1:
+            nodes, root = nodes[:-1], -1
+        n0 = len(points) - 1 - len(endpoints)
+        edge_ids = ids[n0:n0 + len(endpoints)]
+
+        return cls(
+            nodes, edge_ids[0::2], edge_ids[1::2],
+            [b.length for b in branches], [b.thickness for b in branches], root,
+        )
+
+    def __len__(self):
+        """
+            Nombre d'arêtes (de branches) du graphe
+        """
+        return len(self.src)
+
+    @property
+    def nbytes(self):
+        """
+            Mémoire occupée par les tableaux du graphe, en octets
+        """
+        return sum(a.nbytes for a in (
+            self.nodes, self.src, self.dst, self.length, self.thickness, self.depth,
+            self.parent, self.parent_edge, self.order,
+        ))
+
+    def build_tree(self):
+        """
+            Parcours en largeur depuis le soma (scipy.sparse.csgraph) : parent de chaque sommet,
+            arête qui le relie à son parent, et profondeur des arêtes, c'est-à-dire la plus
+            grande des distances au soma en nombre de branches de leurs deux extrémités
+            (-1 pour une arête qui n'est pas reliée au soma)
+            ---
+            Complexité : O(V + E)
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import breadth_first_order
+
+        V = len(self.nodes)
+        self.parent = np.full(V, -1, dtype=np.int32)
+        self.parent_edge = np.full(V, -1, dtype=np.int32)
+        hops = np.full(V, -1, dtype=np.int32)
+        if self.root < 0:
+            self.order = np.zeros(0, dtype=np.int32)
+            self.depth = np.full(len(self), -1, dtype=np.float32)
+            return
+
+        graph = csr_matrix((np.ones(len(self), dtype=np.int8), (self.src, self.dst)), shape=(V, V))
+        order, predecessors = breadth_first_order(graph, self.root, directed=False, return_predecessors=True)
+        self.order = order.astype(np.int32)
+        reached = self.order[1:]
+        self.parent[reached] = predecessors[reached]
+
+        # Arête de chaque sommet vers son parent (la dernière en cas de branches parallèles,
+        # comme networkx qui ne garde que les attributs de la dernière)
+        for a, b in ((self.src, self.dst), (self.dst, self.src)):
+            e = np.flatnonzero((self.parent[b] == a) & (a != b))
+            self.parent_edge[b[e]] = e
+
+        # Distance au soma en nombre de branches, dans l'ordre du parcours
+        hops[self.root] = 0
+        values = hops.tolist()
+        for v, p in zip(reached.tolist(), self.parent[reached].tolist()):
+            values[v] = values[p] + 1
+        hops = np.array(values, dtype=np.int32)
+        self.depth = np.maximum(hops[self.src], hops[self.dst]).astype(np.float32)
+
+    def path_lengths(self):
+        """
+            Longueur cumulée du chemin de l'arbre entre le soma et chaque sommet
+            (NaN pour les sommets non reliés au soma)
+        """
+        cumulated = np.full(len(self.nodes), np.nan)
+        if self.root < 0:
+            return cumulated
+        cumulated[self.root] = 0.0
+        reached = self.order[1:]
+        increments = self.length[self.parent_edge[reached]].astype(np.float64)
+        parents = self.parent[reached].tolist()
+        values = cumulated.tolist()
+        for v, p, l in zip(reached.tolist(), parents, increments.tolist()):
+            values[v] = values[p] + l
+        return np.array(values)
+
+    def longest_paths(self, k=1):
+        """
+            Retourne les k plus longs chemins de l'arbre partant du soma, sous forme de liste
+            [(longueur, np.array des indices des sommets du chemin)] triée par longueur décroissante.
+            Les chemins finissent sur des feuilles distinctes de l'arbre, pour qu'aucun ne
+            soit le début d'un autre.
+            ---
+            Complexité : O(V log k)
+        """
+        if self.root < 0:
+            return []
+        cumulated = self.path_lengths()
+        nb_children = np.bincount(self.parent[self.parent >= 0], minlength=len(self.nodes))
+        leaves = [v for v in self.order[1:].tolist() if nb_children[v] == 0]
+
+        paths = []
+        for leaf in heapq.nlargest(k, leaves, key=cumulated.__getitem__):
+            path = [leaf]
+            while self.parent[path[-1]] >= 0:
+                path.append(int(self.parent[path[-1]]))
+            paths.append((float(cumulated[leaf]), np.array(path[::-1], dtype=np.int32)))
+        return paths
+
+    def edge_rows(self):
+        """
+            Itère sur les arêtes : (source, cible, longueur, épaisseur, profondeur) avec les
+            sommets sous forme de tuples (x, y)
+        """
+        nodes = [tuple(p) for p in self.nodes.tolist()]
+        for u, v, l, t, d in zip(self.src.tolist(), self.dst.tolist(), self.length, self.thickness,
+                                 self.depth.astype(np.int64).tolist()):
+            yield nodes[u], nodes[v], l, t, d
+
+    def graph_edge_rows(self):
+        """
+            Itère sur les arêtes comme sur les arêtes de to_networkx() : les arêtes parallèles
+            sont fusionnées (avec les attributs de la dernière), dans l'ordre de
+            networkx.Graph.edges (sommets dans l'ordre, voisins de chacun dans l'ordre de leur
+            première arête, chaque arête vue depuis le premier de ses deux sommets)
+        """
+        nodes = [tuple(p) for p in self.nodes.tolist()]
+        # {voisin: dernière arête} de chaque sommet, dans l'ordre de la première arête
+        voisins = [{} for _ in nodes]
+        for e, (u, v) in enumerate(zip(self.src.tolist(), self.dst.tolist())):
+            voisins[u][v] = e
+            voisins[v][u] = e
+        depth = self.depth.astype(np.int64).tolist()
+        vus = set()
+        for u, aretes in enumerate(voisins):
+            for v, e in aretes.items():
+                if v not in vus:
+                    yield nodes[u], nodes[v], self.length[e], self.thickness[e], depth[e]
+            vus.add(u)
+
+    def to_networkx(self):
+        """
+            Retourne le networkx.Graph équivalent : sommets (x, y) et attributs 'thickness',
+            'length' et 'depth' sur les arêtes
+        """
+        import networkx as nx
+
+        G = nx.Graph()
+        G.add_nodes_from(tuple(p) for p in self.nodes.tolist())
+        G.add_edges_from(
+            (u, v, {'thickness': _en_float(t), 'length': _en_float(l), 'depth': d})
+            for u, v, l, t, d in self.edge_rows()
+        )
+        return G
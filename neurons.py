@@ -0,0 +1,198 @@
+"""
+    Images de plusieurs neurones : tous les noyaux de l'image sont détectés (voir
+    soma.find_noyaux()), puis chaque pixel blanc est attribué à un neurone :
+    - une composante connexe de l'image binaire qui contient un seul noyau appartient à ce
+      neurone ;
+    - une composante qui en contient plusieurs (neurones qui se touchent) est partagée par une
+      ligne de partage des eaux qui fait croître les noyaux dans la composante, chaque pixel
+      va au noyau le plus proche en suivant l'image. Un noyau nettement moins épais que le
+      plus épais de sa composante est une partie épaisse d'un prolongement, il est ignoré ;
+    - une composante sans noyau (débris, prolongements d'un neurone hors de l'image) n'est
+      pas analysée.
+    Chaque neurone est ensuite analysé séparément dans la boite englobante de sa partie de
+    l'image (squelette, ramifications, branches, mesures, graphe), en parallèle dans un pool
+    de processus, et son squelette est ramené dans les coordonnées de l'image entière.
+    Les neurones sont rangés du noyau le plus épais au moins épais : le premier est celui
+    qu'analyse la chaine d'un seul neurone (pipeline.py).
+
+    Exemple :
+        skeletons = traiter_image_neurones("images/champ.png", 20)
+        enregistrer(skeletons, "champ.png")   # outputs/champ-n0-graph.csv, champ-n1-graph.csv...
+"""
+import numpy as np
+import cv2
+from multiprocessing import Pool
+
+import instrumentation
+import pipeline
+from soma import NoyauNonDetecte, find_noyaux, adjacents
+
+def partitionner(binaire, noyaux, rapport=0.85):
+    """
+        Attribue chaque pixel blanc de l'image binaire à un noyau (voir soma.find_noyaux()).
+        Dans une composante qui contient plusieurs noyaux, un noyau moins épais que "rapport"
+        fois le plus épais de la composante est une partie épaisse d'un prolongement qui a
+        résisté à l'ouverture, et non un autre neurone : il n'est pas gardé.
+        Retourne les noyaux gardés et l'image int32 des régions : k+1 pour les pixels du
+        neurone k (k-ième noyau gardé), 0 pour le fond, les composantes sans noyau et les
+        lignes de partage entre deux neurones qui se touchent
+    """
+    h, w = binaire.shape
+    _, composantes = cv2.connectedComponents((binaire > 0).astype(np.uint8), connectivity=8)
+
+    # Composante de chaque noyau (celle d'un de ses pixels, le noyau est d'un seul tenant).
+    # Les noyaux sont du plus épais au moins épais, le premier d'une composante est le plus épais
+    par_composante = {}
+    for (x0, y0), noyau, epaisseur in noyaux:
+        ys, xs = np.nonzero(noyau)
+        par_composante.setdefault(int(composantes[ys[0] + y0, xs[0] + x0]), []).append((x0, y0, noyau, epaisseur))
+    gardes, proprietaires = [], {}
+    for c, candidats in par_composante.items():
+        for x0, y0, noyau, epaisseur in candidats:
+            if epaisseur >= rapport * candidats[0][3]:
+                proprietaires.setdefault(c, []).append(len(gardes))
+                gardes.append(((x0, y0), noyau, epaisseur))
+    # Dans l'ordre des épaisseurs décroissantes
+    ordre = sorted(range(len(gardes)), key=lambda k: -gardes[k][2])
+    rang = {k: r for r, k in enumerate(ordre)}
+    gardes = [gardes[k] for k in ordre]
+    proprietaires = {c: [rang[k] for k in ks] for c, ks in proprietaires.items()}
+
+    table = np.zeros(composantes.max() + 1, dtype=np.int32)
+    partagees = []
+    for c, ks in proprietaires.items():
+        if len(ks) == 1:
+            table[c] = ks[0] + 1
+        else:
+            partagees.append(c)
+    regions = table[composantes]
+    if not partagees:
+        return gardes, regions
+
+    # Composantes partagées : ligne de partage des eaux à partir des noyaux. L'image est
+    # plate sur le neurone et le fond, les noyaux croissent donc d'abord dans le neurone, en
+    # largeur ; l'image est bordée d'un pixel car cv2.watershed marque son bord comme ligne
+    marqueurs = np.zeros((h + 2, w + 2), dtype=np.int32)
+    for c in partagees:
+        for k in proprietaires[c]:
+            (x0, y0), noyau, _ = gardes[k]
+            nh, nw = noyau.shape
+            marqueurs[y0 + 1:y0 + 1 + nh, x0 + 1:x0 + 1 + nw][noyau] = k + 1
+    relief = cv2.cvtColor(cv2.copyMakeBorder(binaire, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0), cv2.COLOR_GRAY2BGR)
+    cv2.watershed(relief, marqueurs)
+    dans = np.isin(composantes, partagees)
+    regions[dans] = np.maximum(marqueurs[1:-1, 1:-1][dans], 0)
+    return gardes, regions
+
+def decouper(binaire, squelette, noyaux, regions):
+    """
+        Une tache par neurone (noyau gardé par partitionner()) pour traiter_neurone() : l'origine (x0, y0) de la boite
+        englobante de sa région et, dans cette boite, son image binaire, son squelette (les
+        pixels hors de sa région sont noirs) et son noyau (origine dans la boite, masque).
+        Les boites des régions sont trouvées en un seul parcours de l'image, chaque région
+        n'est ensuite cherchée que dans sa boite
+    """
+    from scipy.ndimage import find_objects
+
+    h, w = binaire.shape
+    taches = []
+    for k, (boite, ((nx, ny), noyau, _)) in enumerate(zip(find_objects(regions, max_label=len(noyaux)), noyaux)):
+        if boite is None:
+            continue
+        # La boite contient aussi celle du noyau, élargie d'un pixel pour l'anneau, et une
+        # marge d'un pixel noir pour que la carte des distances au fond soit celle de l'image
+        lignes, colonnes = boite
+        x0, y0 = max(0, min(colonnes.start, nx) - 1), max(0, min(lignes.start, ny) - 1)
+        x1 = min(w, max(colonnes.stop, nx + noyau.shape[1]) + 1)
+        y1 = min(h, max(lignes.stop, ny + noyau.shape[0]) + 1)
+        dedans = regions[y0:y1, x0:x1] == k + 1
+        taches.append(((int(x0), int(y0)),
+                       np.where(dedans, binaire[y0:y1, x0:x1], 0).astype(np.uint8),
+                       np.where(dedans, squelette[y0:y1, x0:x1], 0).astype(np.uint8),
+                       (int(nx - x0), int(ny - y0)), noyau))
+    return taches
+
+def traiter_neurone(tache, segmentation="walk", thickness="rays", graphe=True, pas=10, dist_max=3):
+    """
+        Analyse un neurone dans la boite de sa région (voir decouper()) et retourne son
+        squelette mesuré, dans les coordonnées de la boite
+    """
+    origine, binaire, squelette, origine_noyau, noyau = tache
+    with instrumentation.etape("find_noyau"):
+        centre, squelette, point_adja = adjacents(squelette, origine_noyau, noyau)
+    skeleton = pipeline.segmenter(squelette, centre, point_adja, segmentation, pas, dist_max)
+    pipeline.mesurer(skeleton, binaire, point_adja, graphe, thickness=thickness)
+    return skeleton
+
+def _traiter(tache_options):
+    """
+        traiter_neurone() dans un processus du pool
+    """
+    tache, options = tache_options
+    return traiter_neurone(tache, **options)
+
+def analyser_neurones(binaire, squelette=None, rayon=18, segmentation="walk", thickness="rays", graphe=True,
+                      processes=None, rapport=0.85, pas=10, dist_max=3):
+    """
+        Analyse tous les neurones de l'image binaire, en parallèle sur "processes" processus
+        (dans le processus courant si processes=1 ou s'il n'y a qu'un neurone).
+        squelette: image du squelette si elle a déjà été calculée (voir tiles.py)
+        rayon: rayon des noyaux en pixels (voir soma.find_noyau())
+        pas, dist_max: paramètres de la détection des ramifications (voir pipeline.squelettiser())
+        rapport: épaisseur relative minimale d'un autre noyau dans la même composante (voir
+            partitionner())
+        Retourne la liste des squelettes mesurés des neurones (voir pipeline.mesurer()), dans
+        les coordonnées de l'image, du noyau le plus épais au moins épais.
+        Leve soma.NoyauNonDetecte si aucun noyau n'a été détecté (seuil trop élevé)
+    """
+    # Toutes les étapes travaillent sur la boite englobante des pixels blancs
+    boite = pipeline.recadrer_image(binaire, rayon)
+    if boite is None:
+        raise NoyauNonDetecte("Aucun noyau détecté")
+    bx, by, bx1, by1 = boite
+    binaire = binaire[by:by1, bx:bx1]
+    if squelette is None:
+        with instrumentation.etape("thinning"):
+            squelette = cv2.ximgproc.thinning(binaire)
+    else:
+        squelette = squelette[by:by1, bx:bx1]
+    with instrumentation.etape("find_noyaux"):
+        noyaux, regions = partitionner(binaire, find_noyaux(binaire, rayon), rapport)
+        taches = decouper(binaire, squelette, noyaux, regions)
+    instrumentation.compter("neurons", len(taches))
+
+    options = {"segmentation": segmentation, "thickness": thickness, "graphe": graphe, "pas": pas, "dist_max": dist_max}
+    if processes == 1 or len(taches) == 1:
+        skeletons = [traiter_neurone(tache, **options) for tache in taches]
+    else:
+        with Pool(min(processes or len(taches), len(taches))) as pool:
+            skeletons = pool.map(_traiter, [(tache, options) for tache in taches])
+
+    for tache, skeleton in zip(taches, skeletons):
+        skeleton.deplacer((tache[0][0] + bx, tache[0][1] + by))
+    return skeletons
+
+def traiter_image_neurones(chemin, threshold, taille=(500, 500), kernel_size=11, rayon=18, segmentation="walk",
+                           thickness="rays", graphe=True, page=0, processes=None, rapport=0.85, pas=10,
+                           dist_max=3):
+    """
+        Enchaine toutes les étapes sur le fichier image donné (sa page "page" pour un fichier
+        multi-pages) et retourne la liste des squelettes de ses neurones (voir analyser_neurones())
+    """
+    image = pipeline.pretraitement(pipeline.charger_image(chemin, page), taille, kernel_size)
+    image = pipeline.binariser(image, threshold)
+    return analyser_neurones(image, None, rayon, segmentation, thickness, graphe, processes, rapport, pas, dist_max)
+
+def enregistrer(skeletons, name, dossier="outputs", swc=False):
+    """
+        Enregistre le graphe de chaque neurone dans son fichier csv "<name>-n<k>-graph.csv"
+        (voir Skeleton.save_as_csv()), et au format SWC si swc=True.
+        Retourne la liste des fichiers écrits
+    """
+    base = name.split('.')[0]
+    fichiers = []
+    for k, skeleton in enumerate(skeletons):
+        fichiers.append(skeleton.save_as_csv(base + "-n" + str(k), dossier))
+        if swc:
+            fichiers.append(skeleton.save_as_swc(base + "-n" + str(k), dossier))
+    return fichiers
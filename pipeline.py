@@ -0,0 +1,258 @@
+"""
+    Chaine de traitement d'une image de neurone, sans interface graphique.
+    Les étapes sont les mêmes que celles lancées par le bouton "Traitement" de main.py :
+    flou -> seuillage -> squelettisation -> noyau -> squelette -> branches -> graphe
+"""
+import cv2
+
+import instrumentation
+import tiff
+from cache import cle_image, cle_etape
+from crop import boite_englobante
+from soma import NoyauNonDetecte, find_noyau, facteur_reduction
+from skeleton import Skeleton
+
+def charger_image(chemin, page=0):
+    """
+        Ouvre l'image en niveaux de gris, leve une erreur si le fichier n'est pas lisible.
+        page: numéro de la page à lire dans un fichier TIFF multi-pages (voir tiff.py),
+        seule cette page est lue
+    """
+    if page:
+        return tiff.ouvrir_page(chemin, page).lire()
+    image = cv2.imread(chemin, 0)
+    if image is None:
+        raise FileNotFoundError("Impossible de lire l'image " + chemin)
+    return image
+
+def nombre_pages(chemin):
+    """
+        Nombre de pages du fichier image (lu dans les en-têtes pour un fichier TIFF, 1 sinon)
+    """
+    return len(tiff.pages_tiff(chemin)) if tiff.est_tiff(chemin) else 1
+
+def pretraitement(image, taille=(500, 500), kernel_size=11):
+    """
+        Redimensionne l'image et applique un filtre gaussien pour réduire le bruit
+        taille: taille de redimensionnement (w, h), None pour garder la résolution d'origine
+        kernel_size: taille impaire du noyau gaussien
+    """
+    with instrumentation.etape("preprocess"):
+        if taille is not None:
+            image = cv2.resize(image, taille)
+        return flouter(image, kernel_size)
+
+def flouter(image, kernel_size=11):
+    """
+        Filtre gaussien de taille impaire kernel_size
+    """
+    return cv2.GaussianBlur(image, (kernel_size, kernel_size), 0)
+
+def binariser(image, threshold):
+    """
+        Segmentation de l'image par seuillage
+    """
+    with instrumentation.etape("threshold"):
+        _, image = cv2.threshold(image, float(threshold), 255, cv2.THRESH_BINARY)
+    return image
+
+def _etape(nom, verifier):
+    """
+        instrumentation.etape(nom), après avoir appelé verifier(nom) s'il est donné
+    """
+    if verifier is not None:
+        verifier(nom)
+    return instrumentation.etape(nom)
+
+def squelettiser(image, segmentation="walk", thinned_image=None, rayon=18, pas=10, dist_max=3, recadrer=True,
+                 verifier=None):
+    """
+        A partir de l'image binaire : squelettisation, detection du noyau, simplification,
+        detection des points de ramification et segmentation des branches
+        (segmentation: méthode de Skeleton.segmentation(), "walk" ou "index").
+        thinned_image: image du squelette si elle a déjà été calculée (voir tiles.py)
+        rayon: rayon du noyau en pixels (voir find_noyau())
+        pas, dist_max: paramètres de la détection des ramifications en pixels (voir
+            Skeleton.get_branching_points())
+        recadrer: toutes les étapes ne travaillent que sur la boite englobante des pixels
+            blancs (voir recadrer_image()), le squelette est ensuite ramené dans l'image entière ;
+            le résultat est le même
+        verifier: fonction appelée avec le nom de chaque étape avant de la commencer, qui
+            peut lever une exception pour interrompre la chaine (voir gui.Travail)
+        Leve soma.NoyauNonDetecte si le noyau n'a pas été détecté (seuil trop élevé).
+        Retourne le squelette et les points du squelette adjacents au noyau
+    """
+    if recadrer:
+        boite = recadrer_image(image, rayon)
+        if boite is None:
+            raise NoyauNonDetecte("Aucun noyau détecté")
+        x0, y0, x1, y1 = boite
+        instrumentation.compter("crop_pixels", (x1 - x0) * (y1 - y0))
+        image = image[y0:y1, x0:x1]
+        if thinned_image is not None:
+            thinned_image = thinned_image[y0:y1, x0:x1]
+        skeleton, point_adja = squelettiser(image, segmentation, thinned_image, rayon, pas, dist_max, recadrer=False,
+                                            verifier=verifier)
+        skeleton.deplacer((x0, y0))
+        return skeleton, [(x + x0, y + y0) for x, y in point_adja]
+
+    if thinned_image is None:
+        with _etape("thinning", verifier):
+            thinned_image = cv2.ximgproc.thinning(image)
+    with _etape("find_noyau", verifier):
+        centre, thinned_image, point_adja = find_noyau(image, thinned_image, rayon)
+    return segmenter(thinned_image, centre, point_adja, segmentation, pas, dist_max, verifier), point_adja
+
+def recadrer_image(image, rayon=18):
+    """
+        Boite (x0, y0, x1, y1) des pixels blancs de l'image binaire sur laquelle squelettiser()
+        donne le même résultat que sur l'image entière : une marge noire autour des pixels
+        blancs (un pixel pour l'amincissement, un pixel de l'image réduite pour find_noyau()),
+        et une origine multiple du facteur de réduction de find_noyau() pour que l'image
+        réduite soit une partie de celle de l'image entière. None si l'image est noire
+    """
+    facteur = facteur_reduction(rayon)
+    return boite_englobante(image, marge=facteur, alignement=facteur)
+
+def segmenter(thinned_image, centre, point_adja, segmentation="walk", pas=10, dist_max=3, verifier=None):
+    """
+        A partir de l'image du squelette sans le noyau, du centre du noyau et des points
+        adjacents au noyau (voir soma.find_noyau() et soma.adjacents()) : construction du
+        squelette, simplification, detection des points de ramification et segmentation
+        des branches (verifier: voir squelettiser()). Retourne le squelette
+    """
+    with _etape("Skeleton.__init__", verifier):
+        skeleton = Skeleton(thinned_image, centre)
+
+    # Enlever quelques points inutiles
+    with _etape("simplify", verifier):
+        skeleton.simplify()
+    instrumentation.compter("skeleton_pixels", len(skeleton.points))
+
+    # Detecter les ramifications puis segmenter les branches
+    with _etape("get_branching_points", verifier):
+        skeleton.get_branching_points(point_adja, steps=pas, dist_max=dist_max)
+    with _etape("segmentation", verifier):
+        skeleton.segmentation(segmentation)
+    instrumentation.compter("branching_points", len(skeleton.branching_points))
+    instrumentation.compter("branches", len(skeleton.branches))
+    return skeleton
+
+def mesurer(skeleton, image, point_adja, graphe=True, plot_trace=False, thickness="rays", verifier=None):
+    """
+        Approximation, épaisseur et longueur de chaque branche puis construction
+        du graphe et de la branche principale si graphe=True
+        (thickness: mode de Skeleton.measure_average_thickness(), "rays" ou "distance" ;
+        verifier: voir squelettiser())
+    """
+    # Calculer les approximations polynomiales de toutes les branches
+    with _etape("fitting", verifier):
+        skeleton.least_square_approximation()
+
+    # Calculer l'épaisseur moyenne des branches
+    with _etape("thickness", verifier):
+        skeleton.measure_average_thickness(image, thickness, plot_trace=plot_trace)
+
+    # Relier au centre du neurone les branches dont le point de depart est
+    # un point adjacent du soma
+    with _etape("relier_centre", verifier):
+        skeleton.relier_centre(point_adja)
+
+    # Calculer la longueur des branches
+    with _etape("length", verifier):
+        skeleton.measure_length()
+
+    #Les branches qui partent d'un point adjacent partent du centre désormais
+    skeleton.remplacement_des_points(point_adja)
+
+    if graphe:
+        with _etape("to_graph", verifier):
+            skeleton.to_graph()
+        instrumentation.compter("graph_nodes", len(skeleton.tree.nodes))
+        instrumentation.compter("graph_edges", len(skeleton.tree))
+        with _etape("get_main_branch", verifier):
+            skeleton.get_main_branch()
+
+def traiter_image(chemin, threshold, taille=(500, 500), kernel_size=11, graphe=True, segmentation="walk",
+                  thickness="rays", page=0, rayon=18, pas=10, dist_max=3):
+    """
+        Enchaine toutes les étapes sur le fichier image donné (sa page "page" pour un
+        fichier multi-pages) et retourne le squelette. Les tailles en pixels (taille,
+        kernel_size, rayon, pas, dist_max) peuvent être calculées pour la résolution de
+        l'image par scale.Echelle.options()
+    """
+    image = pretraitement(charger_image(chemin, page), taille, kernel_size)
+    image = binariser(image, threshold)
+    skeleton, point_adja = squelettiser(image, segmentation, rayon=rayon, pas=pas, dist_max=dist_max)
+    mesurer(skeleton, image, point_adja, graphe, thickness=thickness)
+    return skeleton
+
+class ChaineCache:
+    """
+        Les étapes de la chaine pour une image, dont les résultats sont gardés dans un
+        CacheEtapes (voir cache.py). Chaque méthode retourne le résultat de son étape, relu dans
+        le cache s'il y est, sinon calculé à partir du résultat de l'étape précédente (lui-même
+        relu ou calculé) puis ajouté au cache : quand seul le seuil change, le flou est relu
+        et les étapes suivantes sont recalculées.
+        Les résultats retournés sont des copies, ils peuvent être modifiés sans toucher au cache.
+    """
+
+    def __init__(self, cache, image, threshold, taille=(500, 500), kernel_size=11, segmentation="walk",
+                 rayon=18, thickness="rays", graphe=True, pas=10, dist_max=3, recadrer=True):
+        """
+            Constructeur de la classe ChaineCache, calcule les clés des étapes à partir de
+            l'empreinte de l'image et de tous les paramètres de chaque étape
+        """
+        self.cache = cache
+        self.image = image
+        self.threshold = float(threshold)
+        self.taille = tuple(taille) if taille is not None else None
+        self.kernel_size = kernel_size
+        self.segmentation = segmentation
+        self.rayon = rayon
+        self.pas = pas
+        self.dist_max = dist_max
+        self.recadrer = bool(recadrer)
+        self.thickness = thickness
+        self.graphe = bool(graphe)
+
+        self.cles = {}
+        cle = cle_image(image)
+        cle = self.cles["pretraitement"] = cle_etape("pretraitement", cle, self.taille, kernel_size)
+        cle = self.cles["binariser"] = cle_etape("binariser", cle, self.threshold)
+        cle = self.cles["squelettiser"] = cle_etape("squelettiser", cle, segmentation, rayon, pas, dist_max,
+                                                    self.recadrer)
+        self.cles["mesurer"] = cle_etape("mesurer", cle, thickness, self.graphe)
+
+    def pretraitement(self):
+        return self.cache.obtenir(self.cles["pretraitement"],
+                                  lambda: pretraitement(self.image, self.taille, self.kernel_size))
+
+    def binariser(self):
+        return self.cache.obtenir(self.cles["binariser"], lambda: binariser(self.pretraitement(), self.threshold))
+
+    def squelettiser(self, verifier=None):
+        """
+            Retourne le squelette et les points adjacents au noyau (voir squelettiser()),
+            leve soma.NoyauNonDetecte si le noyau n'a pas été détecté
+        """
+        return self.cache.obtenir(self.cles["squelettiser"],
+                                  lambda: squelettiser(self.binariser(), self.segmentation, None, self.rayon,
+                                                       self.pas, self.dist_max, self.recadrer, verifier))
+
+    def mesurer(self, plot_trace=False, verifier=None):
+        """
+            Retourne le squelette mesuré (voir mesurer()) et les points adjacents au noyau.
+            Avec plot_trace=True les mesures sont refaites pour être tracées
+            (verifier: voir squelettiser())
+        """
+        def calcul():
+            skeleton, point_adja = self.squelettiser(verifier)
+            mesurer(skeleton, self.binariser(), point_adja, self.graphe, plot_trace, self.thickness, verifier)
+            return skeleton, point_adja
+
+        if plot_trace:
+            valeur = calcul()
+            self.cache.stocker(self.cles["mesurer"], valeur)
+            return valeur
+        return self.cache.obtenir(self.cles["mesurer"], calcul)
@@ -0,0 +1,122 @@
+"""
+    Affichage du squelette et des mesures avec peu d'objets Matplotlib, pour que l'affichage,
+    le zoom et le déplacement restent fluides sur les images à leur résolution d'origine :
+    - le squelette est une seule image RGBA transparente superposée à l'image ;
+    - chaque classe de points (ramifications, points adjacents...) est un seul nuage de points ;
+    - les approximations de toutes les branches sont une seule LineCollection ;
+    - la trace des mesures d'épaisseur est calculée pour toutes les branches à la fois et
+      tracée en un nuage de points, une LineCollection et deux champs de flèches.
+    Chaque fonction dessine sur les axes "ax" (les axes courants par défaut) et retourne
+    l'objet Matplotlib créé.
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+
+import lsq
+
+def tracer_squelette(skeleton, ax=None, couleur="black"):
+    """
+        Superpose les pixels du squelette à l'image, sous la forme d'une image RGBA de la
+        boite englobante du squelette (transparente hors du squelette)
+    """
+    ax = ax or plt.gca()
+    h, w = skeleton.bitmap.shape
+    ox, oy = skeleton.origin
+    rgba = np.zeros((h, w, 4), dtype=np.uint8)
+    rgba[skeleton.bitmap.astype(bool)] = np.round(np.array(to_rgba(couleur)) * 255).astype(np.uint8)
+    # Les images ont un zorder de 0 : le squelette reste au dessus de l'image affichée ensuite
+    return ax.imshow(rgba, extent=(ox - 0.5, ox + w - 0.5, oy + h - 0.5, oy - 0.5),
+                     interpolation="nearest", zorder=0.5)
+
+def tracer_points(points, couleur, ax=None, **options):
+    """
+        Affiche une liste de points (x, y) en un seul nuage de points
+    """
+    ax = ax or plt.gca()
+    points = np.reshape(np.asarray(points, dtype=np.float64), (-1, 2))
+    return ax.scatter(points[:, 0], points[:, 1], color=couleur, **options)
+
+def courbes(skeleton, n=1000):
+    """
+        Points des approximations de toutes les branches (voir Branch.plot_approximation()),
+        précédés du segment qui relie au centre les branches reliées au centre.
+        Doit être appelée après least_square_approximation()
+    """
+    if not skeleton.branches:
+        return []
+    pt = lsq.evaluate_curves(skeleton.lsqcf, n)
+    lignes = []
+    for branch, p in zip(skeleton.branches, pt):
+        if branch.centre == 1 and len(branch.line):
+            p = np.vstack((branch.line[[-1, 0]], p))
+        lignes.append(p)
+    return lignes
+
+def tracer_courbes(skeleton, ax=None, couleur="blue", n=1000):
+    """
+        Affiche les approximations de toutes les branches en une seule LineCollection
+    """
+    ax = ax or plt.gca()
+    collection = LineCollection(courbes(skeleton, n), colors=couleur)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+def traces_epaisseur(skeleton, image, n=10):
+    """
+        Géométrie des mesures de l'épaisseur de toutes les branches (mode "rays", voir
+        Branch.measure_average_thickness()), calculée pour tous les points de mesure à la fois.
+        Retourne les points de mesure (M, 2), les tangentes (M, 2), les directions
+        perpendiculaires (M, 2) et les segments (M, 2, 2) des pixels blancs comptés
+    """
+    vide = np.zeros((0, 2))
+    if not skeleton.branches:
+        return vide, vide, vide, np.zeros((0, 2, 2))
+    pt = lsq.evaluate_curves(skeleton.lsqcf, n)
+    d = np.gradient(pt, axis=1)
+
+    # Comme Branch.measure_average_thickness() : sans le premier point (ramification), ni le
+    # dernier si la branche se termine par un point de ramification
+    garder = np.ones((len(pt), n), dtype=bool)
+    garder[:, 0] = False
+    garder[[b.end in skeleton.branching_set for b in skeleton.branches], -1] = False
+    p, tangentes = pt[garder], d[garder]
+    tangentes = tangentes / np.linalg.norm(tangentes, axis=1, keepdims=True)
+    u = np.stack((-tangentes[:, 1], tangentes[:, 0]), axis=1)
+
+    # Avancée simultanée de tous les rayons, dans le sens de u puis de -u, tant que le
+    # pixel atteint est blanc
+    h, w = image.shape
+    blanc = image == 255
+    extremites = []
+    for sens in (1, -1):
+        k = np.zeros(len(p), dtype=np.int64)
+        actifs = np.ones(len(p), dtype=bool)
+        while actifs.any():
+            q = p[actifs] + sens * k[actifs, None] * u[actifs]
+            x, y = np.round(q[:, 0]).astype(np.int64), np.round(q[:, 1]).astype(np.int64)
+            dedans = (0 <= x) & (x < w) & (0 <= y) & (y < h)
+            continuer = np.zeros(len(q), dtype=bool)
+            continuer[dedans] = blanc[y[dedans], x[dedans]]
+            indices = np.flatnonzero(actifs)
+            k[indices[continuer]] += 1
+            actifs[indices[~continuer]] = False
+        extremites.append(p + sens * np.maximum(k - 1, 0)[:, None] * u)
+    return p, tangentes, u, np.stack(extremites, axis=1)
+
+def tracer_epaisseurs(skeleton, image, ax=None, couleur="red"):
+    """
+        Affiche la trace des mesures de l'épaisseur : points de mesure, tangentes, directions
+        perpendiculaires et pixels blancs comptés, en quatre objets Matplotlib
+    """
+    ax = ax or plt.gca()
+    p, tangentes, u, segments = traces_epaisseur(skeleton, image)
+    collection = LineCollection(segments, colors=couleur, linewidths=1.5)
+    ax.add_collection(collection)
+    ax.scatter(p[:, 0], p[:, 1], color=couleur)
+    for v in (tangentes, u):
+        ax.quiver(p[:, 0], p[:, 1], v[:, 0], v[:, 1], angles='xy', scale_units='xy', scale=1)
+    ax.autoscale_view()
+    return collection
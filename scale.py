@@ -0,0 +1,66 @@
+"""
+    Echelle physique de la chaine de traitement. Les tailles de la chaine (flou, rayon du
+    noyau, marche de la détection des points de ramification) sont des longueurs en µm,
+    converties en pixels pour la résolution des images (µm par pixel) : une même Echelle
+    convient à toutes les images d'un microscope, traitées à leur résolution d'origine au
+    lieu d'être redimensionnées en 500x500.
+    Les longueurs par défaut sont les tailles en pixels de la chaine d'origine pour des pixels
+    de 1 µm : Echelle(1.0).options() redonne les paramètres par défaut de
+    pipeline.traiter_image(), sans le redimensionnement.
+    Le nombre de mesures d'épaisseur par branche (10) ne dépend pas de l'échelle : les
+    mesures sont réparties sur la courbe de chaque branche.
+
+    Exemple :
+        echelle = Echelle(0.325, rayon_soma=6.0)
+        skeleton = pipeline.traiter_image("lames/neurone.tif", 20, **echelle.options())
+        longueurs = echelle.microns(skeleton.tree.length)
+"""
+
+class Echelle:
+    """
+        Tailles de la chaine en µm pour des images de "um_par_pixel" µm par pixel
+        flou: taille du noyau gaussien du flou (pipeline.pretraitement())
+        rayon_soma: rayon de l'ouverture qui détecte le noyau (soma.find_noyau())
+        marche: distance parcourue par les marcheurs qui sondent les points de ramification
+        ecart: distance minimale entre les arrivées des marcheurs
+            (voir Skeleton.get_branching_points())
+    """
+
+    def __init__(self, um_par_pixel, flou=11.0, rayon_soma=18.0, marche=10.0, ecart=3.0):
+        """
+            Constructeur de la classe Echelle
+        """
+        if um_par_pixel <= 0:
+            raise ValueError("Taille de pixel invalide : " + str(um_par_pixel))
+        self.um_par_pixel = float(um_par_pixel)
+        self.flou = flou
+        self.rayon_soma = rayon_soma
+        self.marche = marche
+        self.ecart = ecart
+
+    def pixels(self, longueur):
+        """
+            Longueur (ou tableau de longueurs) en µm convertie en pixels
+        """
+        return longueur / self.um_par_pixel
+
+    def microns(self, pixels):
+        """
+            Longueur (ou tableau de longueurs) en pixels convertie en µm, pour les mesures
+            de la chaine (longueurs et épaisseurs des branches)
+        """
+        return pixels * self.um_par_pixel
+
+    def options(self, taille=None):
+        """
+            Paramètres en pixels de pipeline.traiter_image() (et de tiles.traiter_image_tuiles(),
+            sans taille) : le noyau gaussien est impair, les nombres de pas au moins 1.
+            taille: taille de redimensionnement, None pour la résolution d'origine (l'échelle
+            est celle de l'image traitée, après redimensionnement)
+        """
+        kernel_size = max(1, int(round(self.pixels(self.flou))))
+        if kernel_size % 2 == 0:
+            kernel_size += 1
+        return {"taille": taille, "kernel_size": kernel_size, "rayon": self.pixels(self.rayon_soma),
+                "pas": max(1, int(round(self.pixels(self.marche)))),
+                "dist_max": max(1, int(round(self.pixels(self.ecart))))}
@@ -1,10 +1,16 @@
-import cv2, csv
+import os, csv, logging
 import numpy as np
-import matplotlib.pyplot as plt
-import networkx as nx # pip install networkx
-from scipy.spatial.distance import cosine
 
-from branch import Branch
+from branch import Branch, distance_map, sample_distance_map, trimmed_mean, segments_pixels
+from crop import boite_englobante
+import lsq
+import neighborhood
+from neighborhood import NEIGHBOR_OFFSETS
+from neuron_tree import NeuronTree
+import export
+import instrumentation
+
+logger = logging.getLogger(__name__)
 
 class Skeleton:
     """
@@ -17,26 +23,109 @@ class Skeleton:
             Constructeur de la classe Skeleton
             matrix: np.array de dimension 2 qui contient une image binaire du squelette
         """
-        # Recuperer la liste des points blancs de la matrice, ROI du squelette
-        self.points = []
-        for i in range(len(matrix)):
-            for j in range(len(matrix[0])):
-                if matrix[j][i] == 255:
-                    self.points.append((i, j))
+        # Recuperer la liste des points blancs de la matrice, ROI du squelette,
+        # ordonnés par x puis par y
+        xs, ys = np.nonzero(np.asarray(matrix).T == 255)
+        self.points = list(zip(xs.tolist(), ys.tolist()))
+
+        # Index des points : carte d'occupation et table des voisins
+        self.build_index()
         
-        # Contient les points de ramification du squelette
+        # Contient les points de ramification du squelette, et le même ensemble
+        # pour les tests d'appartenance (partagé avec les branches)
         self.branching_points = []
+        self.branching_set = set()
 
         # Contient des instances de la classe Branch qui sont les branches du squelette
+        # et les coefficients de leurs approximations (voir least_square_approximation)
         self.branches = []
+        self.lsqcf = None
         self.main_branch = []
+        self.main_paths = []
         self.soma = soma
-        self.G = None
 
-    def plot(self):
+        # Graphe du neurone sous forme de tableaux (voir to_graph) et sa version networkx,
+        # construite à la demande
+        self.tree = None
+        self._G = None
+
+    def build_index(self):
+        """
+            Construit l'index des points du squelette, à refaire si self.points change :
+            - coords: np.array (N, 2) int32 des points (i,j), dans l'ordre de self.points
+            - origin, bitmap: carte d'occupation booléenne de la boite englobante des points,
+              agrandie d'un pixel de chaque côté, indexée par bitmap[j - origin[1], i - origin[0]]
+            - sorted_keys, key_order: clés linéaires triées des points et numéros correspondants,
+              pour retrouver le numéro d'un point (index_of)
+            - indptr, indices: table des voisins au format CSR sur les numéros de points,
+              les voisins du point k sont indices[indptr[k]:indptr[k+1]], dans l'ordre
+              de get_neighbors()
+            ---
+            Complexité : O(N log N) pour le tri des clés, O(1) ensuite par requête
+        """
+        self.coords = np.array(self.points, dtype=np.int32).reshape(-1, 2)
+        N = len(self.coords)
+        if N == 0:
+            self.origin = np.zeros(2, dtype=np.int32)
+            self.bitmap = np.zeros((1, 1), dtype=bool)
+            self.indptr = np.zeros(1, dtype=np.int32)
+            self.indices = np.zeros(0, dtype=np.int32)
+            self.key_order = np.zeros(0, dtype=np.int32)
+            self.sorted_keys = np.zeros(0, dtype=np.int64)
+            return
+
+        self.origin = self.coords.min(axis=0) - 1
+        w, h = self.coords.max(axis=0) - self.origin + 2
+        x = self.coords[:, 0] - self.origin[0]
+        y = self.coords[:, 1] - self.origin[1]
+        self.bitmap = np.zeros((h, w), dtype=bool)
+        self.bitmap[y, x] = True
+
+        # Clé linéaire de chaque point pour retrouver son numéro par recherche dichotomique
+        keys = x.astype(np.int64) * h + y
+        self.key_order = np.argsort(keys, kind="stable").astype(np.int32)
+        self.sorted_keys = keys[self.key_order]
+
+        # Table (N, 8) des numéros des voisins, -1 si absent, puis compactage en CSR
+        table = np.full((N, len(NEIGHBOR_OFFSETS)), -1, dtype=np.int32)
+        for k, (di, dj) in enumerate(NEIGHBOR_OFFSETS):
+            present = self.bitmap[y + dj, x + di]
+            nkeys = (x[present] + di).astype(np.int64) * h + (y[present] + dj)
+            table[present, k] = self.key_order[np.searchsorted(self.sorted_keys, nkeys)]
+        mask = table >= 0
+        self.indptr = np.zeros(N + 1, dtype=np.int32)
+        np.cumsum(mask.sum(axis=1), out=self.indptr[1:])
+        self.indices = table[mask]
+
+    def labels(self):
+        """
+            Retourne le label (voir neighborhood.py) de chaque point, dans l'ordre de self.points,
+            calculé en une passe sur la carte d'occupation
+        """
+        x = self.coords[:, 0] - self.origin[0]
+        y = self.coords[:, 1] - self.origin[1]
+        return neighborhood.classify(self.bitmap)[y, x]
+
+    def contains(self, p):
+        """
+            Retourne True ssi le point p = (i,j) appartient au squelette, en O(1)
+        """
+        x, y = p[0] - self.origin[0], p[1] - self.origin[1]
+        h, w = self.bitmap.shape
+        return 0 <= x < w and 0 <= y < h and bool(self.bitmap[y, x])
+
+    def plot(self, batched=True):
         """ 
-            Afficher les points du squelette sur une fenetre Matplotlib 
+            Afficher les points du squelette sur une fenetre Matplotlib, en une seule image
+            superposée (voir render.tracer_squelette()), ou point par point si batched=False
         """
+        # Matplotlib n'est chargé que pour afficher
+        if batched:
+            import render
+            render.tracer_squelette(self)
+            return
+        import matplotlib.pyplot as plt
+
         # Parcourir les points du squelette et les afficher
         for p in self.points:
             plt.scatter(p[0], p[1], s=1.5, linewidths=0.5, color="black")
@@ -49,43 +138,59 @@ class Skeleton:
             Complexité : O(N) affectations
             N = nb de points
         """
-        new_points = []
-        for point in self.points:
-            i, j = point[0], point[1]
-            if not ((i-1, j) in self.points and (i, j-1) in self.points):
-                new_points.append(point)
-        self.points = new_points
+        # On retire les points dont le voisin de gauche et celui du dessus sont dans le squelette
+        keep = (self.labels() & neighborhood.REDUNDANT) == 0
+        self.points = [p for p, k in zip(self.points, keep.tolist()) if k]
+        self.build_index()
 
-    def get_neighbors(self, p, excludeDiag=False, excludeThose=[]):
+    def get_neighbors(self, p, excludeDiag=False, excludeThose=()):
         """
             Retourner les voisins d'un point p = (i,j) qui se trouvent sur une case adjacente, qui ne sont pas 
-            diagonaux ssi excludeDiag=True et qui ne sont pas dans la liste à exclure
+            diagonaux ssi excludeDiag=True et qui ne sont pas dans la collection à exclure
+            (de préférence un set pour que le test d'exclusion soit en O(1))
         """
+        if instrumentation.ACTIF:
+            instrumentation.compter("neighbor_lookups")
         i, j = p[0], p[1]
-        if excludeDiag:
-            return [
-                (i+di, j+dj) for di in [-1,0,1] for dj in [-1,0,1] 
-                if (di, dj) != (0, 0) and abs(di) != abs(dj) and (i+di, j+dj) in self.points
-                and (i+di, j+dj) not in excludeThose
-            ]
-        else:
+        x, y = i - self.origin[0], j - self.origin[1]
+        h, w = self.bitmap.shape
+
+        # Hors de l'intérieur de la carte d'occupation on vérifie chaque voisin
+        if not (0 < x < w-1 and 0 < y < h-1):
             return [
-                (i+di, j+dj) for di in [-1,0,1] for dj in [-1,0,1] 
-                if (di, dj) != (0,0) and (i+di, j+dj) in self.points
+                (i+di, j+dj) for di, dj in NEIGHBOR_OFFSETS
+                if not (excludeDiag and abs(di) == abs(dj)) and self.contains((i+di, j+dj))
                 and (i+di, j+dj) not in excludeThose
             ]
 
-    def get_branching_points(self, point_adja):
+        bitmap = self.bitmap
+        return [
+            (i+di, j+dj) for di, dj in NEIGHBOR_OFFSETS
+            if bitmap[y+dj, x+di] and not (excludeDiag and abs(di) == abs(dj))
+            and (i+di, j+dj) not in excludeThose
+        ]
+
+    def neighbors_of(self, k):
+        """
+            Retourne les numéros des voisins du point numéro k, dans l'ordre de get_neighbors()
+        """
+        if instrumentation.ACTIF:
+            instrumentation.compter("neighbor_lookups")
+        return self.indices[self.indptr[k]:self.indptr[k+1]]
+
+    def get_branching_points(self, point_adja, batched=True, check=False, steps=10, dist_max=3):
         """
             Detecter les points de ramification du squelette, c'est-à-dire les points en
             lesquels une branche vient se séparer en deux. On parcourt tous les points du squelette.
+            batched=True sonde les candidats avec probe_junctions(), sinon avec la boucle
+            point par point probe_junctions_loop(). check=True calcule les deux et leve
+            une RuntimeError s'ils ne donnent pas les mêmes candidats.
+            steps, dist_max: nombre de pas des marcheurs et distance minimale entre leurs
+            arrivées (voir probe_junctions()), en pixels
             ---
             Complexité : O(N)
             N = nb de points
         """
-        # Liste qui contient les points pouvant être des ramifications du squelette
-        branching_points_candidates = []
-
         # Liste a retourner qui contient les points exacts de ramification
         branching_points = []
 
@@ -93,6 +198,85 @@ class Skeleton:
         for p in point_adja : 
             branching_points.append(p)
 
+        # Liste qui contient les points pouvant être des ramifications du squelette
+        if batched:
+            branching_points_candidates = self.probe_junctions(steps, dist_max)
+        else:
+            branching_points_candidates = self.probe_junctions_loop(steps, dist_max)
+        if check:
+            other = self.probe_junctions_loop(steps, dist_max) if batched else self.probe_junctions(steps, dist_max)
+            if other != branching_points_candidates:
+                raise RuntimeError(
+                    "Sondage vectorisé et boucle point par point différents : "
+                    + str(set(other) ^ set(branching_points_candidates))
+                )
+
+        # Un candidat est un point de ramification si, parmi les 3 vecteurs qu'il forme avec
+        # ses 3 voisins, 2 forment un angle de même mesure : c'est la classe JUNCTION_SYMMETRIC
+        # de la table des voisinages
+        if branching_points_candidates:
+            x, y = (np.array(branching_points_candidates) - self.origin).T
+            roles = neighborhood.classify(self.bitmap)[y, x] & neighborhood.ROLE_MASK
+            for p, role in zip(branching_points_candidates, roles.tolist()):
+                if role == neighborhood.JUNCTION_SYMMETRIC:
+                    branching_points.append(p)
+
+        self.branching_points = branching_points
+        self.branching_set.clear()
+        self.branching_set.update(branching_points)
+
+    def probe_junctions(self, steps=10, dist_max=3):
+        """
+            Retourne la liste des candidats points de ramification : les points à exactement
+            3 voisins tels que les 3 marcheurs partis de ces voisins, qui avancent steps fois
+            vers leur voisin le plus éloigné du point de depart, arrivent à des points
+            distants deux à deux d'au moins dist_max.
+            Tous les marcheurs du squelette avancent ensemble, une étape = quelques
+            opérations sur des tableaux. Même résultat que probe_junctions_loop().
+            ---
+            Complexité : O(N + steps * C)
+            N = nb de points, C = nb de points à 3 voisins
+        """
+        degree = np.diff(self.indptr)
+        candidates = np.nonzero(degree == 3)[0]
+        if len(candidates) == 0:
+            return []
+
+        # Table (N, 8) des voisins de chaque point, complétée par -1
+        N = len(self.coords)
+        table = np.full((N, len(NEIGHBOR_OFFSETS)), -1, dtype=np.int32)
+        rows = np.repeat(np.arange(N), degree)
+        table[rows, np.arange(len(self.indices)) - self.indptr[rows]] = self.indices
+
+        # 3 marcheurs par candidat, partant de chacun de ses voisins
+        current = table[candidates, :3].ravel()
+        origin = np.repeat(self.coords[candidates].astype(np.int64), 3, axis=0)
+        walkers = np.arange(len(current))
+        for k in range(steps):
+            # Distance au carré (entière, donc comparaisons exactes) de chaque voisin
+            # au point de depart, -1 pour les cases vides pour que argmax les ignore
+            neighbors = table[current]
+            d = self.coords[neighbors].astype(np.int64) - origin[:, None, :]
+            d = np.where(neighbors >= 0, (d**2).sum(axis=2), -1)
+            current = neighbors[walkers, np.argmax(d, axis=1)]
+        instrumentation.compter("neighbor_lookups", steps * len(walkers))
+
+        # Les 3 points d'arrivée doivent être distants deux à deux d'au moins dist_max
+        arrivals = self.coords[current].astype(np.int64).reshape(-1, 3, 2)
+        far = np.ones(len(candidates), dtype=bool)
+        for u, v in [(0, 1), (1, 2), (2, 0)]:
+            far &= ((arrivals[:, u] - arrivals[:, v])**2).sum(axis=1) >= dist_max**2
+        return [self.points[k] for k in candidates[far].tolist()]
+
+    def probe_junctions_loop(self, steps=10, dist_max=3):
+        """
+            Version point par point de probe_junctions(), conservée comme référence
+            ---
+            Complexité : O(N * steps)
+            N = nb de points
+        """
+        branching_points_candidates = []
+
         # Pour chaque point du squelette
         for point in self.points:
 
@@ -101,7 +285,7 @@ class Skeleton:
             if nb_neighbors == 3:
 
                 # Stocker dans une liste les points d'arrivees
-                # de chaque trajectoire apres 10 iterations
+                # de chaque trajectoire apres steps iterations
                 arrivals = []
 
                 # Recuperer les voisins du point de depart
@@ -113,15 +297,15 @@ class Skeleton:
                     # On définit le point courant
                     p_current = n
 
-                    # On effectue 10 itérations pour s'eloigner du point de depart
+                    # On effectue steps itérations pour s'eloigner du point de depart
                     # en se deplacant a chaque fois au point le plus eloigné du point de depart
-                    for k in range(10):
+                    for k in range(steps):
 
                         # Recuperer les voisins du voisin du point de depart
                         neighbors_2nd = self.get_neighbors(p_current)
 
                         # Parmis ses voisins, choisir celui qui est le plus éloigné du point
-                        # de départ pour recommencer jusqu'à avoir avancé 10 fois
+                        # de départ pour recommencer jusqu'à avoir avancé steps fois
                         distances = np.linalg.norm(np.array(neighbors_2nd) - np.array(point), axis=1)
                         index_max = np.argmax(distances)
                         p_current = neighbors_2nd[index_max]
@@ -132,7 +316,6 @@ class Skeleton:
                 # Verifier que dans la liste des points d'arrivees on ait pas deux points qui sont
                 # tres proches. Si c'est le cas ils sont sur la meme branche et donc le point que l'on
                 # regarde ne peut pas etre un point de ramification
-                dist_max = 3
                 new_arrivals = []
                 for k, x in enumerate(arrivals):
                     close_points = [
@@ -148,39 +331,44 @@ class Skeleton:
                 if len(new_arrivals) == 3:
                     branching_points_candidates.append(point)
 
-        # Pour chaque candidat pouvant être un point de ramification
-        for p in branching_points_candidates:
-
-            # On recupere ses voisins
-            neighbors = self.get_neighbors(p)
-
-            # On calcule les 3 vecteurs que le candidat forme avec ses 3 voisins
-            u0 = np.array(neighbors[0]) - np.array(p)
-            u1 = np.array(neighbors[1]) - np.array(p)
-            u2 = np.array(neighbors[2]) - np.array(p)
+        return branching_points_candidates
 
-            # Calculer les 3 angles formés par u0, u1 et u2
-            angle_u0u1 = np.arccos(1 - cosine(u0, u1))
-            angle_u1u2 = np.arccos(1 - cosine(u1, u2))
-            angle_u2u0 = np.arccos(1 - cosine(u2, u0))
-
-            # On verifie si parmi ces 3 vecteurs, on en a 2 qui forment un angle de même mesure,
-            # si oui alors p est un point de ramification et on l'ajoute a la liste
-            if len(set([angle_u0u1, angle_u1u2, angle_u2u0])) < 3:
-                branching_points.append(p)
-
-        self.branching_points = branching_points
-
-
-    def segmentation(self):
+    def segmentation(self, method="walk", check=False):
         """
             Parcourir les branches du squelette en partant des points de ramification.
             Les branches sont stockées dans une liste d'instances de la classe Branch.
             Doit être appelée apres la detection des points de ramification.
+            method="walk" suit chaque branche pas à pas vers le voisin le plus éloigné,
+            method="index" fait le même parcours, plus vite, sur les tableaux de l'index
+            (segmentation_index()). check=True calcule les deux et leve une RuntimeError
+            s'ils ne donnent pas les mêmes branches.
             ---
             Complexité : O(N)
             N = nb de points
         """
+        if check:
+            debut = len(self.branches)
+            self.segmentation(method)
+            branches = self.branches[debut:]
+            del self.branches[debut:]
+            self.segmentation("index" if method == "walk" else "walk")
+            other = self.branches[debut:]
+            self.branches[debut:] = branches
+            if [b.points for b in other] != [b.points for b in branches]:
+                raise RuntimeError(
+                    "Segmentations walk et index différentes : "
+                    + str({tuple(b.points) for b in other} ^ {tuple(b.points) for b in branches})
+                )
+            return
+
+        if method == "index":
+            return self.segmentation_index()
+        elif method != "walk":
+            raise ValueError("Méthode de segmentation inconnue : " + str(method))
+
+        # Points des branches déjà trouvées, complété à chaque nouvelle branche
+        visited = {p for branch in self.branches for p in branch.points}
+
         # Pour chaque point de ramification
         for branching_point in self.branching_points:
 
@@ -193,17 +381,14 @@ class Skeleton:
                 # On regarde si ce voisin est déjà dans une des autres branches du squelette
                 # Si oui on passe à la branche suivante pour ne pas repasser sur une branche
                 # qu'on a déjà parcouru
-                already_visited = False
-                for branch in self.branches:
-                    if n in branch.points:
-                        already_visited = True
-                if already_visited:
+                if n in visited:
                     continue
 
                 # On stocke les points de la branche dans cette liste
                 # Le premier point de la branche est le point de ramification courant
                 # Le deuxieme est le voisin qu'on regarde
                 br_points = [branching_point]
+                br_visited = {branching_point}
                 
                 # On enregistre le point courant
                 p_current = n
@@ -223,15 +408,16 @@ class Skeleton:
                 while end_branch == False:
 
                     # Si on est arrivé à un point de ramification on s'arrete et on l'ajoute a la liste
-                    if p_current in self.branching_points:
+                    if p_current in self.branching_set:
                         br_points.append(p_current)
                         break
                     
                     # Ajouter le point courant à la liste des points de la branche
                     br_points.append(p_current)
+                    br_visited.add(p_current)
                     
                     # On recupere les voisins du point_courant en excluant ceux qu'on a déjà visité
-                    neighbors_2nd = self.get_neighbors(p_current, excludeThose=br_points)
+                    neighbors_2nd = self.get_neighbors(p_current, excludeThose=br_visited)
 
                     # Si on ne trouve plus de voisins, on est arrivé à la fin de la branche
                     if len(neighbors_2nd) == 0:
@@ -241,7 +427,7 @@ class Skeleton:
                         # si c'est le cas il devient le prochain point courant et la boucle s'arretera
                         neighbor_found = False
                         for p in neighbors_2nd:
-                            if p in self.branching_points:
+                            if p in self.branching_set:
                                 p_previous = p_current
                                 p_current = p
                                 neighbor_found = True
@@ -272,154 +458,310 @@ class Skeleton:
                 # branch = Branch(br_points, self.branching_points)
                 # self.branches.append(branch)
                 if (len(br_points) > 5):
-                    branch = Branch(br_points, self.branching_points)
+                    branch = Branch(br_points, self.branching_set)
                     self.branches.append(branch)
+                    visited.update(br_points)
+
+    def segmentation_index(self):
+        """
+            Parcours de method="walk" sur les tableaux de l'index plutôt que sur des tuples :
+            un booléen par numéro de point pour les points de ramification, la table des
+            voisins CSR et des distances entières au carré. On avance vers le voisin non visité
+            le plus éloigné du point de ramification de départ pendant les 4 premiers pas, puis
+            du point précédent, et on s'arrete sur un point de ramification ou au bout de la
+            branche. Les points des branches gardées sont marqués dans un tableau des points
+            visités, les points de la branche en cours par le numéro de la branche (le tableau
+            n'est jamais remis à zéro).
+            Donne les mêmes branches, dans le même ordre, que method="walk" (voir
+            segmentation(check=True)). Un étiquetage des arcs en composantes connexes, une
+            fois les points de ramification retirés, ne le permet pas : il garde les coins des
+            marches d'escalier que le parcours saute en diagonale, et ne coupe pas les arcs
+            aux embranchements qui ne sont pas des points de ramification.
+            ---
+            Complexité : O(N)
+            N = nb de points
+        """
+        h, w = self.bitmap.shape
+        ox, oy = self.origin
+
+        # Carte des points de ramification (dans la boite englobante), puis un booléen par point
+        junctions = np.zeros_like(self.bitmap)
+        for (i, j) in self.branching_set:
+            if 0 <= i - ox < w and 0 <= j - oy < h:
+                junctions[j - oy, i - ox] = True
+        is_junction = junctions[self.coords[:, 1] - oy, self.coords[:, 0] - ox].tolist()
+
+        N = len(self.coords)
+        visited = bytearray(N)
+        marks = [0] * N
+        mark = 0
+        coords = self.coords.tolist()
+        indptr, indices = self.indptr.tolist(), self.indices.tolist()
+
+        for branching_point in self.branching_points:
+            start = self.index_of(branching_point)
+            bx, by = branching_point
+            for n in self.get_neighbors(branching_point):
+
+                # Un voisin déjà dans une branche, ou qui est lui-même un point de ramification
+                # (branche de 2 points), ne forme pas de nouvelle branche
+                k = self.index_of(n)
+                if visited[k] or is_junction[k]:
+                    continue
+                mark += 1
+                if start >= 0:
+                    marks[start] = mark
+
+                path = []
+                px, py = bx, by
+                iteration_counter = 1
+                while True:
+                    path.append(k)
+                    marks[k] = mark
+                    neighbors = [l for l in indices[indptr[k]:indptr[k+1]] if marks[l] != mark]
+                    if not neighbors:
+                        break
+
+                    # Le dernier voisin qui est un point de ramification termine la branche
+                    junction = -1
+                    for l in neighbors:
+                        if is_junction[l]:
+                            junction = l
+                    if junction >= 0:
+                        path.append(junction)
+                        break
+
+                    # Sinon le premier voisin le plus éloigné du point de départ (4 premiers pas)
+                    # ou du point précédent
+                    cx, cy = (bx, by) if iteration_counter < 5 else (px, py)
+                    farthest, d_max = -1, -1
+                    for l in neighbors:
+                        lx, ly = coords[l]
+                        d = (lx - cx)**2 + (ly - cy)**2
+                        if d > d_max:
+                            farthest, d_max = l, d
+                    px, py = coords[k]
+                    k = farthest
+                    iteration_counter += 1
+
+                if len(path) + 1 > 5:
+                    for l in path:
+                        visited[l] = 1
+                    self.branches.append(Branch([branching_point] + [self.points[l] for l in path], self.branching_set))
+
+    def index_of(self, p):
+        """
+            Retourne le numéro du point p = (i,j) dans self.points, -1 s'il n'y est pas
+        """
+        if not self.contains(p):
+            return -1
+        key = (p[0] - self.origin[0]) * self.bitmap.shape[0] + (p[1] - self.origin[1])
+        return int(self.key_order[np.searchsorted(self.sorted_keys, key)])
+
+    def least_square_approximation(self, degree=8):
+        """
+            Calcule en un seul appel les approximations aux moindres carrés de toutes les
+            branches (voir lsq.LeastSquaresConstraintsBatch), équivalent à appeler
+            Branch.least_square_approximation() sur chacune
+        """
+        cf = lsq.LeastSquaresConstraintsBatch([b.points for b in self.branches], degree)
+        for branch, c in zip(self.branches, cf):
+            branch.lsqcfx, branch.lsqcfy = c[:, 0:1], c[:, 1:2]
+
+        # Coefficients de toutes les branches, sans les multiplicateurs : (B, degree+1, 2)
+        self.lsqcf = cf[:, :-2]
+
+    def measure_length(self):
+        """
+            Calcule la longueur de toutes les branches (voir Branch.measure_length()) en évaluant
+            toutes les courbes en un seul produit matriciel.
+            Doit être appelée après least_square_approximation().
+        """
+        if not self.branches:
+            return
+        pt = lsq.evaluate_curves(self.lsqcf, 300)
+        d = np.gradient(pt, axis=1)
+        lengths = np.around(np.sum(np.sqrt(np.sum(d**2, axis=2)), axis=1), decimals=2)
+        for branch, length in zip(self.branches, lengths):
+            branch.length = length
+            logger.debug("Longueur: %s", branch.length)
+
+    def measure_average_thickness(self, image, mode="rays", samples=10, bilinear=False, plot_trace=False):
+        """
+            Calcule l'épaisseur moyenne de toutes les branches. Doit être appelée après
+            least_square_approximation(). Prend l'image binaire en entrée.
+            mode="rays" : Branch.measure_average_thickness() sur chaque branche (10 points),
+                plot_trace=True trace les mesures de toutes les branches à la fois (voir
+                render.tracer_epaisseurs())
+            mode="distance" : une seule carte des distances pour l'image, lue aux "samples"
+                points de chaque courbe pour toutes les branches à la fois (au pixel le plus proche
+                ou par interpolation bilinéaire). Au centre d'une branche de largeur w la distance
+                au fond vaut (w+1)/2, la mesure 2*distance est donc celle du comptage de pixels
+                de part et d'autre de la courbe (le point central compté deux fois).
+                Les mesures aberrantes sont retirées de la même manière (trimmed_mean).
+                La carte n'est calculée que sur la boite englobante des pixels blancs.
+        """
+        if mode == "rays":
+            for branch in self.branches:
+                branch.measure_average_thickness(image)
+            if plot_trace:
+                import render
+                render.tracer_epaisseurs(self, image)
+            return
+        elif mode != "distance":
+            raise ValueError("Mode de mesure de l'épaisseur inconnu : " + str(mode))
+        if not self.branches:
+            return
+
+        # La marge noire de la boite donne les mêmes distances que sur l'image entière
+        boite = boite_englobante(image)
+        if boite is None:
+            return
+        x0, y0, x1, y1 = boite
+        dist = distance_map(image[y0:y1, x0:x1])
+        pts = lsq.evaluate_curves(self.lsqcf, samples) - (x0, y0)
+        measurements = 2 * sample_distance_map(dist, pts, bilinear)
+        branching_set = self.branching_set
+        for branch, m in zip(self.branches, measurements):
+            # On retire le premier point (point de ramification) et le dernier si la branche
+            # se termine par un point de ramification
+            m = m[1:-1] if branch.end in branching_set else m[1:]
+            thickness = trimmed_mean(m)
+            if thickness is not None:
+                branch.thickness = thickness
+                logger.debug("Epaisseur: %s", branch.thickness)
+
+    def relier_centre(self, point_adja):
+        """
+            Relie au centre du noyau toutes les branches qui partent d'un point adjacent au noyau,
+            les segments sont tracés en un seul appel (voir Branch.relier_centre())
+        """
+        adjacent = set(point_adja)
+        attached = [b for b in self.branches if b.start in adjacent]
+        lines = segments_pixels([b.start for b in attached], [self.soma] * len(attached))
+        for branch, line in zip(attached, lines):
+            branch.line = line
+            branch.centre = 1
 
     def remplacement_des_points(self,point_adjacent): 
         """
         Supprime les points adjacents de la liste des points de ramification et ajoute le centre
         """
-        i=0 
-        while i<len(self.branching_points) : 
-            if self.branching_points[i] in point_adjacent :
-                self.branching_points.remove(self.branching_points[i])
-            else : 
-                i=i+1
-
+        adjacent = set(point_adjacent)
+        self.branching_points[:] = [p for p in self.branching_points if p not in adjacent]
         self.branching_points.append(tuple(self.soma))
+
+        self.branching_set.difference_update(adjacent)
+        self.branching_set.add(tuple(self.soma))
             
-    def to_graph(self):
+    def deplacer(self, decalage):
         """
-            Retourne un graphe représentant le neurone dont les sommets sont les ramifications
-            et les arêtes sont les branches
+            Translate de decalage = (dx, dy) toutes les coordonnées du squelette mesuré : points,
+            index, ramifications, centre, branches (points, segment vers le centre et
+            coefficients des approximations), graphe et branche principale. Sert à ramener
+            dans l'image entière un squelette calculé dans une partie de l'image
         """
-        # Créer une instance de graphe
-        G = nx.Graph()
+        dx, dy = int(decalage[0]), int(decalage[1])
+        if dx == 0 and dy == 0:
+            return
+
+        def d(p):
+            return (p[0] + dx, p[1] + dy)
+
+        # Les clés de l'index sont relatives à l'origine, seules les coordonnées changent
+        self.points = [d(p) for p in self.points]
+        self.coords = self.coords + np.array((dx, dy), dtype=np.int32)
+        self.origin = self.origin + np.array((dx, dy), dtype=self.origin.dtype)
+        self.branching_points[:] = [d(p) for p in self.branching_points]
+        # L'ensemble des ramifications est partagé avec les branches
+        ramifications = [d(p) for p in self.branching_set]
+        self.branching_set.clear()
+        self.branching_set.update(ramifications)
+        self.soma = np.array(d(self.soma))
 
-        # Recuperer les points de terminaison des branches qui ne sont
-        # pas des points de ramification
-        ending_points = []
         for branch in self.branches:
-            if not branch.is_branching_out():
-                ending_points.append(branch.end)
-
-        # Ajouter les sommets dans le graphe c'est-à-dire
-        # (points de ramifications + points de terminaison)
-        G.add_nodes_from(self.branching_points + ending_points)
-
-        # Pour chaque branche on récupère le point de départ et d'arrivée
-        # de manière à construire la liste des arêtes
-        edges_list = []
-        for b in self.branches:
-            if b.centre == 1 : #si la branche part du centre alors on ajoute le centre en point de départ 
-                edges_list.append(
-                    (tuple(self.soma), b.end, {'thickness': b.thickness, 'length': b.length})
-                )
-            else :
-                edges_list.append(
-                    (b.start, b.end, {'thickness': b.thickness, 'length': b.length})
-                )
+            branch.points = [d(p) for p in branch.points]
+            branch.start, branch.end = branch.points[0], branch.points[-1]
+            branch.line = branch.line + np.array((dx, dy), dtype=branch.line.dtype)
+            # Le coefficient constant est le premier (T_0 = 1 dans la base de Chebyshev)
+            if branch.lsqcfx is not None:
+                branch.lsqcfx, branch.lsqcfy = branch.lsqcfx.copy(), branch.lsqcfy.copy()
+                branch.lsqcfx[0] += dx
+                branch.lsqcfy[0] += dy
+        if self.lsqcf is not None:
+            self.lsqcf = self.lsqcf.copy()
+            self.lsqcf[:, 0] += (dx, dy)
+
+        if self.tree is not None:
+            self.tree.nodes = self.tree.nodes + np.array((dx, dy), dtype=np.int32)
+        self._G = None
+        self.main_paths = [(longueur, [d(p) for p in chemin]) for longueur, chemin in self.main_paths]
+        self.main_branch = [(d(a), d(b)) for a, b in self.main_branch]
 
-        # Ajouter les arêtes dans le graphe
-        G.add_edges_from(edges_list)
-
-        # Calcul de la profondeur de chaque noeud
-        depth = nx.shortest_path_length(G, source=tuple(self.soma))
-
-        # Création d'un dictionnaire pour stocker la profondeur de chaque arête
-        edge_depth = {}
-        for u, v in G.edges():
-            if depth[u] < depth[v]:
-                edge_depth[(u, v)] = depth[v]
-            else:
-                edge_depth[(u, v)] = depth[u]
-
-        # parcours des arêtes
-        for edge in G.edges():
-            u, v = edge[0], edge[1]
-            d = edge_depth[u, v]
-            nx.set_edge_attributes(G, {(u, v): {"depth": d}})
-
-        self.G = G
-    
-    def get_main_branch(self):
-        """
-            Retourne la liste des branches qui forment la branche
-            principale, c'est-à-dire le chemin le plus long de G
-        """
-        # Creer un graphe H = G tel que H est pondéré uniquement par length
-        H = nx.Graph()
-        new_edges = []
-        for (u, v, l) in self.G.edges.data('length'):
-            new_edges.append((u, v, l))
-            
-        # Ajout des arêtes pondérées au graphe
-        H.add_weighted_edges_from(new_edges)
-
-        edges_list = []
-        for edge in H.edges.data():
-            edges_list.append((edge[0], edge[1], edge[2]['weight']))
-        # print(edges_list)
-
-        # Recuperer tous les chemins partant du soma vers les autres sommets
-        paths = []
-        for node in list(H.nodes):
-            paths.append(nx.bellman_ford_path(self.G, tuple(self.soma), node, weight='weight'))
-        # print(paths)
-
-        # Pour chaque chemin calculer la somme des poids des branches
-        weighted_paths = []
-        for path in paths:
-
-            # Somme totale des poids
-            sum_weight = 0
-
-            # On récupère le point de départ et d'arrivée du chemin
-            a, b = path[0], path[-1]
-
-            # Pour chaque noeud du chemin
-            for node_indice in range(0, len(path)-1):
-                x = path[node_indice]
-                y = path[node_indice+1]
-                weight = H.get_edge_data(x, y)['weight']
-                sum_weight += weight
-            weighted_paths.append((a, b, sum_weight))
-
-        # Détecter si H possède un cycle
-        cycle = True
-        try:
-            nx.find_cycle(H, orientation="original")
-        except nx.exception.NetworkXNoCycle:
-            cycle = False
-
-        # Si H ne possède pas de cycles
-        if cycle == False:
-
-            # Recuperer la branche principale
-            max_path = max(weighted_paths, key=lambda path: path[2])
-            main_branch_edges = nx.dijkstra_path(H, max_path[0], max_path[1])
-
-            # Stocker la branche principale
-            for i in range(0, len(main_branch_edges)-1):
-                self.main_branch.append((main_branch_edges[i], main_branch_edges[i+1]))
-
-    def save_as_csv(self, name):
+    def to_graph(self):
         """
-            Enregistrer les caractéristiques de chaque branches 
-            dans un fichier csv spécifié en entrée
+            Construit le graphe représentant le neurone dont les sommets sont les ramifications
+            et les arêtes sont les branches, sous la forme compacte d'un NeuronTree rempli en
+            une passe (tableaux des sommets, des arêtes et de leurs longueur, épaisseur et
+            profondeur). La version networkx est disponible par self.G
         """
-        filename = "outputs/" + name.split('.')[0] + "-graph.csv"
-        with open(filename, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Source', 'Target', 'Length', 'Thickness', 'Depth'])
-            for edge in self.G.edges(data=True):
-                source = edge[0]
-                target = edge[1]
-                length = edge[2].get('length', '')
-                width = edge[2].get('thickness', '')
-                depth = edge[2].get('depth', '')
-                writer.writerow([source, target, length, width, depth])
+        self.tree = NeuronTree.from_branches(self.branches, self.soma, self.branching_points, self.branching_set)
+        self._G = None
+        return self.tree
 
+    @property
+    def G(self):
+        """
+            networkx.Graph du neurone, construit à partir de self.tree au premier accès
+        """
+        if self._G is None and self.tree is not None:
+            self._G = self.tree.to_networkx()
+        return self._G
 
+    def longest_paths(self, k=1):
+        """
+            Retourne les k plus longs chemins du graphe partant du soma, sous forme de liste
+            [(longueur, [sommets (x, y) du chemin])] triée par longueur décroissante.
+            Les chemins suivent l'arbre du parcours en largeur depuis le soma (les chemins les
+            plus courts en nombre de branches), les arêtes qui ferment un cycle et les sommets
+            qui ne sont pas reliés au soma sont ignorés (voir NeuronTree.longest_paths()).
+        """
+        nodes = [tuple(p) for p in self.tree.nodes.tolist()]
+        return [(length, [nodes[n] for n in path.tolist()]) for length, path in self.tree.longest_paths(k)]
 
-    
+    def get_main_branch(self, k=1):
+        """
+            Calcule la branche principale, c'est-à-dire le plus long chemin du graphe partant du
+            soma, et la stocke sous forme de liste d'arêtes dans self.main_branch.
+            Les k plus longs chemins (voir longest_paths) sont gardés dans self.main_paths
+        """
+        self.main_paths = self.longest_paths(k)
+        self.main_branch = []
+        if self.main_paths:
+            _, path = self.main_paths[0]
+            self.main_branch = list(zip(path[:-1], path[1:]))
+        return self.main_branch
+
+    def save_as_csv(self, name, dossier="outputs"):
+        """
+            Enregistrer les caractéristiques de chaque branches 
+            dans un fichier csv spécifié en entrée, placé dans le dossier donné
+            (une ligne par arête du graphe G, dans l'ordre de G.edges)
+        """
+        with instrumentation.etape("export"):
+            os.makedirs(dossier, exist_ok=True)
+            filename = os.path.join(dossier, name.split('.')[0] + "-graph.csv")
+            with open(filename, 'w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(['Source', 'Target', 'Length', 'Thickness', 'Depth'])
+                for source, target, length, width, depth in self.tree.graph_edge_rows():
+                    writer.writerow([source, target, length, width, depth])
+        return filename
+
+    def save_as_swc(self, name, dossier="outputs"):
+        """
+            Enregistrer l'arbre du neurone au format SWC (voir export.save_as_swc())
+            dans le dossier donné
+        """
+        with instrumentation.etape("export"):
+            return export.save_as_swc(self, os.path.join(dossier, name.split('.')[0] + ".swc"))
@@ -0,0 +1,147 @@
+import cv2
+import numpy as np
+
+class NoyauNonDetecte(IndexError):
+    """
+        Aucun noyau détecté dans l'image binaire (seuil trop élevé). Hérite d'IndexError, que
+        levait find_noyau() auparavant ; toute autre IndexError est une erreur du programme
+    """
+
+def facteur_reduction(rayon):
+    """
+        Facteur de réduction de l'image pour l'ouverture de rayon "rayon" : la plus grande
+        puissance de 2 qui laisse un rayon d'au moins 8 pixels. En dessous, le disque réduit est trop
+        grossier : le noyau se déplace sur les parties épaisses des prolongements.
+        Leve ValueError si le rayon n'est pas strictement positif
+    """
+    if not rayon > 0:
+        raise ValueError("Le rayon du noyau doit être strictement positif : %r" % (rayon,))
+    return 2 ** max(0, int(np.floor(np.log2(rayon / 8))))
+
+def _ouverture(img, rayon, facteur):
+    """
+        Ouverture de rayon "rayon" de l'image binaire, calculée sur l'image réduite d'un facteur
+        "facteur" (voir find_noyau()). Retourne le facteur, la distance au fond de l'image
+        réduite, les composantes connexes de l'ouverture et leurs statistiques
+        (cv2.connectedComponentsWithStats). Leve NoyauNonDetecte si l'ouverture est vide
+    """
+    if facteur is None:
+        facteur = facteur_reduction(rayon)
+    h, w = img.shape
+
+    # Image réduite : chaque pixel est la moyenne d'un bloc facteur x facteur (les derniers
+    # pixels qui ne forment pas un bloc entier sont ignorés), la réduction d'une partie de
+    # l'image alignée sur les blocs est donc la partie correspondante de l'image réduite
+    hr, wr = max(1, h // facteur), max(1, w // facteur)
+    petite = cv2.resize(img[:hr * facteur, :wr * facteur], (wr, hr), interpolation=cv2.INTER_AREA) >= 128
+    r = rayon / facteur
+
+    # Erosion : les pixels à plus de r du fond
+    dist = cv2.distanceTransform(petite.astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_5)
+    coeur = dist > r
+    if not coeur.any():
+        raise NoyauNonDetecte("Aucun noyau détecté")
+
+    # Dilatation : les pixels à moins de r du coeur
+    dist_coeur = cv2.distanceTransform((~coeur).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_5)
+    opening = (dist_coeur <= r).astype(np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(opening, connectivity=8)
+    return facteur, dist, labels, stats
+
+def _noyau(img, labels, stats, k, facteur):
+    """
+        Masque booléen du noyau k (composante de l'ouverture) à la résolution de l'image,
+        dans sa boite englobante élargie d'un pixel pour l'anneau. Retourne l'origine (x0, y0)
+        de la boite et le masque
+    """
+    h, w = img.shape
+    sx0, sy0, sw, sh = stats[k, :4]
+    bx0, by0 = sx0 * facteur, sy0 * facteur
+    bx1, by1 = min(w, (sx0 + sw) * facteur), min(h, (sy0 + sh) * facteur)
+    x0, y0, x1, y1 = max(0, bx0 - 1), max(0, by0 - 1), min(w, bx1 + 1), min(h, by1 + 1)
+
+    # Masque du noyau dans la boite : la composante agrandie, restreinte aux pixels blancs de l'image
+    composante = (labels[sy0:sy0+sh, sx0:sx0+sw] == k).astype(np.uint8)
+    composante = cv2.resize(composante, (sw * facteur, sh * facteur), interpolation=cv2.INTER_NEAREST)
+    noyau = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    noyau[by0-y0:by1-y0, bx0-x0:bx1-x0] = composante[:by1-by0, :bx1-bx0].astype(bool)
+    noyau &= img[y0:y1, x0:x1] == 255
+    return (int(x0), int(y0)), noyau
+
+def find_noyau(img, skel, rayon=18, facteur=None):
+    """
+    A partir d'une image binarisée et de son squelette : trouve son noyau, retourne son centre, les points adjacents au noyau
+     du squelette et le squelette sans les points à l'intérieur du noyau.
+    Le noyau est la partie de l'image qui reste après une ouverture de rayon "rayon" (une érosion puis une dilatation
+    par un disque). Elle est calculée avec deux transformées en distance sur l'image réduite d'un facteur "facteur"
+    (par défaut la plus grande puissance de 2 qui laisse un rayon d'au moins 8 pixels), puis ramenée à la
+    résolution de l'image dans la boite englobante du noyau seulement.
+    Parmi les morceaux qui restent on garde celui qui contient le point le plus épais de l'image.
+    Leve NoyauNonDetecte si aucun noyau n'est trouvé (seuil trop élevé)
+    """
+    facteur, dist, labels, stats = _ouverture(img, rayon, facteur)
+
+    # Le noyau est la composante connexe qui contient le maximum de la distance au fond
+    k = labels[np.unravel_index(np.argmax(dist), dist.shape)]
+    origine, noyau = _noyau(img, labels, stats, k, facteur)
+    if not noyau.any():
+        raise NoyauNonDetecte("Aucun noyau détecté")
+    return adjacents(skel, origine, noyau)
+
+def find_noyaux(img, rayon=18, facteur=None):
+    """
+        Trouve tous les noyaux de l'image binarisée : chaque morceau qui reste après l'ouverture
+        de rayon "rayon" (voir find_noyau()) est un noyau. Retourne la liste des triplets
+        (origine, masque, epaisseur) des noyaux (voir _noyau()), epaisseur étant la plus grande
+        distance au fond dans le noyau, du plus épais au moins épais : le premier est celui que
+        garde find_noyau().
+        Leve NoyauNonDetecte si aucun noyau n'est trouvé (seuil trop élevé)
+    """
+    facteur, dist, labels, stats = _ouverture(img, rayon, facteur)
+
+    # Epaisseur de chaque noyau : le maximum de la distance au fond dans sa composante
+    epaisseurs = np.zeros(len(stats), dtype=np.float32)
+    np.maximum.at(epaisseurs, labels.ravel(), dist.ravel())
+    noyaux = []
+    for k in sorted(range(1, len(stats)), key=lambda k: -epaisseurs[k]):
+        origine, noyau = _noyau(img, labels, stats, k, facteur)
+        if noyau.any():
+            noyaux.append((origine, noyau, float(epaisseurs[k]) * facteur))
+    if not noyaux:
+        raise NoyauNonDetecte("Aucun noyau détecté")
+    return noyaux
+
+def adjacents(skel, origine, noyau):
+    """
+        Pour un noyau donné par l'origine (x0, y0) et le masque booléen de sa boite englobante
+        (élargie d'un pixel) : retourne son centre, le squelette sans les points à l'intérieur
+        du noyau et les points du squelette adjacents au noyau
+    """
+    x0, y0 = origine
+    y1, x1 = y0 + noyau.shape[0], x0 + noyau.shape[1]
+
+    # Calculer le centroïde
+    M = cv2.moments(noyau.astype(np.uint8), binaryImage=True)
+    centroid_x = int(M['m10'] / M['m00']) + x0
+    centroid_y = int(M['m01'] / M['m00']) + y0
+    centre=np.array((centroid_x,centroid_y))
+
+    #Retire les points du squelette qui sont dans le noyau
+    output = skel.copy()
+    output[y0:y1, x0:x1][noyau] = 0
+
+    #Cherche les points du squelette dans l'anneau d'un pixel autour du noyau
+    anneau = cv2.dilate(noyau.astype(np.uint8), np.ones((3, 3), np.uint8)).astype(bool) & ~noyau
+    adjacent = (anneau & (output[y0:y1, x0:x1] == 255)).astype(np.uint8)
+
+    #On regroupe les points adjacents distants d'au plus 2 pixels : une dilatation par un carré 2x2
+    #fait se toucher (en 8-connexité) exactement les points distants d'au plus 2 pixels en x et en y
+    _, groupes = cv2.connectedComponents(cv2.dilate(adjacent, np.ones((2, 2), np.uint8)), connectivity=8)
+
+    #On garde un point par groupe : le premier dans l'ordre des lignes de l'image
+    ys, xs = np.nonzero(adjacent)
+    _, premiers = np.unique(groupes[ys, xs], return_index=True)
+    premiers.sort()
+    unique_adjacent_pixel = list(zip((xs[premiers] + x0).tolist(), (ys[premiers] + y0).tolist()))
+
+    return centre, output, unique_adjacent_pixel
@@ -0,0 +1,258 @@
+"""
+    Chaine de traitement en flux : traiter_flux() prend une suite d'images (fichiers d'un
+    dossier, pages d'une pile TIFF, images déjà en mémoire, sortie d'une caméra...) et produit
+    au fur et à mesure un résultat compact par image (graphe, mesures des branches, branche
+    principale, durées des étapes), dans l'ordre des images.
+    Les étapes tournent dans des threads reliés par des files de taille bornée :
+    lecture -> flou, seuillage et squelettisation (OpenCV) -> noyau, branches et mesures.
+    Les étapes de deux images qui se suivent se recouvrent (OpenCV et une partie de numpy
+    libèrent le GIL), l'étape OpenCV, la plus longue sur les grandes images, peut avoir
+    plusieurs threads, et seules quelques images sont en mémoire à la fois, quelle que soit la
+    longueur de la suite : la lecture attend quand les files sont pleines, ou quand trop
+    d'images lues n'ont pas encore été produites (une image lente bloque celles qui la suivent).
+    instrumentation.py ne suit qu'une étape à la fois, elle ne doit pas être activée pendant
+    un traitement en flux.
+
+    Exemple :
+        for resultat in traiter_flux(sources(["images/"]), 10):
+            print(resultat["image"], resultat["statut"], resultat["principale"])
+"""
+import queue, threading, time
+
+import numpy as np
+import cv2
+
+import pipeline
+import tiff
+from soma import NoyauNonDetecte
+
+# Fin de la suite d'images
+_FIN = object()
+
+class _Echec:
+    """
+        Erreur levée par la suite d'images elle-même, relancée dans le générateur
+    """
+
+    def __init__(self, exception):
+        self.exception = exception
+
+def sources(entrees, toutes_pages=False):
+    """
+        Suite des images désignées par des dossiers, des motifs glob ou des chemins de
+        fichiers (voir batch.lister_images()), sous forme de paires (chemin, page) lues par
+        traiter_flux() au moment de leur traitement. toutes_pages: toutes les pages des
+        fichiers TIFF multi-pages, la première sinon
+    """
+    from batch import lister_images
+
+    for chemin in lister_images(entrees):
+        for page in range(pipeline.nombre_pages(chemin) if toutes_pages else 1):
+            yield chemin, page
+
+def pages_tiff(chemin):
+    """
+        Suite des pages d'une pile TIFF, lues une à une (voir tiff.PageTiff)
+    """
+    for page in tiff.pages_tiff(chemin):
+        yield "%s[%d]" % (chemin, page.index), page
+
+def _mettre(file, element, arret):
+    """
+        Ajoute l'élément à la file en attendant qu'elle ait de la place, sauf si le
+        traitement est arrêté. Retourne False si le traitement est arrêté
+    """
+    while not arret.is_set():
+        try:
+            file.put(element, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _lire(element, k):
+    """
+        Nom, page et image (niveaux de gris 8 bits) d'un élément de la suite : une image,
+        une paire (nom, image), un chemin, une paire (chemin, page) ou une page TIFF
+    """
+    if isinstance(element, np.ndarray):
+        return str(k), 0, element
+    if isinstance(element, str):
+        return element, 0, pipeline.charger_image(element)
+    nom, valeur = element
+    if isinstance(valeur, (int, np.integer)):
+        return nom, int(valeur), pipeline.charger_image(nom, int(valeur))
+    if isinstance(valeur, tiff.PageTiff):
+        return nom, valeur.index, valeur.lire()
+    if valeur.ndim == 3:
+        valeur = cv2.cvtColor(valeur, cv2.COLOR_BGR2GRAY)
+    return nom, 0, valeur
+
+def _lecture(images, sortie, arret, fenetre):
+    """
+        Thread de lecture des images de la suite. Chaque image lue prend une place de la
+        fenêtre (threading.Semaphore), rendue quand son résultat est produit
+    """
+    try:
+        for k, element in enumerate(images):
+            while not fenetre.acquire(timeout=0.1):
+                if arret.is_set():
+                    return
+            debut = time.perf_counter()
+            resultat = {"_rang": k, "image": str(k), "page": 0, "statut": None, "tree": None, "principale": 0.0,
+                        "chemin": np.zeros((0, 2), dtype=np.int32), "branches": 0, "durees": {}}
+            try:
+                resultat["image"], resultat["page"], resultat["_image"] = _lire(element, k)
+            except Exception as e:
+                resultat["statut"], resultat["message"] = "erreur", repr(e)
+            resultat["durees"]["lecture"] = time.perf_counter() - debut
+            if not _mettre(sortie, resultat, arret):
+                return
+    except Exception as e:
+        _mettre(sortie, _Echec(e), arret)
+        return
+    _mettre(sortie, _FIN, arret)
+
+def _terminal(element):
+    """
+        True si l'élément marque la fin de la suite d'images (normale ou sur une erreur)
+    """
+    return element is _FIN or isinstance(element, _Echec)
+
+class _Fin:
+    """
+        Nombre de threads d'une étape qui n'ont pas encore vu la fin de la suite
+    """
+
+    def __init__(self, threads):
+        self.restants = threads
+        self.verrou = threading.Lock()
+
+    def dernier(self):
+        with self.verrou:
+            self.restants -= 1
+            return self.restants == 0
+
+def _etape(nom, fonction, entree, sortie, arret, fin):
+    """
+        Thread d'une étape : applique fonction(resultat) à chaque image qui n'a pas échoué
+        et la transmet à l'étape suivante. Quand l'étape a plusieurs threads, chacun remet la
+        fin de la suite dans la file pour les autres, et le dernier la transmet : elle arrive
+        à l'étape suivante après toutes les images
+    """
+    while not arret.is_set():
+        try:
+            resultat = entree.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if _terminal(resultat):
+            if fin.dernier():
+                _mettre(sortie, resultat, arret)
+            else:
+                _mettre(entree, resultat, arret)
+            return
+        if resultat["statut"] is None:
+            debut = time.perf_counter()
+            try:
+                fonction(resultat)
+            except NoyauNonDetecte:
+                resultat["statut"] = "echec"
+                resultat["message"] = "Seuil trop élevé: le noyau n'a pas été détecté"
+            except Exception as e:
+                resultat["statut"], resultat["message"] = "erreur", repr(e)
+            resultat["durees"][nom] = time.perf_counter() - debut
+        if not _mettre(sortie, resultat, arret):
+            return
+
+def traiter_flux(images, threshold, taille=(500, 500), kernel_size=11, segmentation="walk", thickness="rays",
+                 rayon=18, graphe=True, file=2, ouvriers=1, pas=10, dist_max=3):
+    """
+        Traite la suite d'images et produit un résultat par image, dans l'ordre de la suite.
+        images: itérable d'images en niveaux de gris, de paires (nom, image), de chemins, de
+            paires (chemin, page) (voir sources()) ou de paires (nom, tiff.PageTiff)
+            (voir pages_tiff())
+        taille: taille de redimensionnement (None : résolution d'origine)
+        kernel_size, rayon, pas, dist_max: tailles en pixels de la chaine (voir
+            pipeline.traiter_image() et scale.Echelle.options())
+        file: nombre d'images en attente entre deux étapes (au plus 3 * file + ouvriers + 1
+            images lues et pas encore produites)
+        ouvriers: nombre de threads de l'étape de flou, seuillage et squelettisation (utile
+            sur plusieurs coeurs quand elle est la plus longue, les résultats restent dans
+            l'ordre des images)
+        Chaque résultat est un dictionnaire :
+            image, page: nom et page de l'image
+            statut: "ok", "echec" si le noyau n'a pas été détecté ou "erreur" (avec "message")
+            tree: graphe du neurone (NeuronTree, ses tableaux length, thickness et depth sont
+                les mesures des branches), None sans graphe
+            principale: longueur de la branche principale
+            chemin: np.array (N, 2) des sommets (x, y) de la branche principale
+            branches: nombre de branches
+            durees: durée de chaque étape en secondes (lecture, squelettisation, mesures)
+        Arrêter l'itération (break, ou fermeture du générateur) arrête les threads, une
+        lecture en cours dans la suite d'images n'est pas interrompue
+    """
+    def squelettiser(resultat):
+        image = resultat.pop("_image")
+        if taille is not None:
+            image = pipeline.pretraitement(image, taille, kernel_size)
+        else:
+            image = pipeline.flouter(image, kernel_size)
+        binaire = pipeline.binariser(image, threshold)
+        # Les étapes suivantes travaillent sur la boite englobante des pixels blancs
+        boite = pipeline.recadrer_image(binaire, rayon)
+        if boite is None:
+            raise NoyauNonDetecte("Aucun noyau détecté")
+        x0, y0, x1, y1 = resultat["_boite"] = boite
+        resultat["_binaire"] = binaire[y0:y1, x0:x1]
+        resultat["_squelette"] = cv2.ximgproc.thinning(resultat["_binaire"])
+
+    def mesurer(resultat):
+        binaire, squelette = resultat.pop("_binaire"), resultat.pop("_squelette")
+        skeleton, point_adja = pipeline.squelettiser(binaire, segmentation, squelette, rayon, pas, dist_max,
+                                                     recadrer=False)
+        pipeline.mesurer(skeleton, binaire, point_adja, graphe, thickness=thickness)
+        skeleton.deplacer(resultat["_boite"][:2])
+        resultat["tree"] = skeleton.tree
+        resultat["branches"] = len(skeleton.branches)
+        if skeleton.main_paths:
+            longueur, chemin = skeleton.main_paths[0]
+            resultat["principale"], resultat["chemin"] = longueur, np.array(chemin, dtype=np.int32)
+        resultat["statut"] = "ok"
+
+    arret = threading.Event()
+    files = [queue.Queue(maxsize=file) for _ in range(3)]
+    # Images lues et pas encore produites : celles des files et des threads des étapes. Les
+    # résultats qui attendent une image précédente plus lente en font partie
+    fenetre = threading.Semaphore(3 * file + ouvriers + 1)
+    threads = [threading.Thread(target=_lecture, args=(images, files[0], arret, fenetre), daemon=True)]
+    fin = _Fin(ouvriers)
+    threads += [threading.Thread(target=_etape, args=("squelettisation", squelettiser, files[0], files[1], arret, fin),
+                                 daemon=True) for _ in range(ouvriers)]
+    threads.append(threading.Thread(target=_etape, args=("mesures", mesurer, files[1], files[2], arret, _Fin(1)),
+                                    daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # Les images qui arrivent avant une image précédente attendent leur tour, au plus la
+    # taille de la fenêtre
+    en_avance, suivante = {}, 0
+    try:
+        while True:
+            resultat = files[2].get()
+            if resultat is _FIN:
+                return
+            if isinstance(resultat, _Echec):
+                raise resultat.exception
+            en_avance[resultat["_rang"]] = resultat
+            while suivante in en_avance:
+                resultat = en_avance.pop(suivante)
+                suivante += 1
+                fenetre.release()
+                for cle in ("_rang", "_image", "_binaire", "_squelette", "_boite"):
+                    resultat.pop(cle, None)
+                resultat["durees"] = {nom: round(d, 6) for nom, d in resultat["durees"].items()}
+                yield resultat
+    finally:
+        arret.set()
+        for thread in threads:
+            thread.join(timeout=1.0)
@@ -0,0 +1,125 @@
+"""
+    Balayage des seuils de binarisation : chaque image est lue et floutée une seule fois dans
+    un processus d'un pool, qui enchaine ensuite seuillage -> squelettisation -> noyau -> graphe
+    pour chacun de ses seuils. Le résultat est une table (une ligne par image et par seuil)
+    avec le nombre de branches, la longueur totale, la longueur de la branche principale et
+    le statut du traitement, pour choisir les seuils de tout un jeu d'images en une fois.
+
+    Exemple :
+        python sweep.py images/ --range 5 40 5 --output seuils.csv
+        python sweep.py images/test5.png --thresholds 8 10 12 15
+"""
+import argparse, csv, os, time
+from multiprocessing import Pool
+
+import numpy as np
+
+import pipeline
+from batch import lister_images
+from soma import NoyauNonDetecte
+
+COLONNES = ["image", "threshold", "statut", "branches", "longueur_totale", "branche_principale", "duree"]
+
+def evaluer_seuil(tache):
+    """
+        Traite l'image floutée avec un seuil dans un processus du pool et retourne la ligne
+        de la table (statut "ok", "echec" si le noyau n'a pas été détecté ou "erreur")
+    """
+    nom, image, threshold, options = tache
+    debut = time.time()
+    ligne = {"image": nom, "threshold": threshold}
+    try:
+        binaire = pipeline.binariser(image, threshold)
+        skeleton, point_adja = pipeline.squelettiser(binaire, options["segmentation"])
+        pipeline.mesurer(skeleton, binaire, point_adja, thickness=options["thickness"])
+        ligne["statut"] = "ok"
+        ligne["branches"] = len(skeleton.branches)
+        ligne["longueur_totale"] = round(float(sum(b.length for b in skeleton.branches)), 2)
+        ligne["branche_principale"] = round(skeleton.main_paths[0][0], 2) if skeleton.main_paths else 0.0
+    except NoyauNonDetecte:
+        ligne["statut"] = "echec"
+    except Exception as e:
+        ligne["statut"] = "erreur"
+        ligne["message"] = repr(e)
+    ligne["duree"] = round(time.time() - debut, 3)
+    return ligne
+
+def evaluer_image(tache):
+    """
+        Lit et floute l'image dans un processus du pool, puis évalue chacun des seuils sur
+        l'image floutée. Retourne les lignes de la table, dans l'ordre des seuils
+    """
+    chemin, thresholds, taille, kernel_size, options = tache
+    image = pipeline.pretraitement(pipeline.charger_image(chemin), taille, kernel_size)
+    return [evaluer_seuil((chemin, image, t, options)) for t in thresholds]
+
+def balayer(chemins, thresholds, taille=(500, 500), kernel_size=11, processes=None, segmentation="walk",
+            thickness="rays"):
+    """
+        Evalue tous les seuils sur chaque image et retourne la table des résultats, triée
+        par image puis par seuil
+    """
+    options = {"segmentation": segmentation, "thickness": thickness}
+    thresholds = [float(t) for t in thresholds]
+    processes = processes or os.cpu_count()
+    # Une tâche par image ; avec moins d'images que de processus, les seuils de chaque image
+    # sont répartis en plusieurs tâches qui floutent chacune l'image une fois
+    parts = max(1, min(len(thresholds), -(-processes // max(1, len(chemins)))))
+    taches = (
+        (chemin, seuils.tolist(), taille, kernel_size, options)
+        for chemin in chemins for seuils in np.array_split(thresholds, parts) if len(seuils)
+    )
+
+    with Pool(processes) as pool:
+        return [ligne for lignes in pool.imap(evaluer_image, taches) for ligne in lignes]
+
+def afficher(table):
+    """
+        Affiche la table en colonnes alignées
+    """
+    lignes = [COLONNES] + [[str(ligne.get(c, "")) for c in COLONNES] for ligne in table]
+    largeurs = [max(len(l[k]) for l in lignes) for k in range(len(COLONNES))]
+    for l in lignes:
+        print("  ".join(v.rjust(n) for v, n in zip(l, largeurs)))
+
+def enregistrer(table, chemin):
+    """
+        Enregistre la table dans un fichier csv
+    """
+    with open(chemin, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=COLONNES + ["message"], restval="")
+        writer.writeheader()
+        writer.writerows(table)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Balayage des seuils de binarisation")
+    parser.add_argument("inputs", nargs="+", help="dossiers, motifs glob ou fichiers images")
+    seuils = parser.add_mutually_exclusive_group(required=True)
+    seuils.add_argument("--thresholds", type=float, nargs="+", help="liste des seuils")
+    seuils.add_argument("--range", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="seuils de START à STOP inclus par pas de STEP")
+    parser.add_argument("--processes", type=int, default=None, help="nombre de processus")
+    parser.add_argument("--output", default=None, help="fichier csv de la table")
+    parser.add_argument("--size", type=int, nargs=2, default=(500, 500), metavar=("W", "H"),
+                        help="taille de redimensionnement des images")
+    parser.add_argument("--kernel-size", type=int, default=11, help="taille impaire du flou gaussien")
+    parser.add_argument("--segmentation", choices=["walk", "index"], default="walk",
+                        help="méthode de segmentation des branches")
+    parser.add_argument("--thickness", choices=["rays", "distance"], default="rays",
+                        help="mode de mesure de l'épaisseur des branches")
+    args = parser.parse_args(argv)
+
+    if args.range:
+        debut, fin, pas = args.range
+        thresholds = np.round(np.arange(debut, fin + pas / 2, pas), 6).tolist()
+    else:
+        thresholds = args.thresholds
+
+    table = balayer(lister_images(args.inputs), thresholds, tuple(args.size), args.kernel_size,
+                    args.processes, args.segmentation, args.thickness)
+    afficher(table)
+    if args.output:
+        enregistrer(table, args.output)
+
+if __name__ == '__main__':
+    main()
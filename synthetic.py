@@ -0,0 +1,227 @@
+"""
+    Génération d'images de neurones synthétiques dont l'arbre est connu : un noyau (disque)
+    d'où partent des prolongements courbes d'épaisseur constante, dont certains se ramifient
+    une fois. L'image est floutée et bruitée comme une acquisition, et la vérité terrain
+    (centre et rayon du noyau, points, longueur et épaisseur de chaque branche entre deux
+    noeuds du graphe) permet de vérifier les mesures de la chaine de traitement.
+    Une même graine donne toujours la même image.
+
+    Exemple :
+        image, verite = generer_neurone((1000, 1000), branches=8, graine=3)
+        skeleton = ...  # chaine de pipeline.py avec verite.seuil et verite.rayon_ouverture
+        print(comparer(skeleton, verite))
+"""
+import numpy as np
+import cv2
+
+class Verite:
+    """
+        Vérité terrain d'un neurone synthétique
+        centre: centre (x, y) du noyau
+        rayon: rayon du noyau en pixels
+        seuil: seuil de binarisation à mi-hauteur entre le fond et le neurone
+        rayon_ouverture: rayon à donner à find_noyau() pour ce noyau
+        aretes: une entrée par branche du graphe, {"points": tableau (N, 2) des points (x, y)
+            de la ligne centrale, "longueur", "epaisseur", "parent": indice de l'arête dont elle
+            part, -1 pour une branche qui part du noyau}
+    """
+
+    def __init__(self, centre, rayon, seuil, rayon_ouverture):
+        self.centre = centre
+        self.rayon = rayon
+        self.seuil = seuil
+        self.rayon_ouverture = rayon_ouverture
+        self.aretes = []
+
+    def ajouter(self, points, epaisseur, parent=-1):
+        """
+            Ajoute une branche (ligne centrale "points") et retourne son indice
+        """
+        longueur = float(np.sum(np.linalg.norm(np.diff(points, axis=0), axis=1)))
+        self.aretes.append({"points": points, "longueur": longueur, "epaisseur": float(epaisseur),
+                            "parent": parent})
+        return len(self.aretes) - 1
+
+    def longueur_principale(self):
+        """
+            Longueur du plus long chemin du noyau à une extrémité
+        """
+        cumul = []
+        for arete in self.aretes:
+            depart = cumul[arete["parent"]] if arete["parent"] >= 0 else 0.0
+            cumul.append(depart + arete["longueur"])
+        return max(cumul, default=0.0)
+
+    def resume(self):
+        """
+            Description de la vérité terrain sans les points (pour un fichier json)
+        """
+        return {"centre": [int(v) for v in self.centre], "rayon": self.rayon, "branches": len(self.aretes),
+                "longueur_totale": round(sum(a["longueur"] for a in self.aretes), 2),
+                "longueur_principale": round(self.longueur_principale(), 2)}
+
+def _courbe(depart, angle, longueur, amplitude, periode, phase, droit=0.0):
+    """
+        Points (x, y) espacés d'un pixel d'une courbe partant de "depart" dans la direction
+        "angle", dont la direction oscille de "amplitude" radians autour de l'angle de départ.
+        Les "droit" premiers pixels sont en ligne droite
+    """
+    s = np.arange(int(longueur) + 1, dtype=np.float64)
+    t = np.maximum(0.0, s - droit)
+    direction = angle + amplitude * (np.sin(2 * np.pi * t / periode + phase) - np.sin(phase))
+    pas = np.stack((np.cos(direction), np.sin(direction)), axis=1)
+    points = np.empty((len(s), 2))
+    points[0] = depart
+    points[1:] = depart + np.cumsum(pas[:-1], axis=0)
+    return points
+
+def _libre(occupe, points, marge):
+    """
+        True si tous les points sont dans l'image, à plus de "marge" pixels du bord, et
+        en dehors des zones déjà occupées
+    """
+    h, w = occupe.shape
+    x, y = points[:, 0], points[:, 1]
+    if x.min() < marge or y.min() < marge or x.max() >= w - marge or y.max() >= h - marge:
+        return False
+    return not occupe[np.rint(y).astype(int), np.rint(x).astype(int)].any()
+
+def _impaire(rng, a, b):
+    """
+        Entier impair tiré uniformément entre a et b
+    """
+    return 2 * int(rng.integers((a - 1) // 2, (b - 1) // 2 + 1)) + 1
+
+def _tracer(masque, points, epaisseur):
+    """
+        Trace la ligne d'épaisseur impaire "epaisseur" (cv2.polylines trace un trait
+        d'épaisseur t sur t+2 pixels)
+    """
+    cv2.polylines(masque, [np.rint(points).astype(np.int32).reshape(-1, 1, 2)], False, 255,
+                  thickness=max(1, int(epaisseur) - 2), lineType=cv2.LINE_8)
+
+def generer_neurone(taille=(500, 500), branches=6, ramifications=0.5, longueur=(0.22, 0.42),
+                    epaisseur=(5, 9), rayon_soma=None, bruit=8.0, fond=20, contraste=180, graine=0):
+    """
+        Génère l'image (niveaux de gris 8 bits, de dimensions taille = (w, h)) d'un neurone
+        au centre de l'image, et sa vérité terrain (voir Verite).
+        branches: nombre de prolongements qui partent du noyau
+        ramifications: probabilité qu'un prolongement se ramifie
+        longueur: longueurs minimale et maximale d'un prolongement, en fraction du plus petit
+            côté de l'image (depuis le centre du noyau)
+        epaisseur: épaisseurs minimale et maximale des prolongements en pixels, les épaisseurs
+            tirées sont impaires pour que le trait soit centré sur la ligne
+        rayon_soma: rayon du noyau en pixels (par défaut 6% du plus petit côté, au moins 20)
+        bruit: écart-type du bruit gaussien ajouté à l'image
+        Les prolongements qui sortiraient de l'image ou en toucheraient un autre sont tirés
+        à nouveau, et abandonnés après quelques essais : la vérité terrain peut donc avoir
+        moins de branches que demandé quand la place manque
+    """
+    rng = np.random.default_rng(graine)
+    w, h = taille
+    cote = min(w, h)
+    rayon = int(rayon_soma or max(20, round(0.06 * cote)))
+    centre = np.array((w // 2, h // 2))
+    verite = Verite((int(centre[0]), int(centre[1])), rayon, fond + contraste / 2, max(4, round(0.6 * rayon)))
+
+    masque = np.zeros((h, w), dtype=np.uint8)
+    cv2.circle(masque, (int(centre[0]), int(centre[1])), rayon, 255, -1)
+    # Zones interdites : les branches déjà tracées, élargies pour que le flou ne les relie pas
+    occupe = np.zeros((h, w), dtype=np.uint8)
+    ecart = 12
+    bord = epaisseur[1] + ecart
+
+    angles = 2 * np.pi * (np.arange(branches) + rng.uniform(-0.2, 0.2, branches)) / branches + rng.uniform(0, 2 * np.pi)
+    for angle in angles:
+        for _ in range(10):
+            L = rng.uniform(*longueur) * cote
+            e = _impaire(rng, epaisseur[0], epaisseur[1])
+            points = _courbe(centre, angle, L, rng.uniform(0.1, 0.35), rng.uniform(0.5, 1.2) * L,
+                             rng.uniform(0, 2 * np.pi), droit=rayon)
+            if _libre(occupe, points[rayon + ecart:], bord):
+                break
+        else:
+            continue
+
+        # Point de ramification éventuel, loin du noyau et de l'extrémité
+        enfant = None
+        if rng.random() < ramifications:
+            for _ in range(10):
+                k = int(rng.uniform(0.4, 0.7) * (len(points) - 1))
+                if k - rayon < 3 * ecart:
+                    break
+                direction = points[k] - points[k - 1]
+                a = np.arctan2(direction[1], direction[0]) + rng.choice((-1, 1)) * rng.uniform(0.5, 0.9)
+                Lc = rng.uniform(0.3, 0.6) * (len(points) - 1 - rayon)
+                ec = _impaire(rng, epaisseur[0], e)
+                branche = _courbe(points[k], a, Lc, rng.uniform(0.05, 0.25), rng.uniform(0.5, 1.2) * Lc,
+                                  rng.uniform(0, 2 * np.pi))
+                loin = branche[3 * ecart:]
+                if (len(loin) and _libre(occupe, loin, bord)
+                        and np.linalg.norm(loin[:, None] - points[None, rayon:], axis=2).min() > e + ecart):
+                    enfant = (k, branche, ec)
+                    break
+
+        # Les branches du graphe commencent au bord du noyau
+        _tracer(masque, points, e)
+        cv2.polylines(occupe, [np.rint(points[rayon:]).astype(np.int32).reshape(-1, 1, 2)], False, 1,
+                      thickness=int(e + 2 * ecart))
+        if enfant is None:
+            verite.ajouter(points[rayon:], e)
+        else:
+            k, branche, ec = enfant
+            tronc = verite.ajouter(points[rayon:k + 1], e)
+            verite.ajouter(points[k:], e, tronc)
+            verite.ajouter(branche, ec, tronc)
+            _tracer(masque, branche, ec)
+            cv2.polylines(occupe, [np.rint(branche).astype(np.int32).reshape(-1, 1, 2)], False, 1,
+                          thickness=int(ec + 2 * ecart))
+
+    # Bords adoucis (flou) et bruit d'acquisition
+    image = cv2.GaussianBlur(masque.astype(np.float32) / 255, (0, 0), 1.0) * contraste + fond
+    image += rng.normal(0, bruit, image.shape).astype(np.float32)
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8), verite
+
+def comparer(skeleton, verite, tolerance=None):
+    """
+        Compare les branches mesurées du squelette (après pipeline.mesurer()) à la vérité
+        terrain. Chaque branche de la vérité est associée à au plus une branche mesurée dont
+        les extrémités sont à moins de "tolerance" pixels des siennes (par défaut le rayon
+        du noyau), en minimisant la somme des distances.
+        Retourne le nombre de branches de chaque côté et associées, les écarts relatifs moyen
+        et maximal des longueurs, les écarts moyen et maximal des épaisseurs (en pixels) et
+        l'écart relatif de la longueur de la branche principale
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    if tolerance is None:
+        tolerance = verite.rayon
+    aretes = verite.aretes
+    mesurees = skeleton.branches
+    resultat = {"branches_verite": len(aretes), "branches_mesurees": len(mesurees), "associees": 0}
+    if aretes and mesurees:
+        debuts = np.array([a["points"][0] for a in aretes])
+        fins = np.array([a["points"][-1] for a in aretes])
+        d = np.array([b.start for b in mesurees], dtype=np.float64)
+        f = np.array([b.end for b in mesurees], dtype=np.float64)
+
+        def distance(p, q):
+            return np.linalg.norm(p[:, None] - q[None], axis=2)
+
+        # Une branche mesurée peut être parcourue dans un sens ou dans l'autre
+        cout = np.minimum(distance(debuts, d) + distance(fins, f), distance(debuts, f) + distance(fins, d))
+        lignes, colonnes = linear_sum_assignment(cout)
+        paires = [(i, j) for i, j in zip(lignes, colonnes) if cout[i, j] <= 2 * tolerance]
+        if paires:
+            longueurs = np.array([abs(float(mesurees[j].length) - aretes[i]["longueur"]) / aretes[i]["longueur"]
+                                  for i, j in paires])
+            epaisseurs = np.array([abs(float(mesurees[j].thickness) - aretes[i]["epaisseur"]) for i, j in paires])
+            resultat.update(associees=len(paires),
+                            erreur_longueur=round(float(longueurs.mean()), 4),
+                            erreur_longueur_max=round(float(longueurs.max()), 4),
+                            erreur_epaisseur=round(float(epaisseurs.mean()), 3),
+                            erreur_epaisseur_max=round(float(epaisseurs.max()), 3))
+    if skeleton.main_paths and verite.aretes:
+        principale = verite.longueur_principale()
+        resultat["erreur_principale"] = round(abs(skeleton.main_paths[0][0] - principale) / principale, 4)
+    return resultat
@@ -0,0 +1,8 @@
+"""
+    Les modules du projet sont à la racine du dépôt : elle est ajoutée au chemin des imports
+    pour lancer les tests depuis n'importe quel dossier (python -m pytest tests)
+"""
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MPLBACKEND", "Agg")
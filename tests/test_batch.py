@@ -0,0 +1,82 @@
+"""
+    Statut des images traitées par lots (batch.traiter) : un noyau non détecté est un échec
+    définitif, une autre erreur (IndexError comprise) est retraitée à la reprise. Manifeste
+    écrit au fil du lot avec un jeu de données (export.Dataset)
+"""
+import json
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+import batch
+import export
+import pipeline
+from synthetic import generer_neurone
+
+@pytest.fixture(scope="module")
+def neurone(tmp_path_factory):
+    image, verite = generer_neurone((300, 300), 6, graine=2)
+    chemin = str(tmp_path_factory.mktemp("lot") / "neurone.png")
+    cv2.imwrite(chemin, image)
+    return chemin, verite
+
+def traiter(chemin, seuil, dossier):
+    return batch.traiter((chemin, 0, seuil, str(dossier), {"taille": None}))
+
+def test_ok(neurone, tmp_path):
+    chemin, verite = neurone
+    entree = traiter(chemin, verite.seuil, tmp_path)
+    assert entree["statut"] == "ok", entree.get("message")
+    assert entree["branches"] > 0
+    assert not batch.a_refaire(entree, verite.seuil)
+
+def test_noyau_non_detecte(neurone, tmp_path):
+    chemin, _ = neurone
+    entree = traiter(chemin, 255, tmp_path)
+    assert entree["statut"] == "echec"
+    assert not batch.a_refaire(entree, 255)
+
+def test_index_error_du_programme(neurone, tmp_path, monkeypatch):
+    chemin, verite = neurone
+
+    def erreur(*args, **kwargs):
+        return [][0]
+    monkeypatch.setattr(pipeline, "mesurer", erreur)
+    entree = traiter(chemin, verite.seuil, tmp_path)
+    assert entree["statut"] == "erreur"
+    assert "IndexError" in entree["message"]
+    assert batch.a_refaire(entree, verite.seuil)
+
+def test_manifeste_et_jeu_de_donnees(neurone, tmp_path, monkeypatch):
+    chemin, verite = neurone
+    images = tmp_path / "images"
+    images.mkdir()
+    for k in range(5):
+        shutil.copy(chemin, str(images / ("neurone%d.png" % k)))
+    cv2.imwrite(str(images / "vide.png"), np.zeros((300, 300), np.uint8))
+
+    # Etat du manifeste et du jeu de données à chaque écriture du jeu de données
+    manifeste, dossier = tmp_path / "manifest.jsonl", str(tmp_path / "dataset")
+    etats = []
+    ecrire = export.Dataset.ecrire
+
+    def ecrire_et_noter(donnees):
+        chemin = ecrire(donnees)
+        if chemin is not None:
+            ok = [e for e in batch.lire_manifeste(str(manifeste)).values() if e["statut"] == "ok"]
+            etats.append((len(ok), len(export.Dataset(dossier).lire()["images"])))
+        return chemin
+    monkeypatch.setattr(export.Dataset, "ecrire", ecrire_et_noter)
+
+    batch.main([str(images), "--threshold", str(verite.seuil), "--size", "300", "300", "--processes", "1",
+                "--output", str(tmp_path / "csv"), "--manifest", str(manifeste),
+                "--dataset", dossier, "--dataset-images", "2"])
+    entrees = batch.lire_manifeste(str(manifeste))
+    assert sorted(e["statut"] for e in entrees.values()) == ["echec"] + ["ok"] * 5
+    assert sorted(export.Dataset(dossier).lire()["images"]) == sorted(
+        e["image"] for e in entrees.values() if e["statut"] == "ok")
+    # Les images sont écrites deux par deux dans le jeu de données, et leurs entrées dans le
+    # manifeste juste après
+    assert etats == [(0, 2), (2, 4), (4, 5)]
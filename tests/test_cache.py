@@ -0,0 +1,166 @@
+"""
+    Cache des étapes (cache.CacheEtapes, pipeline.ChaineCache) : résultats relus ou calculés,
+    éviction des moins récemment utilisés et clés qui changent avec les paramètres
+"""
+import os
+
+import numpy as np
+import pytest
+
+import cache
+import pipeline
+from cache import CacheEtapes, cle_etape, cle_image
+from synthetic import generer_neurone
+
+class Compteur:
+    """
+        calcul() qui compte ses appels et retourne une nouvelle valeur à chaque appel
+    """
+
+    def __init__(self, valeur):
+        self.valeur = valeur
+        self.appels = 0
+
+    def __call__(self):
+        self.appels += 1
+        return {"valeur": self.valeur, "tableau": np.arange(5)}
+
+def fichiers(dossier):
+    return sorted(f for f in os.listdir(dossier) if f.endswith(".pkl"))
+
+@pytest.mark.parametrize("sur_disque", [False, True])
+def test_calcule_une_fois_puis_relit_une_copie(tmp_path, sur_disque):
+    etapes = CacheEtapes(dossier=str(tmp_path) if sur_disque else None)
+    calcul = Compteur(1)
+    assert "a" not in etapes
+    premiere = etapes.obtenir("a", calcul)
+    premiere["tableau"][0] = 99
+    assert "a" in etapes
+    seconde = etapes.obtenir("a", calcul)
+    seconde["valeur"] = 2
+    assert calcul.appels == 1
+    assert etapes.obtenir("a", calcul)["valeur"] == 1
+    assert etapes.obtenir("a", calcul)["tableau"][0] == 0
+    assert calcul.appels == 1
+
+def test_relu_sur_le_disque_dans_une_autre_session(tmp_path):
+    CacheEtapes(dossier=str(tmp_path)).obtenir("a", Compteur(1))
+    etapes = CacheEtapes(dossier=str(tmp_path))
+    assert etapes.taille_disque > 0
+    calcul = Compteur(2)
+    assert etapes.obtenir("a", calcul)["valeur"] == 1
+    assert calcul.appels == 0
+
+def test_stocker_remplace(tmp_path):
+    etapes = CacheEtapes(dossier=str(tmp_path))
+    etapes.obtenir("a", Compteur(1))
+    etapes.stocker("a", {"valeur": 2})
+    assert etapes.obtenir("a", Compteur(3))["valeur"] == 2
+    assert CacheEtapes(dossier=str(tmp_path)).obtenir("a", Compteur(3))["valeur"] == 2
+
+def test_eviction_en_memoire():
+    taille = len(cache.pickle.dumps(Compteur("a")(), protocol=cache.pickle.HIGHEST_PROTOCOL))
+    etapes = CacheEtapes(memoire=2 * taille)
+    for cle in "abc":
+        etapes.obtenir(cle, Compteur(cle))
+        if cle == "b":
+            # "a" devient la plus récemment utilisée, "b" sera évincée à sa place
+            etapes.obtenir("a", Compteur("a"))
+    assert list(etapes.entrees) == ["a", "c"]
+    assert etapes.taille_memoire == 2 * taille
+    calcul = Compteur("b")
+    etapes.obtenir("b", calcul)
+    assert calcul.appels == 1
+
+def test_eviction_sur_le_disque(tmp_path):
+    taille = len(cache.pickle.dumps(Compteur("a")(), protocol=cache.pickle.HIGHEST_PROTOCOL))
+    etapes = CacheEtapes(memoire=0, dossier=str(tmp_path), disque=2 * taille)
+    for cle in "abc":
+        etapes.obtenir(cle, Compteur(cle))
+    assert fichiers(tmp_path) == ["b.pkl", "c.pkl"]
+    assert etapes.taille_disque == 2 * taille
+    calcul = Compteur("a")
+    etapes.obtenir("a", calcul)
+    assert calcul.appels == 1
+    assert fichiers(tmp_path) == ["a.pkl", "c.pkl"]
+
+def test_vider(tmp_path):
+    etapes = CacheEtapes(dossier=str(tmp_path))
+    for cle in "ab":
+        etapes.obtenir(cle, Compteur(cle))
+    etapes.vider()
+    assert fichiers(tmp_path) == []
+    assert etapes.taille_memoire == etapes.taille_disque == 0
+    assert "a" not in etapes
+    calcul = Compteur("a")
+    etapes.obtenir("a", calcul)
+    assert calcul.appels == 1
+
+def test_cles(monkeypatch):
+    image = np.zeros((4, 5), dtype=np.uint8)
+    assert cle_image(image) == cle_image(image.copy())
+    assert cle_image(image) != cle_image(image.T.copy())
+    assert cle_image(image) != cle_image(image.astype(np.uint16))
+    image[1, 2] = 1
+    assert cle_image(image) != cle_image(np.zeros((4, 5), dtype=np.uint8))
+
+    cle = cle_etape("binariser", "parent", 10.0)
+    assert cle == cle_etape("binariser", "parent", 10.0)
+    assert cle != cle_etape("binariser", "parent", 11.0)
+    assert cle != cle_etape("binariser", "autre", 10.0)
+    assert cle != cle_etape("pretraitement", "parent", 10.0)
+    monkeypatch.setattr(cache, "VERSION", cache.VERSION + 1)
+    assert cle != cle_etape("binariser", "parent", 10.0)
+
+@pytest.fixture(scope="module")
+def neurone():
+    image, verite = generer_neurone((300, 300), 6, graine=2)
+    return image, verite
+
+def test_cles_de_la_chaine(neurone):
+    image, verite = neurone
+    etapes = CacheEtapes()
+    reference = pipeline.ChaineCache(etapes, image, verite.seuil, taille=None).cles
+
+    def cles(**params):
+        options = dict(taille=None)
+        options.update(params)
+        threshold = options.pop("threshold", verite.seuil)
+        return pipeline.ChaineCache(etapes, image, threshold, **options).cles
+
+    # Chaque paramètre ne change que les clés de son étape et des étapes suivantes
+    ordre = ["pretraitement", "binariser", "squelettiser", "mesurer"]
+    for params, etape in [
+        (dict(taille=(300, 300)), "pretraitement"), (dict(kernel_size=9), "pretraitement"),
+        (dict(threshold=verite.seuil + 1), "binariser"),
+        (dict(segmentation="index"), "squelettiser"), (dict(rayon=20), "squelettiser"),
+        (dict(pas=5), "squelettiser"), (dict(dist_max=2), "squelettiser"),
+        (dict(recadrer=False), "squelettiser"),
+        (dict(thickness="distance"), "mesurer"), (dict(graphe=False), "mesurer"),
+    ]:
+        autres = cles(**params)
+        for k, nom in enumerate(ordre):
+            assert (autres[nom] != reference[nom]) == (k >= ordre.index(etape)), (params, nom)
+
+def test_chaine_relue(neurone, monkeypatch):
+    image, verite = neurone
+    appels = []
+    for nom in ("pretraitement", "binariser", "squelettiser", "mesurer"):
+        def compter(*args, _nom=nom, _fonction=getattr(pipeline, nom), **kwargs):
+            appels.append(_nom)
+            return _fonction(*args, **kwargs)
+        monkeypatch.setattr(pipeline, nom, compter)
+
+    etapes = CacheEtapes()
+    skeleton, _ = pipeline.ChaineCache(etapes, image, verite.seuil, taille=None).mesurer()
+    # squelettiser() s'appelle elle-même sur l'image recadrée
+    assert list(dict.fromkeys(appels)) == ["pretraitement", "binariser", "squelettiser", "mesurer"]
+    del appels[:]
+    relu, _ = pipeline.ChaineCache(etapes, image, verite.seuil, taille=None).mesurer()
+    assert appels == []
+    assert len(relu.branches) == len(skeleton.branches)
+    assert relu.tree.to_networkx().edges == skeleton.tree.to_networkx().edges
+
+    # Un autre seuil relit le flou et recalcule les étapes suivantes
+    pipeline.ChaineCache(etapes, image, verite.seuil + 1, taille=None).mesurer()
+    assert list(dict.fromkeys(appels)) == ["binariser", "squelettiser", "mesurer"]
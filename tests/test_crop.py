@@ -0,0 +1,78 @@
+"""
+    Boite englobante de squelettiser() (recadrer=True) : mêmes résultats que sur l'image entière,
+    dans les coordonnées de l'image, et que sur le neurone seul déplacé à sa place (deplacer()).
+    Tailles de la chaine en µm (scale.Echelle) : mêmes mesures à deux résolutions
+"""
+import cv2
+import numpy as np
+import pytest
+
+import pipeline
+from scale import Echelle
+from soma import facteur_reduction
+from synthetic import generer_neurone
+
+@pytest.fixture(scope="module")
+def neurone():
+    image, verite = generer_neurone((600, 600), 8, graine=1)
+    return image, verite
+
+def placer(image, origine, taille=(1400, 1100)):
+    w, h = taille
+    grande = np.zeros((h, w), dtype=np.uint8)
+    x, y = origine
+    grande[y:y + image.shape[0], x:x + image.shape[1]] = image
+    return grande
+
+def analyser(image, seuil, rayon, recadrer=True):
+    binaire = pipeline.binariser(pipeline.pretraitement(image, None), seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, rayon=rayon, recadrer=recadrer)
+    pipeline.mesurer(skeleton, binaire, point_adja)
+    return skeleton, point_adja
+
+def comparer(a, b):
+    (s, pa), (t, pb) = a, b
+    assert pa == pb
+    assert tuple(s.soma) == tuple(t.soma)
+    assert s.points == t.points
+    assert np.array_equal(s.coords, t.coords)
+    assert s.branching_points == t.branching_points
+    assert [b.points for b in s.branches] == [b.points for b in t.branches]
+    assert [b.length for b in s.branches] == pytest.approx([b.length for b in t.branches], rel=1e-6)
+    assert [b.thickness for b in s.branches] == [b.thickness for b in t.branches]
+    assert np.allclose(s.lsqcf, t.lsqcf, rtol=1e-6, atol=1e-6)
+    assert np.array_equal(s.tree.nodes, t.tree.nodes)
+    assert s.main_paths[0][1] == t.main_paths[0][1]
+
+@pytest.mark.parametrize("origine", [(0, 0), (437, 211), (640, 384), (701, 399)])
+@pytest.mark.parametrize("rayon", [None, 32])
+def test_boite_englobante(neurone, origine, rayon):
+    image, verite = neurone
+    rayon = rayon or verite.rayon_ouverture
+    grande = placer(image, origine)
+    recadre = analyser(grande, verite.seuil, rayon)
+    comparer(recadre, analyser(grande, verite.seuil, rayon, recadrer=False))
+
+    # Le neurone seul, déplacé à sa place : l'image réduite de find_noyau() est la même quand
+    # l'origine est alignée sur les blocs de la réduction
+    if all(c % facteur_reduction(rayon) == 0 for c in origine):
+        seul, point_adja = analyser(image, verite.seuil, rayon)
+        seul.deplacer(origine)
+        comparer(recadre, (seul, [(x + origine[0], y + origine[1]) for x, y in point_adja]))
+
+def test_echelle(neurone):
+    image, verite = neurone
+    assert Echelle(1.0).options() == {"taille": None, "kernel_size": 11, "rayon": 18, "pas": 10, "dist_max": 3}
+    mesures = []
+    for zoom in (1, 2):
+        echelle = Echelle(1.0 / zoom, rayon_soma=verite.rayon_ouverture)
+        options = echelle.options()
+        grande = cv2.resize(image, None, fx=zoom, fy=zoom, interpolation=cv2.INTER_LINEAR)
+        binaire = pipeline.binariser(pipeline.pretraitement(grande, None, options["kernel_size"]), verite.seuil)
+        skeleton, point_adja = pipeline.squelettiser(binaire, rayon=options["rayon"], pas=options["pas"],
+                                                     dist_max=options["dist_max"])
+        pipeline.mesurer(skeleton, binaire, point_adja)
+        mesures.append((echelle.microns(skeleton.main_paths[0][0]), echelle.microns(skeleton.soma)))
+    assert mesures[1][0] == pytest.approx(mesures[0][0], rel=0.03)
+    assert np.hypot(*(mesures[1][1] - mesures[0][1])) <= 2
+    assert mesures[0][0] == pytest.approx(verite.longueur_principale(), rel=0.05)
@@ -0,0 +1,98 @@
+"""
+    Export des squelettes mesurés (export.py) : fichier SWC relu et comparé à l'arbre du
+    neurone, et jeu de données en colonnes relu après plusieurs écritures
+"""
+import numpy as np
+import pytest
+
+import export
+import pipeline
+from synthetic import generer_neurone
+
+def traiter(taille, branches, graine):
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    binaire = pipeline.binariser(pipeline.pretraitement(image, None), verite.seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, rayon=verite.rayon_ouverture)
+    pipeline.mesurer(skeleton, binaire, point_adja)
+    return skeleton
+
+def lire_swc(chemin):
+    """
+        Lignes (n, type, x, y, z, rayon, parent) d'un fichier SWC
+    """
+    lignes = []
+    with open(chemin) as f:
+        for ligne in f:
+            if ligne.startswith("#"):
+                continue
+            n, t, x, y, z, r, p = ligne.split()
+            lignes.append((int(n), int(t), float(x), float(y), float(z), float(r), int(p)))
+    return lignes
+
+@pytest.mark.parametrize("taille, branches, graine", [(300, 6, 0), (500, 12, 2), (600, 6, 3)])
+def test_swc(taille, branches, graine, tmp_path):
+    skeleton = traiter(taille, branches, graine)
+    lignes = lire_swc(skeleton.save_as_swc("neurone", str(tmp_path)))
+    assert lignes == [tuple(float(v) if k in (2, 3, 4, 5) else v for k, v in enumerate(l))
+                      for l in export.lignes_swc(skeleton)]
+
+    # Un arbre numéroté dans l'ordre, enraciné au soma
+    assert lignes[0][1:4] == (export.SWC_SOMA, *map(float, skeleton.soma))
+    assert lignes[0][6] == -1
+    for n, (numero, t, *_, parent) in enumerate(lignes[1:], 2):
+        assert numero == n and t == export.SWC_DENDRITE and 1 <= parent < n
+
+    # Les points sans enfant sont les extrémités de l'arbre, et chaque point est voisin de son parent
+    tree = skeleton.tree
+    enfants = np.bincount([l[6] for l in lignes[1:]], minlength=len(lignes) + 1)
+    feuilles = {(l[2], l[3]) for l in lignes if enfants[l[0]] == 0}
+    nb_enfants = np.bincount(tree.parent[tree.parent >= 0], minlength=len(tree.nodes))
+    assert feuilles == {tuple(map(float, tree.nodes[v])) for v in tree.order[1:] if nb_enfants[v] == 0}
+    points = {l[0]: np.array(l[2:4]) for l in lignes}
+    for l in lignes[1:]:
+        if l[6] != 1:
+            assert np.abs(points[l[0]] - points[l[6]]).max() == 1
+
+    # Les points sont ceux des branches de l'arbre, avec la moitié de l'épaisseur de la branche pour rayon
+    rayons = {}
+    for v in tree.order[1:].tolist():
+        branche = skeleton.branches[int(tree.parent_edge[v])]
+        for x, y in branche.points:
+            rayons.setdefault((float(x), float(y)), set()).add(round(float(branche.thickness) / 2, 2))
+    assert all(l[5] in rayons[l[2], l[3]] for l in lignes[1:])
+
+def test_jeu_de_donnees(tmp_path):
+    skeletons = [traiter(300, 6, 0), traiter(500, 12, 2), traiter(400, 8, 1)]
+    dossier = str(tmp_path / "dataset")
+    with export.Dataset(dossier, taille=10) as donnees:
+        for k, skeleton in enumerate(skeletons):
+            donnees.ajouter(export.colonnes(skeleton, "image%d.png" % k, k))
+    assert len(donnees.fichiers()) >= 2
+
+    tout = export.Dataset(dossier).lire()
+    assert list(tout["images"]) == ["image0.png", "image1.png", "image2.png"]
+    assert list(tout["pages"]) == [0, 1, 2]
+    k = 0
+    for i, skeleton in enumerate(skeletons):
+        for j, branche in enumerate(skeleton.branches):
+            assert tout["image"][k] == i
+            assert tout["length"][k] == pytest.approx(branche.length, rel=1e-6)
+            assert tout["thickness"][k] == pytest.approx(branche.thickness, rel=1e-6)
+            assert np.array_equal(export.points_branche(tout, k), branche.points)
+            assert np.allclose(tout["lsqcfx"][k, :skeleton.lsqcf.shape[1]], skeleton.lsqcf[j, :, 0])
+            k += 1
+    assert k == len(tout["length"])
+
+    partiel = export.Dataset(dossier).lire(["length"])
+    assert set(partiel) == {"images", "pages", "image", "length"}
+    assert np.array_equal(partiel["length"], tout["length"])
+
+def test_jeu_de_donnees_par_images(tmp_path):
+    skeleton = traiter(300, 6, 0)
+    donnees = export.Dataset(str(tmp_path), images=2)
+    ecrits = [donnees.ajouter(export.colonnes(skeleton, "image%d.png" % k)) for k in range(5)]
+    assert ecrits == [False, True, False, True, False]
+    assert len(donnees.fichiers()) == 2 and len(donnees.en_attente) == 1
+
+    donnees = export.Dataset(str(tmp_path / "delai"), delai=0)
+    assert donnees.ajouter(export.colonnes(skeleton, "image.png"))
@@ -0,0 +1,45 @@
+"""
+    Sondage vectorisé des points de ramification (Skeleton.probe_junctions()) comparé à la
+    boucle point par point d'origine (Skeleton.probe_junctions_loop())
+"""
+import os
+
+import cv2
+import pytest
+
+import pipeline
+from skeleton import Skeleton
+from soma import find_noyau
+from synthetic import generer_neurone
+
+IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images")
+
+def squelette(image, seuil, rayon):
+    """
+        Squelette simplifié et points adjacents au noyau de l'image en niveaux de gris
+    """
+    h, w = image.shape
+    binaire = pipeline.binariser(pipeline.pretraitement(image, (w, h)), seuil)
+    amincie = cv2.ximgproc.thinning(binaire)
+    centre, amincie, point_adja = find_noyau(binaire, amincie, rayon)
+    skeleton = Skeleton(amincie, centre)
+    skeleton.simplify()
+    return skeleton, point_adja
+
+@pytest.fixture(scope="module", params=[(300, 6, 2), (400, 8, 1), (500, 16, 2)], ids=lambda p: "%d-%d-%d" % p)
+def synthetique(request):
+    taille, branches, graine = request.param
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    return squelette(image, verite.seuil, verite.rayon_ouverture)
+
+@pytest.mark.parametrize("steps, dist_max", [(10, 3), (5, 2), (15, 4)])
+def test_sondage_identique_a_la_boucle(synthetique, steps, dist_max):
+    skeleton, _ = synthetique
+    assert skeleton.probe_junctions(steps, dist_max) == skeleton.probe_junctions_loop(steps, dist_max)
+
+@pytest.mark.parametrize("nom, seuil", [("test2.jpeg", 10), ("test4.tif", 20), ("test5.png", 10)])
+def test_sondage_images(nom, seuil):
+    image = cv2.resize(pipeline.charger_image(os.path.join(IMAGES, nom)), (500, 500))
+    skeleton, point_adja = squelette(image, seuil, 18)
+    assert skeleton.probe_junctions() == skeleton.probe_junctions_loop()
+    skeleton.get_branching_points(point_adja, check=True)
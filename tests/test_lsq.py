@@ -0,0 +1,125 @@
+"""
+    Approximation aux moindres carrés sous contraintes (lsq.LeastSquaresConstraintsBatch)
+    comparée à la résolution branche par branche des équations normales avec multiplicateurs
+    de Lagrange, dans la même base de Chebyshev décalée
+"""
+import numpy as np
+import pytest
+
+import lsq
+from branch import Branch
+
+cheb = np.polynomial.chebyshev
+
+def branches_aleatoires(nombre, graine=0, longueurs=(6, 400)):
+    """
+        Branches de points entiers voisins, sans répétition (marches aléatoires lissées de
+        pas 8-connexes, comme sur un squelette), de longueurs variées
+    """
+    rng = np.random.default_rng(graine)
+    branches = []
+    for _ in range(nombre):
+        n = int(rng.integers(*longueurs))
+        angles = np.cumsum(rng.normal(0, 0.15, n)) + rng.uniform(0, 2 * np.pi)
+        pas = np.round(np.column_stack((np.cos(angles), np.sin(angles)))).astype(int)
+        pts = np.cumsum(pas, axis=0) + rng.integers(0, 2000, 2)
+        branches.append([tuple(p) for p in pts])
+    return branches
+
+def resolution_directe(points, degree):
+    """
+        Système des équations normales sous contraintes d'une branche :
+            ( A^T A | F^T ) ( x )   ( A^T b )
+            ( F     | 0   ) ( L ) = ( c     )
+        avec A et F dans la base T_k(2t-1). Retourne (degree+3, 2) comme LeastSquaresConstraintsBatch
+    """
+    t = lsq.chordal_parameterization([points])[0]
+    b = np.asarray(points, dtype=float)
+    A = cheb.chebvander(2 * t - 1, degree)
+    F = cheb.chebvander(np.array([-1.0, 1.0]), degree)
+    M = np.block([[A.T @ A, F.T], [F, np.zeros((2, 2))]])
+    return np.linalg.solve(M, np.vstack((A.T @ b, b[[0, -1]])))
+
+def test_lot_identique_a_la_resolution_directe():
+    # Branches assez longues pour que le système soit bien posé
+    branches = branches_aleatoires(150, longueurs=(12, 400))
+    cf = lsq.LeastSquaresConstraintsBatch(branches, 8, chunk=16)
+    assert cf.shape == (150, 11, 2)
+    for points, c in zip(branches, cf):
+        reference = resolution_directe(points, 8)
+        echelle = np.abs(reference[:9]).max()
+        np.testing.assert_allclose(c[:9], reference[:9], rtol=0, atol=1e-9 * echelle)
+        # Multiplicateurs de l'ordre de A^T b (souvent presque nuls)
+        np.testing.assert_allclose(c[9:], reference[9:], rtol=0, atol=1e-9 * len(points) * np.abs(points).max())
+
+def test_lot_identique_branche_par_branche():
+    branches = branches_aleatoires(40, graine=1)
+    cf = lsq.LeastSquaresConstraintsBatch(branches, 8, chunk=8)
+    for points, c in zip(branches, cf):
+        np.testing.assert_allclose(c, lsq.LeastSquaresConstraintsBatch([points], 8)[0], rtol=1e-9, atol=1e-7)
+
+@pytest.mark.parametrize("degree", [3, 8, 20])
+def test_contraintes_aux_extremites(degree):
+    branches = branches_aleatoires(60, graine=2)
+    cf = lsq.LeastSquaresConstraintsBatch(branches, degree)
+    extremites = lsq.evaluate_curves(cf[:, :-2], 2)
+    attendu = np.array([[points[0], points[-1]] for points in branches], dtype=float)
+    np.testing.assert_allclose(extremites, attendu, rtol=0, atol=1e-8)
+
+def test_degre_reduit():
+    # Une branche de N points est approchée au degré N-2 : coefficients suivants nuls et
+    # même solution que la résolution directe à ce degré
+    branches = branches_aleatoires(20, graine=3, longueurs=(6, 10))
+    cf = lsq.LeastSquaresConstraintsBatch(branches, 8)
+    for points, c in zip(branches, cf):
+        d = len(points) - 2
+        assert not c[d+1:9].any()
+        reference = resolution_directe(points, d)
+        np.testing.assert_allclose(c[:d+1], reference[:d+1], rtol=0, atol=1e-9 * np.abs(reference).max())
+
+    # Une branche droite de 6 points garde sa longueur
+    droite = [(1016, j) for j in range(879, 885)]
+    pt = lsq.evaluate_curves(lsq.LeastSquaresConstraintsBatch([droite], 8)[:, :-2], 300)[0]
+    assert np.sum(np.hypot(*np.gradient(pt, axis=0).T)) == pytest.approx(5, abs=0.05)
+
+def test_branches_courtes_interpolees():
+    # Sans réduction du degré, moins de points que de coefficients : le polynome passe par
+    # tous les points
+    branches = branches_aleatoires(20, graine=3, longueurs=(6, 10))
+    cf = lsq.LeastSquaresConstraintsBatch(branches, 8, reduire_degre=False)
+    assert np.isfinite(cf).all()
+    for points, c in zip(branches, cf):
+        t = lsq.chordal_parameterization([points])[0]
+        courbe = np.column_stack([lsq.compute_parametric_curve(c[:, k], t) for k in range(2)])
+        np.testing.assert_allclose(courbe, np.asarray(points, dtype=float), rtol=0, atol=1e-8)
+
+@pytest.mark.parametrize("degree", [8, 20])
+def test_conditionnement(degree):
+    # Longue branche loin de l'origine : le problème réduit résolu (dans l'espace nul des
+    # contraintes) reste bien conditionné, les équations normales dans la base des monomes
+    # ne le sont plus dès le degré 8
+    points = np.asarray(branches_aleatoires(1, graine=degree, longueurs=(2000, 2001))[0], dtype=float) + 5000
+    cf = lsq.LeastSquaresConstraintsBatch([points], degree)[0]
+    t = lsq.chordal_parameterization([points])[0]
+    A = cheb.chebvander(2 * t - 1, degree)
+    F = cheb.chebvander(np.array([-1.0, 1.0]), degree)
+    Z = np.linalg.qr(F.T, mode='complete')[0][:, 2:]
+    assert np.linalg.cond(A @ Z) < 100
+    monomes = np.vander(t, degree + 1, increasing=True)
+    assert np.linalg.cond(monomes.T @ monomes) > 1e10
+
+    # Contraintes respectées et solution optimale à la précision machine près : le résidu
+    # est orthogonal à l'espace des polynomes qui respectent les contraintes
+    np.testing.assert_allclose(F @ cf[:-2], points[[0, -1]], rtol=1e-12)
+    gradient = Z.T @ A.T @ (points - A @ cf[:-2])
+    assert np.abs(gradient).max() < 1e-10 * np.abs(A.T @ points).max()
+
+def test_compute_parametric_curve():
+    points = branches_aleatoires(1, graine=4, longueurs=(50, 51))[0]
+    branch = Branch(points, set())
+    branch.least_square_approximation()
+    t = np.linspace(0, 1, 37)
+    pt = lsq.evaluate_curves(branch.coefficients()[None], 37)[0]
+    np.testing.assert_allclose(lsq.compute_parametric_curve(branch.lsqcfx, t), pt[:, 0], atol=1e-9)
+    np.testing.assert_allclose(lsq.compute_parametric_curve(branch.lsqcfy, t), pt[:, 1], atol=1e-9)
+    assert lsq.compute_parametric_curve(branch.lsqcfx, [0.0, 1.0]) == pytest.approx([points[0][0], points[-1][0]])
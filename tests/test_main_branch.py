@@ -0,0 +1,45 @@
+"""
+    Branche principale (Skeleton.get_main_branch(), NeuronTree.longest_paths()) comparée aux
+    chemins calculés par networkx et à la branche principale des neurones synthétiques
+"""
+import networkx as nx
+import pytest
+
+import pipeline
+from synthetic import generer_neurone
+
+NEURONES = [(300, 6, 0), (400, 8, 1), (500, 12, 2), (600, 6, 3), (500, 8, 5), (700, 10, 6)]
+
+def traiter(taille, branches, graine):
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    binaire = pipeline.binariser(pipeline.pretraitement(image, None), verite.seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, rayon=verite.rayon_ouverture)
+    pipeline.mesurer(skeleton, binaire, point_adja)
+    return skeleton, verite
+
+@pytest.mark.parametrize("taille, branches, graine", NEURONES)
+def test_longueur_verite(taille, branches, graine):
+    skeleton, verite = traiter(taille, branches, graine)
+    longueur, chemin = skeleton.main_paths[0]
+    assert longueur == pytest.approx(verite.longueur_principale(), rel=0.05)
+    assert chemin[0] == tuple(skeleton.soma)
+    assert skeleton.main_branch == list(zip(chemin[:-1], chemin[1:]))
+
+@pytest.mark.parametrize("taille, branches, graine", NEURONES)
+def test_chemins_networkx(taille, branches, graine):
+    skeleton, _ = traiter(taille, branches, graine)
+    G, soma = skeleton.G, tuple(skeleton.soma)
+    # Arbre du parcours en largeur depuis le soma, longueur cumulée jusqu'à chacune de ses feuilles
+    longueurs, parents = {soma: 0.0}, set()
+    for u, v in nx.bfs_edges(G, soma):
+        longueurs[v] = longueurs[u] + G.edges[u, v]["length"]
+        parents.add(u)
+    attendus = sorted((l for v, l in longueurs.items() if v not in parents), reverse=True)
+
+    chemins = skeleton.longest_paths(len(G))
+    assert len(chemins) == len(attendus)
+    assert [l for l, _ in chemins] == pytest.approx(attendus, rel=1e-5)
+    for longueur, chemin in chemins:
+        assert chemin[0] == soma
+        assert longueur == pytest.approx(sum(G.edges[u, v]["length"] for u, v in zip(chemin[:-1], chemin[1:])),
+                                         rel=1e-5)
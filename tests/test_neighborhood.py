@@ -0,0 +1,64 @@
+"""
+    Table des voisinages (neighborhood.py) comparée au test des angles d'origine de
+    Skeleton.get_branching_points() et de Skeleton.simplify()
+"""
+import numpy as np
+import pytest
+from scipy.spatial.distance import cosine
+
+import neighborhood
+from neighborhood import NEIGHBOR_OFFSETS
+
+def role_reference(voisins):
+    """
+        Rôle d'un pixel d'après la liste de ses voisins (vecteurs (di, dj)), calculé comme le
+        code d'origine : nombre de voisins, puis les 3 angles formés par les 3 voisins
+    """
+    if len(voisins) == 0:
+        return neighborhood.ISOLATED
+    if len(voisins) == 1:
+        return neighborhood.ENDPOINT
+    if len(voisins) == 2:
+        return neighborhood.REGULAR
+    if len(voisins) > 3:
+        return neighborhood.CROSSING
+    u0, u1, u2 = (np.array(v) for v in voisins)
+    angle_u0u1 = np.arccos(1 - cosine(u0, u1))
+    angle_u1u2 = np.arccos(1 - cosine(u1, u2))
+    angle_u2u0 = np.arccos(1 - cosine(u2, u0))
+    if len(set([angle_u0u1, angle_u1u2, angle_u2u0])) < 3:
+        return neighborhood.JUNCTION_SYMMETRIC
+    return neighborhood.JUNCTION
+
+def voisinage(code):
+    """
+        Carte 3x3 dont le pixel central a les voisins du code donné
+    """
+    bitmap = np.zeros((3, 3), dtype=bool)
+    bitmap[1, 1] = True
+    for k, (di, dj) in enumerate(NEIGHBOR_OFFSETS):
+        if code >> k & 1:
+            bitmap[1 + dj, 1 + di] = True
+    return bitmap
+
+@pytest.mark.parametrize("code", range(256))
+def test_table_identique_au_test_des_angles(code):
+    voisins = [o for k, o in enumerate(NEIGHBOR_OFFSETS) if code >> k & 1]
+    label = neighborhood.classify(voisinage(code))[1, 1]
+    assert label & neighborhood.ROLE_MASK == role_reference(voisins)
+
+    # Pixel redondant de simplify() : son voisin de gauche et celui du dessus sont présents
+    redondant = (-1, 0) in voisins and (0, -1) in voisins
+    assert bool(label & neighborhood.REDUNDANT) == redondant
+
+def test_codes_de_toute_une_image():
+    rng = np.random.default_rng(0)
+    bitmap = rng.random((40, 60)) < 0.3
+    codes = neighborhood.neighborhood_codes(bitmap)
+    labels = neighborhood.classify(bitmap)
+    for j, i in zip(*np.nonzero(bitmap)):
+        voisins = [(di, dj) for di, dj in NEIGHBOR_OFFSETS
+                   if 0 <= i + di < 60 and 0 <= j + dj < 40 and bitmap[j + dj, i + di]]
+        assert codes[j, i] == sum(1 << NEIGHBOR_OFFSETS.index(v) for v in voisins)
+        assert labels[j, i] & neighborhood.ROLE_MASK == role_reference(voisins)
+    assert not labels[~bitmap].any()
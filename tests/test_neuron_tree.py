@@ -0,0 +1,80 @@
+"""
+    Graphe compact (NeuronTree.to_networkx()) comparé au networkx.Graph que construisait
+    Skeleton.to_graph() avant NeuronTree
+"""
+import csv, os
+
+import cv2
+import networkx as nx
+import pytest
+
+import pipeline
+from synthetic import generer_neurone
+
+IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images")
+
+def graphe_origine(skeleton):
+    """
+        Graphe du neurone construit comme par Skeleton.to_graph() d'origine
+    """
+    G = nx.Graph()
+    ending_points = [b.end for b in skeleton.branches if not b.is_branching_out()]
+    G.add_nodes_from(skeleton.branching_points + ending_points)
+    G.add_edges_from(
+        (tuple(skeleton.soma) if b.centre == 1 else b.start, b.end, {'thickness': b.thickness, 'length': b.length})
+        for b in skeleton.branches
+    )
+    # Skeleton.to_graph() levait KeyError sur une arête non reliée au soma, NeuronTree lui
+    # donne la profondeur -1
+    depth = nx.shortest_path_length(G, source=tuple(skeleton.soma))
+    for u, v in G.edges():
+        G.edges[u, v]["depth"] = max(depth[u], depth[v]) if u in depth else -1
+    return G
+
+def comparer(skeleton):
+    G, H = skeleton.tree.to_networkx(), graphe_origine(skeleton)
+    assert list(G.nodes) == list(H.nodes)
+    assert set(map(frozenset, G.edges)) == set(map(frozenset, H.edges))
+    for u, v, attributs in H.edges(data=True):
+        assert G.edges[u, v]["depth"] == attributs["depth"]
+        assert G.edges[u, v]["length"] == pytest.approx(attributs["length"], rel=1e-6)
+        assert G.edges[u, v]["thickness"] == pytest.approx(attributs["thickness"], rel=1e-6)
+
+def traiter(image, seuil, rayon):
+    """
+        Squelette mesuré de l'image en niveaux de gris, à sa résolution
+    """
+    h, w = image.shape
+    binaire = pipeline.binariser(pipeline.pretraitement(image, (w, h)), seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, rayon=rayon)
+    pipeline.mesurer(skeleton, binaire, point_adja)
+    return skeleton
+
+@pytest.mark.parametrize("nom, seuil", [("test2.jpeg", 10), ("test4.tif", 20), ("test5.png", 10)])
+def test_graphe_images(nom, seuil):
+    image = cv2.resize(pipeline.charger_image(os.path.join(IMAGES, nom)), (500, 500))
+    comparer(traiter(image, seuil, 18))
+
+@pytest.mark.parametrize("taille, branches, graine", [(300, 6, 2), (400, 8, 1), (500, 16, 2)])
+def test_graphe_synthetique(taille, branches, graine):
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    comparer(traiter(image, verite.seuil, verite.rayon_ouverture))
+
+def lignes_csv(chemin):
+    with open(chemin, newline='') as f:
+        return list(csv.reader(f))
+
+@pytest.mark.parametrize("nom, seuil", [("test2.jpeg", 10), ("test4.tif", 20), ("test5.png", 10)])
+def test_csv_images(nom, seuil, tmp_path):
+    image = cv2.resize(pipeline.charger_image(os.path.join(IMAGES, nom)), (500, 500))
+    skeleton = traiter(image, seuil, 18)
+    # Une ligne par arête de networkx.Graph, dans son ordre : les arêtes parallèles sont fusionnées
+    H = graphe_origine(skeleton)
+    lignes = lignes_csv(skeleton.save_as_csv(nom, str(tmp_path)))
+    assert lignes[0] == ['Source', 'Target', 'Length', 'Thickness', 'Depth']
+    assert [(l[0], l[1]) for l in lignes[1:]] == [
+        (str(tuple(map(int, u))), str(tuple(map(int, v)))) for u, v in H.edges]
+    for ligne, (u, v, attributs) in zip(lignes[1:], H.edges(data=True)):
+        assert float(ligne[2]) == pytest.approx(attributs["length"], rel=1e-6)
+        assert float(ligne[3]) == pytest.approx(attributs["thickness"], rel=1e-6)
+        assert int(ligne[4]) == attributs["depth"]
@@ -0,0 +1,65 @@
+"""
+    Images de plusieurs neurones (neurons.analyser_neurones) : un arbre par noyau, identique
+    à celui du neurone analysé seul, et neurones qui se touchent partagés entre leurs noyaux
+"""
+import cv2
+import numpy as np
+import pytest
+
+import neurons
+import pipeline
+from synthetic import generer_neurone
+
+def champ(specifications, taille):
+    """
+        Image (w, h) = taille des neurones générés et placés à leur origine (maximum des
+        niveaux là où ils se recouvrent). Retourne l'image, la liste des (origine, image, vérité)
+    """
+    w, h = taille
+    image = np.zeros((h, w), dtype=np.uint8)
+    neurones = []
+    for (x, y), cote, branches, graine in specifications:
+        petite, verite = generer_neurone((cote, cote), branches, graine=graine)
+        np.maximum(image[y:y + cote, x:x + cote], petite, out=image[y:y + cote, x:x + cote])
+        neurones.append(((x, y), petite, verite))
+    return image, neurones
+
+def binaire(image, verite):
+    return pipeline.binariser(pipeline.pretraitement(image, None), verite.seuil)
+
+def branches(skeleton, origine=(0, 0)):
+    return sorted(tuple((x + origine[0], y + origine[1]) for x, y in b.points) for b in skeleton.branches)
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_un_arbre_par_noyau(processes):
+    image, neurones = champ([((0, 50), 300, 6, 0), ((300, 0), 400, 8, 1), ((700, 60), 300, 4, 4)], (1000, 420))
+    rayon = min(v.rayon_ouverture for _, _, v in neurones)
+    skeletons = neurons.analyser_neurones(binaire(image, neurones[0][2]), rayon=rayon, processes=processes)
+    assert len(skeletons) == 3
+    # Du noyau le plus épais au moins épais
+    assert skeletons[0].soma[0] > 300 and skeletons[0].soma[0] < 700
+
+    for (x, y), petite, verite in neurones:
+        centre = np.array(verite.centre) + (x, y)
+        k = int(np.argmin([np.hypot(*(s.soma - centre)) for s in skeletons]))
+        skeleton = skeletons[k]
+        assert np.hypot(*(skeleton.soma - centre)) <= 2
+        # Le même arbre que celui du neurone analysé seul, dans les coordonnées de l'image
+        seul, point_adja = pipeline.squelettiser(binaire(petite, verite), rayon=rayon)
+        pipeline.mesurer(seul, binaire(petite, verite), point_adja)
+        assert branches(skeleton) == branches(seul, (x, y))
+        assert skeleton.main_paths[0][0] == pytest.approx(seul.main_paths[0][0], rel=1e-6)
+
+def test_neurones_qui_se_touchent():
+    image, neurones = champ([((0, 0), 400, 8, 1), ((160, 20), 400, 8, 3)], (560, 420))
+    rayon = min(v.rayon_ouverture for _, _, v in neurones)
+    masque = binaire(image, neurones[0][2])
+    # Une seule composante connexe (et le fond)
+    assert cv2.connectedComponents(masque)[0] == 2
+    skeletons = neurons.analyser_neurones(masque, rayon=rayon, processes=1)
+    assert len(skeletons) == 2
+    centres = [np.array(v.centre) + o for o, _, v in neurones]
+    assert sorted(int(np.argmin([np.hypot(*(s.soma - c)) for c in centres])) for s in skeletons) == [0, 1]
+    # Aucun point du squelette n'est partagé entre les deux neurones
+    points = [set(p for b in s.branches for p in b.points) for s in skeletons]
+    assert not points[0] & points[1]
@@ -0,0 +1,94 @@
+"""
+    Affichage groupé (render.py) : image du squelette, courbes des approximations et trace
+    des mesures d'épaisseur, comparées aux points du squelette et aux mesures des branches
+"""
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+import pipeline
+import render
+from branch import trimmed_mean
+from synthetic import generer_neurone
+
+@pytest.fixture(scope="module")
+def neurone():
+    image, verite = generer_neurone((500, 500), 12, graine=2)
+    binaire = pipeline.binariser(pipeline.pretraitement(image, None), verite.seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, rayon=verite.rayon_ouverture)
+    pipeline.mesurer(skeleton, binaire, point_adja)
+    return skeleton, binaire
+
+@pytest.fixture
+def ax():
+    figure, ax = plt.subplots()
+    yield ax
+    plt.close(figure)
+
+def rayon(image, p, u):
+    """
+        Nombre de pas de p dans la direction u sur des pixels blancs (comme
+        Branch.measure_average_thickness())
+    """
+    h, w = image.shape
+    k = 0
+    while True:
+        x, y = round(p[0] + k * u[0]), round(p[1] + k * u[1])
+        if not (0 <= x < w and 0 <= y < h and image[y, x] == 255):
+            return k
+        k += 1
+
+def test_squelette(neurone, ax):
+    skeleton, _ = neurone
+    artiste = render.tracer_squelette(skeleton, ax, couleur="red")
+    rgba = artiste.get_array()
+    ox, oy = skeleton.origin
+    ys, xs = np.nonzero(rgba[:, :, 3])
+    assert set(zip((xs + ox).tolist(), (ys + oy).tolist())) == set(skeleton.points)
+    assert tuple(rgba[ys[0], xs[0]]) == (255, 0, 0, 255)
+    h, w = rgba.shape[:2]
+    assert artiste.get_extent() == [ox - 0.5, ox + w - 0.5, oy + h - 0.5, oy - 0.5]
+
+def test_courbes(neurone, ax):
+    skeleton, _ = neurone
+    collection = render.tracer_courbes(skeleton, ax, n=50)
+    lignes = collection.get_segments()
+    assert len(lignes) == len(skeleton.branches)
+    t = np.linspace(0, 1, 50)
+    for branche, cf, ligne in zip(skeleton.branches, skeleton.lsqcf, lignes):
+        # Coefficients dans la base de Chebyshev décalée, sans les multiplicateurs de Lagrange
+        courbe = np.polynomial.chebyshev.chebval(2 * t - 1, cf).T
+        if branche.centre == 1 and len(branche.line):
+            assert np.allclose(ligne[:2], branche.line[[-1, 0]])
+            ligne = ligne[2:]
+        assert np.allclose(ligne, courbe)
+
+def test_traces_epaisseur(neurone, ax):
+    skeleton, binaire = neurone
+    p, tangentes, u, segments = render.traces_epaisseur(skeleton, binaire)
+    assert np.allclose(np.linalg.norm(tangentes, axis=1), 1)
+    assert np.allclose(np.sum(tangentes * u, axis=1), 0)
+
+    # Chaque segment va du dernier pixel blanc dans le sens de u au dernier dans le sens de -u
+    mesures = []
+    for q, v, (a, b) in zip(p, u, segments):
+        avant, arriere = rayon(binaire, q, v), rayon(binaire, q, -v)
+        assert np.allclose(a, q + max(avant - 1, 0) * v)
+        assert np.allclose(b, q - max(arriere - 1, 0) * v)
+        mesures.append(avant + arriere)
+
+    # Les mesures de chaque branche donnent son épaisseur (mode "rays" de pipeline.mesurer())
+    debut = 0
+    for branche in skeleton.branches:
+        nombre = 10 - 1 - (branche.end in skeleton.branching_set)
+        epaisseur = trimmed_mean(mesures[debut:debut + nombre])
+        if epaisseur is not None:
+            assert branche.thickness == pytest.approx(epaisseur)
+        debut += nombre
+    assert debut == len(mesures)
+
+    collection = render.tracer_epaisseurs(skeleton, binaire, ax)
+    assert len(collection.get_segments()) == len(p)
+    assert len(ax.collections) == 4
@@ -0,0 +1,53 @@
+"""
+    Segmentation des branches : parcours sur les tableaux de l'index
+    (Skeleton.segmentation_index()) comparé au parcours d'origine (method="walk")
+"""
+import os
+
+import cv2
+import pytest
+
+import pipeline
+from synthetic import generer_neurone
+
+IMAGES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images")
+
+def squelette(image, seuil, rayon):
+    """
+        Squelette de l'image en niveaux de gris, jusqu'aux points de ramification
+    """
+    h, w = image.shape
+    binaire = pipeline.binariser(pipeline.pretraitement(image, (w, h)), seuil)
+    skeleton, _ = pipeline.squelettiser(binaire, rayon=rayon)
+    return skeleton
+
+def comparer(skeleton):
+    walk = [b.points for b in skeleton.branches]
+    assert walk
+    skeleton.branches = []
+    skeleton.segmentation("index")
+    assert [b.points for b in skeleton.branches] == walk
+
+    # check=True calcule les deux parcours et garde les branches de la méthode demandée
+    for method in ("walk", "index"):
+        skeleton.branches = []
+        skeleton.segmentation(method, check=True)
+        assert [b.points for b in skeleton.branches] == walk
+
+@pytest.mark.parametrize("taille", [300, 500, 700])
+@pytest.mark.parametrize("branches", [4, 8, 16])
+@pytest.mark.parametrize("graine", [0, 1, 2])
+def test_segmentation_synthetique(taille, branches, graine):
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    comparer(squelette(image, verite.seuil, verite.rayon_ouverture))
+
+@pytest.mark.parametrize("nom, seuil", [("test2.jpeg", 10), ("test4.tif", 20), ("test5.png", 10)])
+def test_segmentation_images(nom, seuil):
+    image = cv2.resize(pipeline.charger_image(os.path.join(IMAGES, nom)), (500, 500))
+    comparer(squelette(image, seuil, 18))
+
+def test_methode_inconnue():
+    image, verite = generer_neurone((300, 300), 4)
+    skeleton = squelette(image, verite.seuil, verite.rayon_ouverture)
+    with pytest.raises(ValueError):
+        skeleton.segmentation("labels")
@@ -0,0 +1,46 @@
+"""
+    Pixels des segments calculés par branch.segments_pixels() comparés à ceux que dessine
+    cv2.line()
+"""
+import numpy as np
+import cv2
+import pytest
+
+from branch import segments_pixels
+
+def pixels_cv2(start, end, taille):
+    """
+        Ensemble des pixels (x, y) du segment dessiné par cv2.line dans une image vide
+    """
+    image = np.zeros((taille, taille), dtype=np.uint8)
+    cv2.line(image, tuple(int(v) for v in start), tuple(int(v) for v in end), 255, thickness=1)
+    ys, xs = np.nonzero(image)
+    return set(zip(xs.tolist(), ys.tolist()))
+
+def verifier(starts, ends, taille):
+    for start, end, pts in zip(starts, ends, segments_pixels(starts, ends)):
+        assert {tuple(p) for p in pts.tolist()} == pixels_cv2(start, end, taille)
+        assert len(pts) == np.abs(np.subtract(end, start)).max() + 1
+        # Du départ à l'arrivée, un pixel voisin du précédent à chaque pas
+        assert tuple(pts[0]) == tuple(start) and tuple(pts[-1]) == tuple(end)
+        assert (np.abs(np.diff(pts, axis=0)).max(axis=1) == 1).all()
+
+def test_toutes_les_directions():
+    # Tous les segments partant du centre d'une grille 25x25, dans les deux sens
+    centre = np.array([12, 12])
+    ends = np.array([(x, y) for x in range(25) for y in range(25) if (x, y) != (12, 12)])
+    starts = np.repeat(centre[None], len(ends), axis=0)
+    verifier(starts, ends, 25)
+    verifier(ends, starts, 25)
+
+@pytest.mark.parametrize("graine", range(3))
+def test_segments_aleatoires(graine):
+    rng = np.random.default_rng(graine)
+    starts = rng.integers(0, 400, (200, 2))
+    ends = rng.integers(0, 400, (200, 2))
+    verifier(starts, ends, 400)
+
+def test_cas_limites():
+    assert segments_pixels([], []) == []
+    (pts,) = segments_pixels([(5, 7)], [(5, 7)])
+    assert pts.tolist() == [[5, 7]]
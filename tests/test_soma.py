@@ -0,0 +1,72 @@
+"""
+    Détection du noyau (soma.find_noyau) sur des neurones synthétiques dont le noyau est un
+    disque connu : centre, points du squelette sur l'anneau autour du noyau (un par branche
+    qui en part) et exception quand il n'y a pas de noyau
+"""
+import cv2
+import numpy as np
+import pytest
+
+import pipeline
+import soma
+from synthetic import generer_neurone
+
+NEURONES = [(300, 6, 0), (400, 8, 1), (500, 12, 2), (600, 6, 3), (300, 4, 4)]
+
+def binaire_et_squelette(image, seuil):
+    binaire = pipeline.binariser(pipeline.pretraitement(image, None), seuil)
+    return binaire, cv2.ximgproc.thinning(binaire)
+
+@pytest.mark.parametrize("taille, branches, graine", NEURONES)
+def test_noyau(taille, branches, graine):
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    binaire, squelette = binaire_et_squelette(image, verite.seuil)
+    centre, sortie, adjacents = soma.find_noyau(binaire, squelette, verite.rayon_ouverture)
+
+    assert np.hypot(*(centre - verite.centre)) <= 2
+
+    # Seuls des points du squelette à l'intérieur du disque (élargi par le flou) sont retirés
+    assert not np.any(sortie[squelette == 0])
+    retires = np.argwhere((squelette > 0) & (sortie == 0))[:, ::-1]
+    assert len(retires)
+    assert np.hypot(*(retires - verite.centre).T).max() <= verite.rayon + 2
+
+    # Un point de l'anneau par branche qui part du noyau, au bord du disque, près du départ de sa branche
+    departs = np.array([a["points"][0] for a in verite.aretes if a["parent"] == -1])
+    adjacents = np.array(adjacents)
+    assert len(adjacents) == len(departs)
+    assert all(sortie[y, x] == 255 for x, y in adjacents)
+    distances = np.hypot(*(adjacents - verite.centre).T)
+    assert np.all((distances >= verite.rayon - 1) & (distances <= verite.rayon + 4))
+    ecarts = np.linalg.norm(adjacents[:, None] - departs[None], axis=2)
+    assert sorted(ecarts.argmin(axis=1)) == list(range(len(departs)))
+    assert ecarts.min(axis=1).max() <= 6
+
+@pytest.mark.parametrize("facteur", [1, 2])
+def test_facteur_donne(facteur):
+    image, verite = generer_neurone((400, 400), 8, graine=1)
+    binaire, squelette = binaire_et_squelette(image, verite.seuil)
+    centre, _, adjacents = soma.find_noyau(binaire, squelette, verite.rayon_ouverture, facteur)
+    assert np.hypot(*(centre - verite.centre)) <= 2
+    assert len(adjacents) == 8
+
+def test_sans_noyau():
+    # Image noire, puis prolongements sans noyau (plus fins que le disque de l'ouverture)
+    image, verite = generer_neurone((400, 400), 8, graine=1)
+    binaire, squelette = binaire_et_squelette(image, verite.seuil)
+    with pytest.raises(soma.NoyauNonDetecte):
+        soma.find_noyau(np.zeros_like(binaire), np.zeros_like(squelette), verite.rayon_ouverture)
+    cv2.circle(binaire, verite.centre, verite.rayon + 2, 0, -1)
+    with pytest.raises(soma.NoyauNonDetecte):
+        soma.find_noyau(binaire, squelette, verite.rayon_ouverture)
+    with pytest.raises(soma.NoyauNonDetecte):
+        soma.find_noyaux(binaire, verite.rayon_ouverture)
+    # Les appelants qui attrapaient IndexError l'attrapent toujours
+    with pytest.raises(IndexError):
+        soma.find_noyau(binaire, squelette, verite.rayon_ouverture)
+
+def test_facteur_reduction():
+    assert [soma.facteur_reduction(r) for r in (1, 8, 15.9, 16, 18, 150)] == [1, 1, 1, 2, 2, 16]
+    for rayon in (0, -5, float("nan")):
+        with pytest.raises(ValueError):
+            soma.facteur_reduction(rayon)
@@ -0,0 +1,64 @@
+"""
+    Traitement en flux (stream.traiter_flux) : résultats dans l'ordre des images avec
+    plusieurs threads, identiques à la chaine de pipeline.py, et nombre borné d'images lues
+    et pas encore produites quand une image est lente
+"""
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import pipeline
+import stream
+from synthetic import generer_neurone
+
+@pytest.fixture(scope="module")
+def images():
+    images = []
+    for graine in range(6):
+        image, verite = generer_neurone((300, 300), 6, graine=graine)
+        images.append(image)
+    return images, verite.seuil
+
+def test_ordre_et_resultats(images):
+    images, seuil = images
+    noms = [("image%d" % k, image) for k, image in enumerate(images)]
+    resultats = list(stream.traiter_flux(noms + [("vide", np.zeros((300, 300), np.uint8))], seuil,
+                                         taille=None, ouvriers=3))
+    assert [r["image"] for r in resultats] == [nom for nom, _ in noms] + ["vide"]
+    assert resultats[-1]["statut"] == "echec"
+    for (_, image), resultat in zip(noms, resultats):
+        binaire = pipeline.binariser(pipeline.pretraitement(image, None), seuil)
+        skeleton, point_adja = pipeline.squelettiser(binaire)
+        pipeline.mesurer(skeleton, binaire, point_adja)
+        assert resultat["statut"] == "ok"
+        assert resultat["branches"] == len(skeleton.branches)
+        assert resultat["principale"] == pytest.approx(skeleton.main_paths[0][0])
+
+def test_fenetre_bornee(images, monkeypatch):
+    images, seuil = images
+    # La première image, plus large, est traitée lentement : les suivantes la dépassent
+    lente = cv2.copyMakeBorder(images[0], 0, 0, 0, 20, cv2.BORDER_CONSTANT)
+    recadrer_image = pipeline.recadrer_image
+
+    def lent(image, *args, **kwargs):
+        if image.shape[1] > 300:
+            time.sleep(0.5)
+        return recadrer_image(image, *args, **kwargs)
+    monkeypatch.setattr(pipeline, "recadrer_image", lent)
+
+    lues = []
+
+    def suite():
+        for k in range(40):
+            lues.append(k)
+            yield lente if k == 0 else images[k % len(images)]
+
+    file, ouvriers = 1, 3
+    resultats = []
+    for resultat in stream.traiter_flux(suite(), seuil, taille=None, file=file, ouvriers=ouvriers):
+        # Une image de plus a pu être tirée de la suite en attendant une place
+        assert len(lues) - len(resultats) <= 3 * file + ouvriers + 2
+        resultats.append(resultat["image"])
+    assert resultats == [str(k) for k in range(40)]
@@ -0,0 +1,40 @@
+"""
+    Balayage des seuils (sweep.balayer) : table triée par image puis par seuil, identique à
+    l'évaluation de chaque seuil à la suite, quelle que soit la répartition en tâches
+"""
+import cv2
+import pytest
+
+import pipeline
+import sweep
+from synthetic import generer_neurone
+
+@pytest.fixture(scope="module")
+def images(tmp_path_factory):
+    dossier = tmp_path_factory.mktemp("balayage")
+    chemins, seuils = [], []
+    for graine in (1, 2):
+        image, verite = generer_neurone((300, 300), 6, graine=graine)
+        chemins.append(str(dossier / ("neurone%d.png" % graine)))
+        cv2.imwrite(chemins[-1], image)
+        seuils.append(verite.seuil)
+    return chemins, seuils
+
+def sans_duree(table):
+    return [{c: v for c, v in ligne.items() if c != "duree"} for ligne in table]
+
+@pytest.mark.parametrize("processes", [1, 2, 5])
+def test_table(images, processes):
+    chemins, seuils = images
+    thresholds = [seuils[0] - 5, seuils[0], seuils[1], 255]
+    table = sweep.balayer(chemins, thresholds, taille=None, processes=processes)
+    assert [(l["image"], l["threshold"]) for l in table] == [(c, float(t)) for c in chemins for t in thresholds]
+    assert [l["statut"] for l in table if l["threshold"] == 255] == ["echec", "echec"]
+
+    options = {"segmentation": "walk", "thickness": "rays"}
+    reference = []
+    for chemin in chemins:
+        image = pipeline.pretraitement(pipeline.charger_image(chemin), None)
+        reference += [sweep.evaluer_seuil((chemin, image, float(t), options)) for t in thresholds]
+    assert sans_duree(table) == sans_duree(reference)
+    assert all(l["statut"] == "ok" for l in table if l["threshold"] in seuils)
@@ -0,0 +1,39 @@
+"""
+    Épaisseur des branches mesurée par la transformée en distance (thickness="distance")
+    comparée à l'épaisseur des prolongements tracés dans les neurones synthétiques
+"""
+import pytest
+
+import pipeline
+from synthetic import comparer, generer_neurone
+
+NEURONES = [(300, 6, 0), (400, 8, 1), (500, 12, 2), (600, 6, 3), (500, 8, 5), (700, 10, 6)]
+
+def mesurer(image, verite, thickness, recadrer=True):
+    binaire = pipeline.binariser(pipeline.pretraitement(image, None), verite.seuil)
+    skeleton, point_adja = pipeline.squelettiser(binaire, rayon=verite.rayon_ouverture, recadrer=recadrer)
+    pipeline.mesurer(skeleton, binaire, point_adja, thickness=thickness)
+    return skeleton
+
+@pytest.mark.parametrize("taille, branches, graine", NEURONES)
+def test_epaisseur_verite(taille, branches, graine):
+    image, verite = generer_neurone((taille, taille), branches, graine=graine)
+    resultat = comparer(mesurer(image, verite, "distance"), verite)
+    assert resultat["associees"] >= 0.8 * resultat["branches_verite"]
+    # Le trait tracé est flouté puis seuillé à mi-hauteur : au plus un pixel d'écart
+    assert resultat["erreur_epaisseur"] <= 0.7
+    assert resultat["erreur_epaisseur_max"] <= 1.2
+
+def test_plus_juste_que_les_rayons():
+    # Les rayons s'échappent par les ramifications proches, pas la transformée en distance
+    ecarts = {"rays": [], "distance": []}
+    for taille, branches, graine in NEURONES:
+        image, verite = generer_neurone((taille, taille), branches, graine=graine)
+        for thickness in ecarts:
+            ecarts[thickness].append(comparer(mesurer(image, verite, thickness), verite)["erreur_epaisseur"])
+    assert sum(ecarts["distance"]) < sum(ecarts["rays"])
+
+def test_boite_englobante():
+    image, verite = generer_neurone((500, 500), 8, graine=5)
+    recadre, entier = mesurer(image, verite, "distance"), mesurer(image, verite, "distance", recadrer=False)
+    assert [b.thickness for b in recadre.branches] == [b.thickness for b in entier.branches]
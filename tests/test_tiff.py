@@ -0,0 +1,151 @@
+"""
+    Lecture des régions des pages TIFF (tiff.PageTiff) comparée à la lecture de la page
+    entière par PIL : bandes et tuiles, 8 et 16 bits, gris et RGB, TIFF classique et
+    BigTIFF, pages compressées lues par OpenCV
+"""
+import pickle
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import tiff
+
+REGIONS = [
+    (slice(None), slice(None)),
+    (slice(10, 57), slice(33, 120)),
+    (slice(0, 1), slice(None)),
+    (slice(-5, None), slice(None, None, 3)),
+    (slice(3, 90, 7), slice(100, 4, -2)),
+    (slice(40, 41), slice(64, 65)),
+    (slice(5, 5), slice(None)),
+]
+
+def ecrire_tiff(chemin, image, bloc, ordre="<", big=False):
+    """
+        Écrit une image 8 bits en niveaux de gris non compressée, en bandes de bloc[0] lignes
+        ou en tuiles de taille bloc = (bh, bw) si bw est donné (PIL n'écrit pas de tuiles)
+    """
+    h, w = image.shape
+    bh, bw = bloc
+    if bw is None:
+        blocs = [image[y:y + bh] for y in range(0, h, bh)]
+    else:
+        pleine = np.zeros((-(-h // bh) * bh, -(-w // bw) * bw), dtype=np.uint8)
+        pleine[:h, :w] = image
+        blocs = [pleine[y:y + bh, x:x + bw] for y in range(0, h, bh) for x in range(0, w, bw)]
+    donnees = [np.ascontiguousarray(b).tobytes() for b in blocs]
+    offsets = list(np.cumsum([16] + [len(d) for d in donnees[:-1]]))
+    tags = [(256, [w]), (257, [h]), (258, [8]), (259, [1]), (262, [1]), (277, [1])]
+    if bw is None:
+        tags += [(273, offsets), (278, [bh]), (279, [len(d) for d in donnees])]
+    else:
+        tags += [(322, [bw]), (323, [bh]), (324, offsets), (325, [len(d) for d in donnees])]
+
+    # Entrées de l'IFD (type LONG ou LONG8), les valeurs qui ne tiennent pas sont après l'IFD
+    taille, code, nombre, typ = (8, "Q", "Q", 16) if big else (4, "I", "H", 4)
+    ifd = 16 + sum(len(d) for d in donnees)
+    suite = ifd + struct.calcsize(nombre) + len(tags) * (4 + 2 * taille) + taille
+    entrees, extra = b"", b""
+    for tag, valeurs in tags:
+        brut = struct.pack(ordre + code * len(valeurs), *(int(v) for v in valeurs))
+        entrees += struct.pack(ordre + "HH" + code, tag, typ, len(valeurs))
+        if len(brut) <= taille:
+            entrees += brut.ljust(taille, b"\0")
+        else:
+            entrees += struct.pack(ordre + code, suite + len(extra))
+            extra += brut
+    entete = b"II" if ordre == "<" else b"MM"
+    if big:
+        entete += struct.pack(ordre + "HHHQ", 43, 8, 0, ifd)
+    else:
+        entete += struct.pack(ordre + "HI", 42, ifd).ljust(14, b"\0")
+    with open(chemin, "wb") as f:
+        f.write(entete + b"".join(donnees) + struct.pack(ordre + nombre, len(tags)) + entrees
+                + struct.pack(ordre + code, 0) + extra)
+
+def gris_pil(image):
+    """
+        Page lue par PIL en niveaux de gris 8 bits, comme cv2.imread(chemin, 0)
+    """
+    if image.mode.startswith("I;16"):
+        return (np.array(image).astype(np.uint16) >> 8).astype(np.uint8)
+    return np.array(image.convert("L"))
+
+@pytest.fixture(scope="module")
+def fichiers(tmp_path_factory):
+    """
+        Fichiers TIFF de test : {nom: (chemin, pages projetables, écart toléré avec PIL)}
+    """
+    dossier = tmp_path_factory.mktemp("tiff")
+    rng = np.random.default_rng(0)
+    gris = [rng.integers(0, 256, (97, 131), dtype=np.uint8) for _ in range(3)]
+    fichiers = {}
+
+    def chemin(nom):
+        return str(dossier / nom)
+
+    Image.fromarray(gris[0]).save(chemin("pile.tif"), save_all=True, tiffinfo={278: 7},
+                                  append_images=[Image.fromarray(g) for g in gris[1:]])
+    fichiers["pile"] = (chemin("pile.tif"), True, 0)
+    Image.fromarray(rng.integers(0, 65536, (97, 131), dtype=np.uint16)).save(chemin("16bits.tif"),
+                                                                          tiffinfo={278: 10})
+    fichiers["16bits"] = (chemin("16bits.tif"), True, 0)
+    # Les arrondis de la conversion RGB en gris de PIL et d'OpenCV peuvent différer d'un niveau
+    Image.fromarray(rng.integers(0, 256, (97, 131, 3), dtype=np.uint8)).save(chemin("rgb.tif"),
+                                                                          tiffinfo={278: 16})
+    fichiers["rgb"] = (chemin("rgb.tif"), True, 1)
+    ecrire_tiff(chemin("tuiles.tif"), gris[1], (32, 48))
+    fichiers["tuiles"] = (chemin("tuiles.tif"), True, 0)
+    # PIL ne lit pas les BigTIFF gros-boutistes
+    ecrire_tiff(chemin("gros_boutiste.tif"), gris[2], (7, None), ordre=">")
+    fichiers["gros_boutiste"] = (chemin("gros_boutiste.tif"), True, 0)
+    ecrire_tiff(chemin("bigtiff.tif"), gris[2], (9, None), big=True)
+    fichiers["bigtiff"] = (chemin("bigtiff.tif"), True, 0)
+    ecrire_tiff(chemin("bigtiff_tuiles.tif"), gris[0], (16, 16), big=True)
+    fichiers["bigtiff_tuiles"] = (chemin("bigtiff_tuiles.tif"), True, 0)
+    Image.fromarray(gris[0]).save(chemin("lzw.tif"), save_all=True, compression="tiff_lzw",
+                                  append_images=[Image.fromarray(gris[1])])
+    fichiers["lzw"] = (chemin("lzw.tif"), False, 0)
+    return fichiers
+
+def pages_pil(chemin):
+    """
+        Pages du fichier lues entièrement par PIL, en niveaux de gris 8 bits
+    """
+    pages = []
+    with Image.open(chemin) as image:
+        for k in range(getattr(image, "n_frames", 1)):
+            image.seek(k)
+            pages.append(gris_pil(image))
+    return pages
+
+@pytest.mark.parametrize("nom", ["pile", "16bits", "rgb", "tuiles", "gros_boutiste", "bigtiff",
+                                 "bigtiff_tuiles", "lzw"])
+def test_regions(fichiers, nom):
+    chemin, projetable, ecart = fichiers[nom]
+    pages, references = tiff.pages_tiff(chemin), pages_pil(chemin)
+    assert len(pages) == len(references)
+    for page, reference in zip(pages, references):
+        assert page.projetable == projetable
+        assert page.shape == reference.shape
+        entiere = page.lire()
+        assert entiere.dtype == np.uint8
+        assert np.abs(entiere.astype(int) - reference).max() <= ecart
+        for lignes, colonnes in REGIONS:
+            region = page[lignes, colonnes]
+            assert region.shape == reference[lignes, colonnes].shape
+            assert np.array_equal(region, entiere[lignes, colonnes])
+
+def test_page_copiee(fichiers):
+    page = tiff.ouvrir_page(fichiers["tuiles"][0])
+    page[0:1, 0:1]
+    copie = pickle.loads(pickle.dumps(page))
+    assert copie._raw is None
+    assert np.array_equal(copie[20:70, 40:100], page[20:70, 40:100])
+
+def test_page_absente(fichiers):
+    assert tiff.ouvrir_page(fichiers["pile"][0], 2).index == 2
+    with pytest.raises(ValueError):
+        tiff.ouvrir_page(fichiers["pile"][0], 3)
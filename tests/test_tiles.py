@@ -0,0 +1,63 @@
+"""
+    Traitement par tuiles (tiles.py) : les tuiles pavent l'image, et le flou, le seuillage et
+    l'amincissement par tuiles, puis toute la chaine, donnent le même résultat qu'en un seul
+    morceau
+"""
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import pipeline
+import tiles
+from synthetic import generer_neurone
+
+@pytest.fixture(scope="module")
+def neurone():
+    image, verite = generer_neurone((900, 700), 10, graine=3)
+    return image, verite
+
+@pytest.mark.parametrize("shape, tuile, recouvrement", [((700, 900), 256, 32), ((100, 100), 1024, 64),
+                                                         ((513, 257), 128, 200)])
+def test_decouper(shape, tuile, recouvrement):
+    h, w = shape
+    couverture = np.zeros(shape, dtype=np.int32)
+    for (x0, y0, x1, y1), (X0, Y0, X1, Y1) in tiles.decouper(shape, tuile, recouvrement):
+        couverture[y0:y1, x0:x1] += 1
+        assert (X0, Y0, X1, Y1) == (max(0, x0 - recouvrement), max(0, y0 - recouvrement),
+                                    min(w, x1 + recouvrement), min(h, y1 + recouvrement))
+    assert np.all(couverture == 1)
+
+@pytest.mark.parametrize("tuile, processes", [(256, 1), (200, 2), (2048, 1)])
+def test_amincissement(neurone, tuile, processes):
+    image, verite = neurone
+    binaire = pipeline.binariser(pipeline.flouter(image), verite.seuil)
+    squelette = cv2.ximgproc.thinning(binaire)
+    boite, binaire_tuiles, squelette_tuiles = tiles.amincir_tuiles(image, verite.seuil, tuile, 64,
+                                                                   processes=processes, rayon=verite.rayon_ouverture)
+    assert boite == pipeline.recadrer_image(binaire, verite.rayon_ouverture)
+    x0, y0, x1, y1 = boite
+    assert np.array_equal(binaire_tuiles, binaire[y0:y1, x0:x1])
+    assert np.array_equal(squelette_tuiles, squelette[y0:y1, x0:x1])
+    assert not binaire[:y0].any() and not binaire[y1:].any()
+    assert not binaire[:, :x0].any() and not binaire[:, x1:].any()
+
+def test_image_noire():
+    assert tiles.amincir_tuiles(np.zeros((300, 400), np.uint8), 10, 128, processes=1) == (None, None, None)
+
+@pytest.mark.parametrize("extension", [".png", ".tif"])
+def test_chaine(neurone, tmp_path, extension):
+    image, verite = neurone
+    chemin = str(tmp_path / ("neurone" + extension))
+    # Une page TIFF non compressée est lue par régions dans chaque processus
+    Image.fromarray(image).save(chemin)
+    options = dict(kernel_size=11, rayon=verite.rayon_ouverture)
+    reference = pipeline.traiter_image(chemin, verite.seuil, taille=None, **options)
+    skeleton = tiles.traiter_image_tuiles(chemin, verite.seuil, tuile=256, recouvrement=64, processes=2, **options)
+
+    assert tuple(skeleton.soma) == tuple(reference.soma)
+    assert [b.points for b in skeleton.branches] == [b.points for b in reference.branches]
+    assert [b.thickness for b in skeleton.branches] == [b.thickness for b in reference.branches]
+    with open(skeleton.save_as_csv("tuiles", str(tmp_path))) as f, \
+            open(reference.save_as_csv("entiere", str(tmp_path))) as g:
+        assert f.read() == g.read()
@@ -0,0 +1,207 @@
+"""
+    Lecture paresseuse des piles TIFF multi-pages.
+    Seuls les en-têtes (IFD) sont lus à l'ouverture : chaque page est un objet PageTiff qui
+    se découpe comme un tableau (page[y0:y1, x0:x1]) et ne lit dans le fichier que les bandes
+    ou les tuiles TIFF qui recouvrent la région demandée, à travers une projection mémoire
+    (np.memmap) du fichier. La mémoire utilisée est celle des régions lues, pas celle du fichier.
+    Les pages compressées (ou dans un format non géré) sont lues entièrement par OpenCV, une
+    page à la fois.
+
+    Exemple :
+        for page in pages_tiff("acquisitions/pile.tif"):
+            region = page[0:1024, 0:1024]
+"""
+import numpy as np
+import cv2
+
+EXTENSIONS = (".tif", ".tiff")
+
+# Types des champs TIFF entiers : code numpy et taille en octets
+_TYPES = {1: 'u1', 3: 'u2', 4: 'u4', 6: 'i1', 8: 'i2', 9: 'i4', 13: 'u4', 16: 'u8', 17: 'i8', 18: 'u8'}
+_TAILLES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4, 16: 8, 17: 8, 18: 8}
+
+# Tags utilisés
+IMAGE_WIDTH, IMAGE_LENGTH, BITS_PER_SAMPLE, COMPRESSION, PHOTOMETRIC = 256, 257, 258, 259, 262
+STRIP_OFFSETS, SAMPLES_PER_PIXEL, ROWS_PER_STRIP, STRIP_BYTE_COUNTS, PLANAR_CONFIG = 273, 277, 278, 279, 284
+TILE_WIDTH, TILE_LENGTH, TILE_OFFSETS, SAMPLE_FORMAT = 322, 323, 324, 339
+
+def est_tiff(chemin):
+    """
+        True si le fichier a l'extension d'un fichier TIFF
+    """
+    return chemin.lower().endswith(EXTENSIONS)
+
+def lire_ifds(chemin):
+    """
+        Parcourt la chaine des IFD du fichier (TIFF classique ou BigTIFF), un par page.
+        Retourne l'ordre des octets ('<' ou '>') et la liste des dictionnaires
+        {tag: np.array des valeurs} des champs entiers de chaque page
+    """
+    raw = np.memmap(chemin, dtype=np.uint8, mode='r')
+
+    def lire(position, code, n=1):
+        return raw[position:position + n * np.dtype(code).itemsize].view(ordre + code)
+
+    entete = raw[:2].tobytes()
+    if entete not in (b'II', b'MM'):
+        raise ValueError("Fichier TIFF invalide : " + chemin)
+    ordre = '<' if entete == b'II' else '>'
+    version = int(lire(2, 'u2')[0])
+    if version == 42:
+        taille, code, suivant = 4, 'u4', int(lire(4, 'u4')[0])
+    elif version == 43:
+        taille, code, suivant = 8, 'u8', int(lire(8, 'u8')[0])
+    else:
+        raise ValueError("Version de TIFF inconnue : " + str(version))
+
+    ifds, vus = [], set()
+    while suivant and suivant not in vus and suivant < len(raw):
+        vus.add(suivant)
+        n = int(lire(suivant, 'u2' if taille == 4 else 'u8')[0])
+        debut = suivant + (2 if taille == 4 else 8)
+        tags = {}
+        for k in range(n):
+            e = debut + k * (4 + 2 * taille)
+            tag, typ = (int(v) for v in lire(e, 'u2', 2))
+            if typ not in _TYPES:
+                continue
+            count = int(lire(e + 4, code)[0])
+            position = e + 4 + taille
+            if _TAILLES[typ] * count > taille:
+                position = int(lire(position, code)[0])
+            tags[tag] = lire(position, _TYPES[typ], count).astype(np.int64)
+        ifds.append(tags)
+        suivant = int(lire(debut + n * (4 + 2 * taille), code)[0])
+    return ordre, ifds
+
+class PageTiff:
+    """
+        Une page d'un fichier TIFF, lue à la demande en niveaux de gris 8 bits
+        (comme cv2.imread(chemin, 0)).
+        shape: (h, w) de la page
+        projetable: True si la page est lue par projection mémoire (non compressée,
+            8 ou 16 bits entiers, échantillons entrelacés), False si elle est lue par OpenCV
+    """
+
+    def __init__(self, chemin, index, ordre, tags):
+        """
+            Constructeur de la classe PageTiff, à partir des champs de son IFD (voir lire_ifds())
+        """
+        def valeur(tag, defaut):
+            return int(tags[tag][0]) if tag in tags else defaut
+
+        self.chemin = chemin
+        self.index = index
+        h, w = valeur(IMAGE_LENGTH, 0), valeur(IMAGE_WIDTH, 0)
+        self.shape = (h, w)
+        self.samples = valeur(SAMPLES_PER_PIXEL, 1)
+        self.photometric = valeur(PHOTOMETRIC, 1)
+        bits = valeur(BITS_PER_SAMPLE, 1)
+        self.dtype = np.dtype(ordre + ('u1' if bits == 8 else 'u2'))
+
+        # Découpage de la page en blocs (bandes de lignes ou tuiles) de taille (bh, bw)
+        self.tuilee = TILE_OFFSETS in tags
+        if self.tuilee:
+            self.bloc = (valeur(TILE_LENGTH, h), valeur(TILE_WIDTH, w))
+            self.offsets = tags[TILE_OFFSETS]
+        else:
+            self.bloc = (min(h, valeur(ROWS_PER_STRIP, h)), w)
+            self.offsets = tags.get(STRIP_OFFSETS, np.zeros(0, dtype=np.int64))
+        self.colonnes = -(-w // self.bloc[1]) if w else 0
+
+        self.projetable = (
+            valeur(COMPRESSION, 1) == 1 and bits in (8, 16) and valeur(SAMPLE_FORMAT, 1) == 1
+            and (self.samples == 1 or valeur(PLANAR_CONFIG, 1) == 1)
+            and self.photometric in (0, 1, 2) and len(self.offsets) > 0
+        )
+        self._raw = None
+        self._page = None
+
+    def __getstate__(self):
+        """
+            La projection mémoire et la page en cache ne sont pas copiées vers les autres
+            processus, elles sont rouvertes à la demande
+        """
+        etat = self.__dict__.copy()
+        etat["_raw"] = None
+        etat["_page"] = None
+        return etat
+
+    def __getitem__(self, cle):
+        """
+            Région page[y0:y1, x0:x1] en niveaux de gris 8 bits, lue dans les seuls blocs
+            du fichier qui la recouvrent
+        """
+        if not isinstance(cle, tuple):
+            cle = (cle, slice(None))
+        lignes, colonnes = cle
+        if not self.projetable:
+            return self.lire()[lignes, colonnes]
+        h, w = self.shape
+        ry, rx = range(*lignes.indices(h)), range(*colonnes.indices(w))
+        if not ry or not rx:
+            return np.zeros((len(ry), len(rx)), dtype=np.uint8)
+
+        # Rectangle des lignes et colonnes demandées (le pas peut être négatif)
+        y0, y1 = min(ry), max(ry) + 1
+        x0, x1 = min(rx), max(rx) + 1
+
+        if self._raw is None:
+            self._raw = np.memmap(self.chemin, dtype=np.uint8, mode='r')
+        bh, bw = self.bloc
+        region = np.empty((y1 - y0, x1 - x0, self.samples), dtype=self.dtype)
+        for by in range(y0 // bh, (y1 - 1) // bh + 1):
+            for bx in range(x0 // bw, (x1 - 1) // bw + 1):
+                # Les tuiles sont toutes complètes, la dernière bande peut être plus courte
+                n = bh if self.tuilee else min(bh, h - by * bh)
+                debut = int(self.offsets[by * self.colonnes + bx])
+                taille = n * bw * self.samples * self.dtype.itemsize
+                bloc = self._raw[debut:debut + taille].view(self.dtype).reshape(n, bw, self.samples)
+                ya, yb = max(y0, by * bh), min(y1, by * bh + n)
+                xa, xb = max(x0, bx * bw), min(x1, bx * bw + bw)
+                region[ya - y0:yb - y0, xa - x0:xb - x0] = bloc[ya - by * bh:yb - by * bh, xa - bx * bw:xb - bx * bw]
+        return self._en_gris(region)[ry.start - y0::ry.step, rx.start - x0::rx.step]
+
+    def _en_gris(self, region):
+        """
+            Conversion d'une région (h, w, samples) en niveaux de gris 8 bits
+        """
+        if self.dtype.itemsize == 2:
+            region = (region >> 8).astype(np.uint8)
+        if self.samples >= 3 and self.photometric == 2:
+            gris = cv2.cvtColor(np.ascontiguousarray(region[..., :3]), cv2.COLOR_RGB2GRAY)
+        else:
+            gris = np.ascontiguousarray(region[..., 0])
+        if self.photometric == 0:
+            gris = 255 - gris
+        return gris
+
+    def lire(self):
+        """
+            Retourne la page entière en niveaux de gris 8 bits. Les pages qui ne sont pas
+            projetables sont décodées par OpenCV (cette page seulement) et gardées en cache
+        """
+        if self.projetable:
+            return self[:, :]
+        if self._page is None:
+            ok, pages = cv2.imreadmulti(self.chemin, start=self.index, count=1, flags=cv2.IMREAD_GRAYSCALE)
+            if not ok or not pages:
+                raise ValueError("Impossible de lire la page " + str(self.index) + " de " + self.chemin)
+            self._page = pages[0]
+        return self._page
+
+def pages_tiff(chemin):
+    """
+        Retourne la liste des pages (PageTiff) du fichier, sans lire les images
+    """
+    ordre, ifds = lire_ifds(chemin)
+    return [PageTiff(chemin, k, ordre, tags) for k, tags in enumerate(ifds)]
+
+def ouvrir_page(chemin, index=0):
+    """
+        Retourne la page "index" du fichier (PageTiff), sans la lire
+    """
+    pages = pages_tiff(chemin)
+    if not 0 <= index < len(pages):
+        raise ValueError("Le fichier " + chemin + " n'a pas de page " + str(index))
+    return pages[index]
@@ -0,0 +1,144 @@
+"""
+    Traitement par tuiles des grandes images (lames entières) à leur résolution d'origine,
+    sans le redimensionnement en 500x500 de pipeline.pretraitement().
+    L'image est découpée en tuiles qui se recouvrent : chaque tuile est floutée, seuillée et
+    amincie dans un processus du pool, qui ne renvoie que ce qu'il trouve dans le coeur de la
+    tuile (sans le recouvrement) : la boite des pixels blancs, l'image binaire de cette boite
+    compressée sur un bit par pixel et les coordonnées des points du squelette ; une tuile
+    noire ne renvoie rien. Les résultats sont recollés dans la seule boite englobante
+    des pixels blancs de l'image (celle de pipeline.recadrer_image()), l'image entière n'est
+    jamais allouée dans le processus principal. La suite de la chaine (noyau, ramifications,
+    branches, mesures, graphe) est faite une seule fois sur cette boite : le graphe est le
+    même qu'en un seul morceau et save_as_csv() produit le même fichier.
+
+    Exemple :
+        skeleton = traiter_image_tuiles("lames/neurone.tif", 20, rayon=150)
+"""
+import numpy as np
+import cv2
+from multiprocessing import Pool
+
+import instrumentation
+import pipeline
+import tiff
+from crop import elargir
+from soma import NoyauNonDetecte, facteur_reduction
+
+# Image en cours de traitement dans les processus du pool (voir _initialiser())
+_image = None
+
+def decouper(shape, tuile=1024, recouvrement=64):
+    """
+        Découpe une image de dimensions shape = (h, w) en tuiles de côté "tuile".
+        Retourne la liste des paires (coeur, etendue) de boites (x0, y0, x1, y1) : les coeurs
+        pavent l'image, chaque etendue est son coeur élargi de "recouvrement" pixels de chaque
+        côté (dans la limite de l'image)
+    """
+    h, w = shape
+    tuiles = []
+    for y0 in range(0, h, tuile):
+        for x0 in range(0, w, tuile):
+            x1, y1 = min(w, x0 + tuile), min(h, y0 + tuile)
+            etendue = (max(0, x0 - recouvrement), max(0, y0 - recouvrement),
+                       min(w, x1 + recouvrement), min(h, y1 + recouvrement))
+            tuiles.append(((x0, y0, x1, y1), etendue))
+    return tuiles
+
+def _initialiser(image):
+    """
+        Donne l'image à traiter à un processus du pool (partagée sans copie quand les
+        processus sont créés par fork)
+    """
+    global _image
+    _image = image
+
+def traiter_tuile(tache):
+    """
+        Flou, seuillage et amincissement d'une tuile étendue, retourne pour son coeur :
+        le rectangle (x, y, largeur, hauteur) de ses pixels blancs dans l'image entière,
+        l'image binaire de ce rectangle compressée (np.packbits par ligne) et les coordonnées
+        x, y (dans l'image entière) des points du squelette. Rectangle et image sont None si
+        le coeur est noir
+    """
+    (x0, y0, x1, y1), (X0, Y0, X1, Y1), threshold, kernel_size = tache
+    binaire = pipeline.binariser(pipeline.flouter(np.ascontiguousarray(_image[Y0:Y1, X0:X1]), kernel_size), threshold)
+    coeur = binaire[y0 - Y0:y1 - Y0, x0 - X0:x1 - X0]
+    points = cv2.findNonZero(coeur)
+    if points is None:
+        return None, None, np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    x, y, bw, bh = cv2.boundingRect(points)
+
+    squelette = cv2.ximgproc.thinning(binaire)
+    ys, xs = np.nonzero(squelette[y0 - Y0 + y:y0 - Y0 + y + bh, x0 - X0 + x:x0 - X0 + x + bw])
+    bits = np.packbits(coeur[y:y + bh, x:x + bw] > 0, axis=1)
+    return (x + x0, y + y0, bw, bh), bits, xs + x + x0, ys + y + y0
+
+def amincir_tuiles(image, threshold, tuile=1024, recouvrement=64, kernel_size=11, processes=None, rayon=18):
+    """
+        Flou, seuillage et amincissement de l'image par tuiles, en parallèle sur "processes"
+        processus (dans le processus courant si processes=1).
+        Le recouvrement doit dépasser la moitié de kernel_size pour que le flou et le seuillage
+        soient exacts, et la demi-épaisseur des prolongements pour que l'amincissement le soit.
+        Retourne la boite (x0, y0, x1, y1) des pixels blancs de l'image, avec la marge et
+        l'alignement de pipeline.recadrer_image() pour le rayon du noyau "rayon", et l'image
+        binaire et l'image du squelette recollées dans cette boite. (None, None, None) si
+        l'image seuillée est noire
+    """
+    h, w = image.shape
+    taches = [(coeur, etendue, threshold, kernel_size) for coeur, etendue in decouper((h, w), tuile, recouvrement)]
+    instrumentation.compter("tiles", len(taches))
+
+    if processes == 1:
+        _initialiser(image)
+        try:
+            resultats = [r for r in map(traiter_tuile, taches) if r[0] is not None]
+        finally:
+            _initialiser(None)
+    else:
+        with Pool(processes, initializer=_initialiser, initargs=(image,)) as pool:
+            resultats = [r for r in pool.imap_unordered(traiter_tuile, taches) if r[0] is not None]
+    if not resultats:
+        return None, None, None
+
+    # Boite englobante des rectangles des tuiles
+    rectangles = np.array([r[0] for r in resultats])
+    x, y = rectangles[:, :2].min(axis=0)
+    x1, y1 = (rectangles[:, :2] + rectangles[:, 2:]).max(axis=0)
+    facteur = facteur_reduction(rayon)
+    boite = elargir((int(x), int(y), int(x1 - x), int(y1 - y)), (h, w), facteur, facteur)
+    bx, by, bx1, by1 = boite
+    instrumentation.compter("crop_pixels", (bx1 - bx) * (by1 - by))
+
+    binaire = np.zeros((by1 - by, bx1 - bx), dtype=np.uint8)
+    squelette = np.zeros_like(binaire)
+    for (x, y, bw, bh), bits, xs, ys in resultats:
+        binaire[y - by:y - by + bh, x - bx:x - bx + bw] = np.unpackbits(bits, axis=1, count=bw) * 255
+        squelette[ys - by, xs - bx] = 255
+    return boite, binaire, squelette
+
+def traiter_image_tuiles(chemin, threshold, tuile=1024, recouvrement=64, kernel_size=11, rayon=18,
+                         processes=None, graphe=True, segmentation="walk", thickness="rays", page=0, pas=10,
+                         dist_max=3):
+    """
+        Enchaine toutes les étapes sur le fichier image donné (sa page "page" pour un
+        fichier multi-pages), à sa résolution d'origine, et retourne le squelette.
+        rayon: rayon du noyau en pixels de l'image d'origine (18 pixels correspondent aux
+        images redimensionnées en 500x500, voir scale.Echelle pour les tailles à une autre
+        résolution).
+        Une page TIFF non compressée n'est pas chargée : chaque processus lit dans le fichier
+        les seules régions de ses tuiles (voir tiff.PageTiff)
+    """
+    image = tiff.ouvrir_page(chemin, page) if tiff.est_tiff(chemin) else pipeline.charger_image(chemin)
+    with instrumentation.etape("tiles"):
+        boite, binaire, squelette = amincir_tuiles(image, threshold, tuile, recouvrement, kernel_size, processes,
+                                                   rayon)
+    del image
+    if boite is None:
+        raise NoyauNonDetecte("Aucun noyau détecté")
+
+    # Le reste de la chaine travaille dans la boite, le squelette est ensuite ramené dans l'image
+    skeleton, point_adja = pipeline.squelettiser(binaire, segmentation, squelette, rayon, pas, dist_max,
+                                                 recadrer=False)
+    pipeline.mesurer(skeleton, binaire, point_adja, graphe, thickness=thickness)
+    skeleton.deplacer(boite[:2])
+    return skeleton